@@ -3,3 +3,4 @@
 from . import models
 from . import controllers
 from . import services
+from . import cli
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 {
     'name': 'ETS Relatic Integration',
-    'version': '18.0.1.0.0',
+    'version': '18.0.1.2.0',
     'category': 'Accounting',
     'summary': 'ETS - Integración con sistema de membresía Relatic',
     'description': """
@@ -26,7 +26,14 @@
     'data': [
         'security/ir.model.access.csv',
         'views/relatic_sync_log_views.xml',
+        'views/relatic_settlement_import_views.xml',
+        'views/relatic_payment_aggregate_views.xml',
+        'views/relatic_sync_stats_daily_views.xml',
+        'views/relatic_sync_error_cluster_views.xml',
+        'views/relatic_callback_outbox_views.xml',
+        'views/relatic_member_summary_views.xml',
         'data/ir_config_parameter_data.xml',
+        'data/ir_cron_data.xml',
     ],
     'installable': True,
     'application': False,
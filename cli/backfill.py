@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Carga histórica de órdenes de membresia-relatic desde un export JSONL
+
+    odoo-bin --addons-path=... relatic_backfill -c /etc/odoo/odoo.conf -d relatic \\
+        --backfill-file ordenes.jsonl --backfill-workers 4 --backfill-chunk-size 200
+
+Cada línea es un payload del contrato v1.0 (mismo formato que el webhook).
+"""
+
+import json
+import logging
+import multiprocessing
+import optparse
+import os
+import sys
+import time
+
+from odoo import api, fields, SUPERUSER_ID
+from odoo.cli import Command
+from odoo.exceptions import ValidationError
+from odoo.modules.registry import Registry
+from odoo.tools import config
+
+from ..core.backfill import load_checkpoint, read_partition, save_checkpoint, worker_paths
+
+_logger = logging.getLogger(__name__)
+
+
+class BackfillWorker:
+    """Procesa la partición de un worker con un commit por bloque"""
+
+    def __init__(self, dbname, path, index, workers, chunk_size, checkpoint_dir):
+        self.dbname = dbname
+        self.path = path
+        self.index = index
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.checkpoint_path, self.errors_path = worker_paths(checkpoint_dir, path, index, workers)
+        self.state = {'line': 0, 'created': 0, 'existing': 0, 'errors': 0, 'elapsed': 0.0}
+
+    def run(self):
+        load_checkpoint(self.checkpoint_path, self.state)
+        registry = Registry(self.dbname)
+
+        start = time.perf_counter() - self.state['elapsed']
+        chunk = []
+        last_line = self.state['line']
+        with open(self.path, encoding='utf-8') as source:
+            for line_no, payload, error in read_partition(source, self.index, self.workers, self.state['line']):
+                chunk.append((line_no, payload, error))
+                last_line = line_no
+                if len(chunk) >= self.chunk_size:
+                    self._process_chunk(registry, chunk, last_line, start)
+                    chunk = []
+        # Último bloque; el checkpoint avanza hasta la última línea leída
+        self._process_chunk(registry, chunk, last_line, start)
+        return self.state
+
+    def _process_chunk(self, registry, chunk, last_line, start):
+        """
+        Procesar un bloque en una transacción (savepoint por orden)
+
+        El commit ocurre antes de avanzar el checkpoint: si el proceso se
+        corta entre ambos, el bloque se reprocesa y las órdenes ya creadas
+        se detectan por idempotencia (x_relatic_order_id).
+        """
+        errors = []
+        with registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            sale_service = env['relatic.sale.service']
+            sync_log = env['relatic.sync.log']
+            for line_no, payload, error in chunk:
+                order_id = payload.get('order_id') if payload else None
+                if error:
+                    errors.append({'line': line_no, 'order_id': order_id, **error})
+                    continue
+                try:
+                    with cr.savepoint():
+                        result = sale_service.process_order(payload)
+                        if result['already_exists']:
+                            self.state['existing'] += 1
+                            continue
+                        sync_log.create_log(
+                            order_id=order_id,
+                            payload=payload,
+                            status='success',
+                            source='backfill',
+                            partner_id=result['partner'].id,
+                            invoice_id=result['invoice'].id,
+                            payment_move_id=result['payment_move'].id,
+                            processed_at=fields.Datetime.now(),
+                        )
+                        self.state['created'] += 1
+                except ValidationError as e:
+                    # Incluye AMOUNT_MISMATCH del motor de totales (antes de escribir)
+                    errors.append({'line': line_no, 'order_id': order_id, 'code': 'VALIDATION_ERROR', 'message': str(e)})
+                except Exception as e:
+                    errors.append({'line': line_no, 'order_id': order_id, 'code': 'ODOO_ERROR', 'message': str(e)})
+
+        if errors:
+            with open(self.errors_path, 'a', encoding='utf-8') as errors_file:
+                for error in errors:
+                    errors_file.write(json.dumps(error, ensure_ascii=False) + '\n')
+        self.state['errors'] += len(errors)
+        self.state['line'] = last_line
+        self.state['elapsed'] = time.perf_counter() - start
+        save_checkpoint(self.checkpoint_path, self.state)
+
+        done = self.state['created'] + self.state['existing'] + self.state['errors']
+        _logger.info(
+            "Backfill worker %s/%s: línea %s, %s creadas, %s existentes, %s errores (%.1f filas/s)",
+            self.index + 1, self.workers, last_line, self.state['created'], self.state['existing'],
+            self.state['errors'], done / self.state['elapsed'] if self.state['elapsed'] else 0.0,
+        )
+
+
+def _run_worker(dbname, path, index, workers, chunk_size, checkpoint_dir):
+    BackfillWorker(dbname, path, index, workers, chunk_size, checkpoint_dir).run()
+
+
+class RelaticBackfill(Command):
+    """Cargar órdenes históricas de membresia-relatic desde un archivo JSONL"""
+
+    name = 'relatic_backfill'
+
+    def run(self, cmdargs):
+        parser = config.parser
+        parser.prog = f'{os.path.basename(sys.argv[0])} {self.name}'
+        group = optparse.OptionGroup(parser, "Relatic Backfill")
+        group.add_option('--backfill-file', dest='backfill_file', help='Archivo JSONL con un payload por línea')
+        group.add_option('--backfill-workers', dest='backfill_workers', type='int', default=4,
+                         help='Procesos en paralelo (particionados por hash del email)')
+        group.add_option('--backfill-chunk-size', dest='backfill_chunk_size', type='int', default=200,
+                         help='Órdenes por transacción')
+        group.add_option('--backfill-checkpoint-dir', dest='backfill_checkpoint_dir',
+                         help='Directorio de checkpoints y errores (default: junto al archivo)')
+        parser.add_option_group(group)
+        options = config.parse_config(cmdargs, setup_logging=True)
+
+        if not options.backfill_file or not os.path.isfile(options.backfill_file):
+            parser.error('--backfill-file es requerido y debe existir')
+        dbname = (config['db_name'] or '').split(',')[0]
+        if not dbname:
+            parser.error('Base de datos requerida (-d)')
+
+        path = os.path.abspath(options.backfill_file)
+        workers = max(1, options.backfill_workers)
+        checkpoint_dir = options.backfill_checkpoint_dir or os.path.dirname(path)
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+        # fork: cada hijo abre su propio registro y conexiones después del fork
+        context = multiprocessing.get_context('fork')
+        start = time.perf_counter()
+        processes = [
+            context.Process(
+                target=_run_worker,
+                args=(dbname, path, index, workers, options.backfill_chunk_size, checkpoint_dir),
+            )
+            for index in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        self._report(path, workers, checkpoint_dir, time.perf_counter() - start)
+        sys.exit(1 if any(process.exitcode for process in processes) else 0)
+
+    def _report(self, path, workers, checkpoint_dir, elapsed):
+        """Resumen agregado a partir de los checkpoints de cada worker"""
+        totals = {'created': 0, 'existing': 0, 'errors': 0}
+        worker_elapsed = 0.0
+        for index in range(workers):
+            state = load_checkpoint(worker_paths(checkpoint_dir, path, index, workers)[0], {})
+            if state:
+                for key in totals:
+                    totals[key] += state.get(key, 0)
+                worker_elapsed = max(worker_elapsed, state.get('elapsed', 0.0))
+        rows = sum(totals.values())
+        totals['elapsed_s'] = round(elapsed, 1)
+        # Tiempo acumulado del worker más lento: válido también tras reanudar
+        totals['rows_per_second'] = round(rows / worker_elapsed, 1) if worker_elapsed else None
+        print(json.dumps(totals, indent=2))
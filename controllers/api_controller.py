@@ -1,13 +1,32 @@
 # -*- coding: utf-8 -*-
 
 import json
-import hmac
-import hashlib
+import logging
+import random
+import tempfile
 import time
-from datetime import datetime
-from odoo import http
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from psycopg2 import errors as pg_errors
+from odoo import api, http, SUPERUSER_ID
 from odoo.http import request
 from odoo.exceptions import ValidationError
+from odoo.modules.registry import Registry
+
+from ..core.normalization import normalize_email, validate_email
+from ..core.signing import compare_signature, signer, verify_signature
+from ..core.validation import validate_refund_payload, validate_sale_payload
+
+_logger = logging.getLogger(__name__)
+
+# Exportación NDJSON: filas por página (keyset) y por fetch del cursor de servidor
+EXPORT_PAGE_SIZE = 5000
+EXPORT_FETCH_SIZE = 500
+
+# Ingesta NDJSON: bloque de lectura del body y tamaño máximo en memoria del spool
+INGEST_READ_SIZE = 64 * 1024
+INGEST_SPOOL_MEMORY = 1024 * 1024
 
 
 class RelaticAPIController(http.Controller):
@@ -18,11 +37,39 @@ class RelaticAPIController(http.Controller):
         """
         Endpoint para recibir webhooks de ventas desde membresia-relatic
         
+        Una fracción de los requests (profile_sample_rate) se perfila; si
+        supera profile_threshold_ms el perfil se adjunta al log de la orden
+        después del commit, en un cursor propio.
+        
+        Returns:
+            dict: Respuesta JSON con status y data o error
+        """
+        profiler = request.env['relatic.profiler.service'].sudo()
+        if not profiler._should_sample():
+            return self._process_sale_webhook()
+        
+        with profiler._capture() as capture:
+            response = self._process_sale_webhook()
+        try:
+            order_id = json.loads(request.httprequest.data).get('order_id')
+        except (ValueError, AttributeError):
+            order_id = None
+        profiler._schedule_save(capture, order_id)
+        return response
+
+    def _process_sale_webhook(self):
+        """
+        Procesar el webhook de ventas: validación, log, pipeline y respuesta
+        
         Returns:
             dict: Respuesta JSON con status y data o error
         """
         start_time = time.time()
         log_record = None
+        log_payload = None
+        tx_attempts = 1
+        inflight_token = None
+        delivery_attempt = self._get_delivery_attempt()
         
         try:
             # 1. Obtener payload raw para validación HMAC
@@ -59,115 +106,123 @@ class RelaticAPIController(http.Controller):
             # 5. Extraer datos del payload
             order_id = payload.get('order_id')
             meta = payload.get('meta', {})
+            sale_service = request.env['relatic.sale.service'].sudo()
+            preflight_error = sale_service._preflight_check(payload)
             
-            # 6. Crear log inicial
-            log_record = request.env['relatic.sync.log'].sudo().create_log(
-                order_id=order_id,
-                payload=payload,
-                status='pending',
-                payload_version=meta.get('version'),
-                source=meta.get('source', 'membresia-relatic'),
-                environment=meta.get('environment'),
-            )
-            
-            # 7. Verificar idempotencia (factura ya existe)
-            existing_invoice = request.env['account.move'].sudo().search_by_relatic_order_id(order_id)
-            if existing_invoice:
-                log_record.mark_success(
-                    partner_id=existing_invoice.partner_id.id,
-                    invoice_id=existing_invoice.id,
-                    processing_time=time.time() - start_time
-                )
+            # 6. Modo dry-run (header X-Relatic-Dry-Run o parámetro dry_run):
+            # vista previa calculada y revertida, sin log ni asientos; incluye
+            # el resultado del pre-flight en vez de rechazar la orden
+            if self._is_dry_run():
+                preview = sale_service.preview_order(payload)
                 return self._success_response(
-                    data={
-                        'order_id': order_id,
-                        'partner_id': existing_invoice.partner_id.id,
-                        'invoice_id': existing_invoice.id,
-                        'invoice_number': existing_invoice.name,
-                        'already_exists': True,
-                        'sync_log_id': log_record.id,
-                    },
-                    message='Factura ya existe, retornando existente',
-                    warning='INVOICE_EXISTS'
+                    data=dict(preview, dry_run=True, preflight=preflight_error),
+                    message='Dry-run: vista previa calculada, no se registraron cambios',
+                    warning='INVOICE_EXISTS' if preview['already_exists'] else None
                 )
             
-            # 8. Procesar con lock transaccional (idempotencia)
-            with request.env.cr.savepoint():
-                # Lock transaccional para evitar duplicados simultáneos
-                request.env.cr.execute(
-                    "SELECT id FROM account_move WHERE x_relatic_order_id=%s FOR UPDATE",
-                    (order_id,)
-                )
-                
-                # Verificar nuevamente después del lock
-                existing_invoice = request.env['account.move'].sudo().search_by_relatic_order_id(order_id)
-                if existing_invoice:
-                    log_record.mark_success(
-                        partner_id=existing_invoice.partner_id.id,
-                        invoice_id=existing_invoice.id,
-                        processing_time=time.time() - start_time
-                    )
-                    return self._success_response(
-                        data={
-                            'order_id': order_id,
-                            'partner_id': existing_invoice.partner_id.id,
-                            'invoice_id': existing_invoice.id,
-                            'invoice_number': existing_invoice.name,
-                            'already_exists': True,
-                            'sync_log_id': log_record.id,
-                        },
-                        message='Factura ya existe, retornando existente',
-                        warning='INVOICE_EXISTS'
-                    )
-                
-                # 9. Importar servicios (se crearán en Fase 4)
-                # Por ahora, crear estructura básica
-                partner_service = request.env['relatic.partner.service'].sudo()
-                invoice_service = request.env['relatic.invoice.service'].sudo()
-                payment_service = request.env['relatic.payment.service'].sudo()
-                
-                # 10. Crear/actualizar contacto
-                member_data = payload.get('member', {})
-                partner = partner_service.create_or_update_partner(member_data)
-                
-                # 11. Crear factura
-                items = payload.get('items', [])
-                payment_data = payload.get('payment', {})
-                invoice = invoice_service.create_invoice(
-                    partner=partner,
-                    order_id=order_id,
-                    items=items,
-                    payment_data=payment_data
-                )
-                
-                # 12. Registrar pago
-                payment_move = payment_service.register_payment(
-                    invoice=invoice,
-                    partner=partner,
-                    payment_data=payment_data
+            # Totales con impuestos (motor pre-flight, antes de cualquier escritura)
+            if preflight_error:
+                return self._error_response(
+                    preflight_error['code'],
+                    preflight_error['message'],
+                    400
                 )
-                
-                # 13. Marcar log como exitoso
-                processing_time = time.time() - start_time
-                log_record.mark_success(
-                    partner_id=partner.id,
-                    invoice_id=invoice.id,
-                    payment_move_id=payment_move.id,
-                    processing_time=processing_time
+            
+            # 7. Single-flight: un solo request procesa cada orden a la vez;
+            # las entregas concurrentes esperan su resultado
+            inflight_token, waited = request.env['relatic.inflight.order'].sudo()._acquire(order_id)
+            if not inflight_token:
+                return self._error_response(
+                    'ORDER_IN_FLIGHT',
+                    'La orden se está procesando en otra solicitud',
+                    409,
+                    retry=True
                 )
-                
-                # 14. Retornar respuesta exitosa
+            if waited:
+                # Snapshot nuevo: ver la factura que confirmó el otro request
+                request.env.cr.rollback()
+            
+            sync_log = request.env['relatic.sync.log'].sudo()
+            # El pre-flight ya corrió en el paso 5: process_order no lo repite
+            sale_service = sale_service.with_context(relatic_preflight_done=True)
+            log_payload = payload
+            max_tx_retries, tx_backoff_ms = self._get_tx_retry_settings()
+            while True:
+                try:
+                    # 8. Crear log inicial (en modo single_write el log se inserta
+                    # una sola vez al final, ya con el resultado)
+                    if not sync_log._is_single_write():
+                        log_record = sync_log.create_log(
+                            order_id=order_id,
+                            payload=payload,
+                            status='pending',
+                            payload_version=meta.get('version'),
+                            source=meta.get('source', 'membresia-relatic'),
+                            environment=meta.get('environment'),
+                            tx_attempts=tx_attempts,
+                            attempt=delivery_attempt,
+                        )
+                    
+                    # 9. Procesar orden (idempotencia, contacto, factura y pago)
+                    result = sale_service.process_order(payload)
+                    break
+                except (pg_errors.DeadlockDetected, pg_errors.SerializationFailure) as e:
+                    # Conflicto transitorio: revertir la transacción completa
+                    # (el reintento necesita un snapshot nuevo) y repetir 8-9
+                    request.env.cr.rollback()
+                    log_record = None
+                    if tx_attempts > max_tx_retries:
+                        raise
+                    self._wait_tx_retry(order_id, tx_attempts, tx_backoff_ms, e)
+                    tx_attempts += 1
+            partner = result['partner']
+            invoice = result['invoice']
+            payment_move = result['payment_move']
+            
+            # 10. Marcar log como exitoso
+            processing_time = time.time() - start_time
+            log_record = self._log_success(
+                log_record,
+                payload,
+                partner_id=partner.id,
+                invoice_id=invoice.id,
+                payment_move_id=payment_move.id,
+                processing_time=processing_time,
+                tx_attempts=tx_attempts,
+                attempt=delivery_attempt,
+            )
+            
+            # 11. Retornar respuesta
+            if result['already_exists']:
                 return self._success_response(
                     data={
                         'order_id': order_id,
                         'partner_id': partner.id,
                         'invoice_id': invoice.id,
                         'invoice_number': invoice.name,
-                        'payment_move_id': payment_move.id,
+                        'already_exists': True,
                         'sync_log_id': log_record.id,
                     },
-                    message='Factura creada exitosamente'
+                    message='Factura ya existe, retornando existente',
+                    warning='INVOICE_EXISTS'
                 )
+            
+            # Modo agregado: sin asiento de pago; la factura queda sin pagar
+            # hasta el asiento de liquidación diario
+            pending_settlement = not payment_move
+            return self._success_response(
+                data={
+                    'order_id': order_id,
+                    'partner_id': partner.id,
+                    'invoice_id': invoice.id,
+                    'invoice_number': invoice.name,
+                    'payment_move_id': payment_move.id,
+                    'payment_pending_settlement': pending_settlement,
+                    'sync_log_id': log_record.id,
+                },
+                message='Factura creada; pago pendiente de la liquidación diaria' if pending_settlement
+                else 'Factura creada exitosamente'
+            )
                 
         except json.JSONDecodeError:
             return self._error_response(
@@ -177,8 +232,8 @@ class RelaticAPIController(http.Controller):
             )
         except ValidationError as e:
             error_msg = str(e)
-            if log_record:
-                log_record.mark_error('VALIDATION_ERROR', error_msg, retry=False)
+            self._log_error(log_record, log_payload, 'VALIDATION_ERROR', error_msg, retry=False,
+                            attempt=delivery_attempt)
             return self._error_response(
                 'VALIDATION_ERROR',
                 error_msg,
@@ -186,8 +241,8 @@ class RelaticAPIController(http.Controller):
             )
         except Exception as e:
             error_msg = f"Error interno: {str(e)}"
-            if log_record:
-                log_record.mark_error('ODOO_ERROR', error_msg, retry=True)
+            self._log_error(log_record, log_payload, 'ODOO_ERROR', error_msg, retry=True, tx_attempts=tx_attempts,
+                            attempt=delivery_attempt)
             # Log del error para debugging
             request.env['ir.logging'].sudo().create({
                 'type': 'server',
@@ -202,6 +257,678 @@ class RelaticAPIController(http.Controller):
                 'Error interno del servidor',
                 500
             )
+        finally:
+            if inflight_token:
+                self._schedule_inflight_release(order_id, inflight_token)
+
+    @http.route('/api/relatic/v1/refunds', type='json', auth='none', methods=['POST'], csrf=False, cors='*')
+    def relatic_refunds_webhook(self):
+        """
+        Endpoint para reembolsos masivos (notas de crédito) desde membresia-relatic
+        
+        Payload: {"meta": {...}, "order_ids": [...], "reason": "...", "reconcile": true}
+        
+        Returns:
+            dict: Respuesta JSON con un resultado por order_id
+        """
+        try:
+            # 1. Obtener payload raw para validación HMAC
+            raw_body = request.httprequest.data.decode('utf-8')
+            payload = json.loads(raw_body)
+            
+            # 2. Validar autenticación (API Key)
+            api_key = request.httprequest.headers.get('Authorization', '').replace('Bearer ', '')
+            if not self._validate_api_key(api_key):
+                return self._error_response(
+                    'INVALID_API_KEY',
+                    'API Key inválida o faltante',
+                    401
+                )
+            
+            # 3. Validar firma HMAC
+            signature = request.httprequest.headers.get('X-Relatic-Signature', '')
+            if not self._validate_hmac_signature(raw_body, signature):
+                return self._error_response(
+                    'INVALID_SIGNATURE',
+                    'La firma HMAC no coincide con el payload',
+                    401
+                )
+            
+            # 4. Validar estructura del payload
+            validation_error = self._validate_refund_payload(payload)
+            if validation_error:
+                return self._error_response(
+                    validation_error['code'],
+                    validation_error['message'],
+                    400
+                )
+            
+            order_ids = list(dict.fromkeys(payload['order_ids']))
+            reason = payload.get('reason', '')
+            reconcile = bool(payload.get('reconcile', False))
+            
+            # 5. Buscar facturas originales en una sola consulta
+            invoices = request.env['account.move'].sudo().search_by_relatic_order_ids(order_ids)
+            
+            results = []
+            invoices_by_order = {}
+            for order_id in order_ids:
+                invoice = invoices.get(order_id)
+                if not invoice:
+                    results.append({
+                        'order_id': order_id,
+                        'status': 'error',
+                        'error': {'code': 'INVOICE_NOT_FOUND', 'message': 'Factura no encontrada'},
+                    })
+                elif invoice.state != 'posted':
+                    results.append({
+                        'order_id': order_id,
+                        'status': 'error',
+                        'error': {'code': 'INVOICE_NOT_POSTED', 'message': f'La factura {invoice.name} no está confirmada'},
+                    })
+                else:
+                    invoices_by_order[order_id] = invoice
+            
+            # 6. Crear notas de crédito en lote (create_refunds ya resuelve la
+            # idempotencia por -REFUND)
+            if invoices_by_order:
+                payment_service = request.env['relatic.payment.service'].sudo()
+                try:
+                    with request.env.cr.savepoint():
+                        outcomes = payment_service._create_refunds(
+                            invoices_by_order,
+                            reason=reason,
+                            reconcile=reconcile
+                        )
+                except pg_errors.UniqueViolation:
+                    # Otro request creó la misma nota de crédito en paralelo: no es
+                    # visible en este snapshot, el reintento la retorna como existente
+                    return self._error_response(
+                        'REFUND_IN_FLIGHT',
+                        'Otra solicitud está creando los mismos reembolsos',
+                        409,
+                        retry=True
+                    )
+                for order_id, outcome in outcomes.items():
+                    refund = outcome['refund']
+                    results.append({
+                        'order_id': order_id,
+                        'status': 'success',
+                        'refund_order_id': refund.x_relatic_order_id,
+                        'refund_id': refund.id,
+                        'refund_number': refund.name,
+                        'already_exists': outcome['already_exists'],
+                        'reconciled': outcome['reconciled'],
+                    })
+            
+            return self._success_response(
+                data={
+                    'refunds': results,
+                    'created': sum(1 for r in results if r['status'] == 'success' and not r['already_exists']),
+                    'errors': sum(1 for r in results if r['status'] == 'error'),
+                },
+                message='Reembolsos procesados'
+            )
+        
+        except json.JSONDecodeError:
+            return self._error_response(
+                'INVALID_PAYLOAD',
+                'Payload JSON inválido',
+                400
+            )
+        except ValidationError as e:
+            return self._error_response(
+                'VALIDATION_ERROR',
+                str(e),
+                422
+            )
+        except Exception as e:
+            error_msg = f"Error interno: {str(e)}"
+            request.env['ir.logging'].sudo().create({
+                'type': 'server',
+                'name': 'relatic_integration',
+                'message': f"Error en reembolsos Relatic: {error_msg}",
+                'path': '/api/relatic/v1/refunds',
+                'func': 'relatic_refunds_webhook',
+                'line': '1',
+            })
+            return self._error_response(
+                'ODOO_ERROR',
+                'Error interno del servidor',
+                500,
+                retry=True
+            )
+
+    @http.route('/api/relatic/v1/ingest', type='http', auth='none', methods=['POST'], csrf=False)
+    def relatic_ingest_orders(self, **kwargs):
+        """
+        Ingesta masiva de ventas como NDJSON en streaming (correcciones de cierre de mes)
+        
+        Una línea por payload v1.0 (mismo contrato que /sale). El body se lee
+        por bloques sin pasar por request.httprequest.data y se guarda en un
+        archivo temporal mientras se calcula la firma HMAC; las órdenes se
+        procesan solo si la firma del body completo es válida.
+        
+        Headers:
+            Content-Type: application/x-ndjson
+            Content-Encoding: gzip (opcional; la firma se calcula sobre el NDJSON sin comprimir)
+            X-Relatic-Signature: HMAC-SHA256 del NDJSON completo
+        
+        Returns:
+            Response: application/x-ndjson en streaming, una línea de resultado
+            por línea recibida y una línea final con el resumen
+        """
+        # 1. Validar autenticación (API Key)
+        api_key = request.httprequest.headers.get('Authorization', '').replace('Bearer ', '')
+        if not self._validate_api_key(api_key):
+            return self._http_error_response('INVALID_API_KEY', 'API Key inválida o faltante', 401)
+        
+        # 2. Validar formato del body
+        if request.httprequest.mimetype != 'application/x-ndjson':
+            return self._http_error_response(
+                'UNSUPPORTED_MEDIA_TYPE',
+                'Content-Type debe ser application/x-ndjson',
+                415
+            )
+        content_encoding = request.httprequest.headers.get('Content-Encoding', '').strip().lower()
+        if content_encoding not in ('', 'identity', 'gzip'):
+            return self._http_error_response(
+                'UNSUPPORTED_ENCODING',
+                'Content-Encoding soportado: gzip',
+                415
+            )
+        
+        # 3. Leer el body por bloques hacia el archivo temporal (firma incremental)
+        params = request.env['ir.config_parameter'].sudo()
+        max_bytes = int(params.get_param('relatic_integration.ingest_max_mb', '256')) * 1024 * 1024
+        chunk_size = int(params.get_param('relatic_integration.ingest_chunk_size', '200'))
+        secret = self._get_hmac_secret()
+        spool = tempfile.SpooledTemporaryFile(max_size=INGEST_SPOOL_MEMORY)
+        try:
+            digest = self._spool_ingest_body(spool, signer(secret), content_encoding == 'gzip', max_bytes)
+        except zlib.error:
+            spool.close()
+            return self._http_error_response('INVALID_ENCODING', 'El body no es gzip válido', 400)
+        if digest is None:
+            spool.close()
+            return self._http_error_response(
+                'PAYLOAD_TOO_LARGE',
+                f'El body descomprimido supera {max_bytes // (1024 * 1024)} MB',
+                413
+            )
+        
+        # 4. Validar firma HMAC del body completo
+        signature = request.httprequest.headers.get('X-Relatic-Signature', '')
+        if not compare_signature(secret, digest, signature):
+            spool.close()
+            return self._http_error_response(
+                'INVALID_SIGNATURE',
+                'La firma HMAC no coincide con el payload',
+                401
+            )
+        
+        # 5. El generador abre sus propios cursores (commit por bloque): se
+        # ejecuta después de que el request haya cerrado el suyo
+        spool.seek(0)
+        results = self._ingest_stream(request.db, spool, chunk_size)
+        return http.Response(
+            results,
+            headers=[('Content-Type', 'application/x-ndjson; charset=utf-8')],
+            direct_passthrough=True
+        )
+
+    def _spool_ingest_body(self, spool, digest, gzipped, max_bytes):
+        """
+        Copiar el body del request al spool sin cargarlo completo en memoria
+        
+        :param spool: Archivo temporal de destino
+        :param digest: Firma incremental (core.signing.signer)
+        :param gzipped: True si el body viene con Content-Encoding gzip
+        :param max_bytes: Tamaño máximo del NDJSON descomprimido
+        :return: Firma hexadecimal del NDJSON o None si supera max_bytes
+        :raises zlib.error: Si el gzip está corrupto
+        """
+        stream = request.httprequest.stream
+        decompressor = zlib.decompressobj(wbits=31) if gzipped else None
+        written = 0
+        while True:
+            block = stream.read(INGEST_READ_SIZE)
+            if not block:
+                break
+            if decompressor:
+                # max_length acota la memoria por bloque aunque el gzip sea
+                # muy comprimible
+                block = decompressor.decompress(block, INGEST_READ_SIZE * 16)
+                while block:
+                    written += len(block)
+                    if written > max_bytes:
+                        return None
+                    digest.update(block)
+                    spool.write(block)
+                    block = decompressor.decompress(decompressor.unconsumed_tail, INGEST_READ_SIZE * 16)
+                continue
+            written += len(block)
+            if written > max_bytes:
+                return None
+            digest.update(block)
+            spool.write(block)
+        if decompressor and not decompressor.eof:
+            raise zlib.error('gzip truncado')
+        return digest.hexdigest()
+
+    def _ingest_stream(self, dbname, spool, chunk_size):
+        """
+        Generador de resultados NDJSON: un bloque de líneas por transacción
+        
+        Cada orden corre en un savepoint (un error no revierte las demás) y
+        cada bloque se confirma antes de emitir sus resultados: lo que el
+        cliente recibe ya está guardado. Si la respuesta se corta, la línea
+        de resumen falta y las órdenes ya confirmadas se detectan por
+        idempotencia al reenviar el archivo.
+        
+        :return: Generador de bytes
+        """
+        registry = Registry(dbname)
+        summary = {'lines': 0, 'created': 0, 'existing': 0, 'errors': 0}
+        try:
+            chunk = []
+            for line_no, raw in enumerate(spool, 1):
+                if raw.strip():
+                    chunk.append((line_no, raw))
+                if len(chunk) >= chunk_size:
+                    yield self._ingest_chunk(registry, chunk, summary)
+                    chunk = []
+            if chunk:
+                yield self._ingest_chunk(registry, chunk, summary)
+            yield (json.dumps({'summary': summary}) + '\n').encode('utf-8')
+        finally:
+            spool.close()
+
+    def _ingest_chunk(self, registry, chunk, summary):
+        """
+        Procesar un bloque de líneas en una transacción (savepoint por orden)
+        
+        Cada orden toma el advisory lock de su miembro y lo retiene hasta el
+        commit del bloque. Las órdenes se procesan ordenadas por la llave de
+        lock del miembro (no en el orden del archivo): dos ingestas con
+        miembros en común toman los locks en el mismo orden y no pueden
+        esperarse en ciclo. Los resultados se emiten en el orden de las líneas.
+        
+        :param registry: Registro de la base de datos
+        :param chunk: Lista de (número de línea, bytes de la línea)
+        :param summary: Contadores acumulados de la ingesta (se actualizan)
+        :return: bytes con una línea de resultado por orden
+        """
+        results = []
+        orders = []
+        for line_no, raw in chunk:
+            payload, error = self._parse_ingest_line(line_no, raw)
+            if error:
+                results.append(error)
+            else:
+                orders.append((line_no, payload))
+        
+        with registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            lock_key = env['relatic.partner.service']._member_lock_key
+            orders.sort(key=lambda order: (lock_key(self._ingest_member_email(order[1])), order[0]))
+            for line_no, payload in orders:
+                results.append(self._ingest_order(env, line_no, payload))
+        results.sort(key=lambda result: result['line'])
+        
+        for result in results:
+            summary['lines'] += 1
+            if result['status'] == 'error':
+                summary['errors'] += 1
+            elif result['already_exists']:
+                summary['existing'] += 1
+            else:
+                summary['created'] += 1
+        return ''.join(json.dumps(result, ensure_ascii=False) + '\n' for result in results).encode('utf-8')
+
+    def _parse_ingest_line(self, line_no, raw):
+        """
+        Decodificar una línea de la ingesta
+        
+        :return: Tupla (payload, None) o (None, resultado de error de la línea)
+        """
+        try:
+            payload = json.loads(raw)
+        except ValueError:
+            return None, self._ingest_error(line_no, None, 'INVALID_PAYLOAD', 'Línea con JSON inválido')
+        if not isinstance(payload, dict):
+            return None, self._ingest_error(line_no, None, 'INVALID_PAYLOAD', 'La línea no es un objeto JSON')
+        return payload, None
+
+    def _ingest_member_email(self, payload):
+        """Email del miembro de un payload aún no validado (None si no es texto)"""
+        member = payload.get('member')
+        email = member.get('email') if isinstance(member, dict) else None
+        return email if isinstance(email, str) else None
+
+    def _ingest_error(self, line_no, order_id, code, message):
+        """Resultado de error de una línea de la ingesta"""
+        return {'line': line_no, 'order_id': order_id, 'status': 'error',
+                'error': {'code': code, 'message': message}}
+
+    def _ingest_order(self, env, line_no, payload):
+        """
+        Procesar una línea de la ingesta con el mismo pipeline que /sale
+        
+        Los errores de validación quedan solo en el resultado; los errores
+        internos dejan un log en retry para el motor de reprocesos.
+        
+        :param payload: Payload decodificado (_parse_ingest_line)
+        :return: Dict con el resultado de la línea
+        """
+        order_id = payload.get('order_id')
+        
+        sale_service = env['relatic.sale.service']
+        sync_log = env['relatic.sync.log']
+        validation_error = validate_sale_payload(payload) or sale_service._preflight_check(payload)
+        if validation_error:
+            return self._ingest_error(line_no, order_id, validation_error['code'], validation_error['message'])
+        
+        start_time = time.time()
+        try:
+            with env.cr.savepoint():
+                result = sale_service.with_context(relatic_preflight_done=True).process_order(payload)
+                log = sync_log.record_success(
+                    payload,
+                    partner_id=result['partner'].id,
+                    invoice_id=result['invoice'].id,
+                    payment_move_id=result['payment_move'].id,
+                    processing_time=time.time() - start_time,
+                )
+        except ValidationError as e:
+            return self._ingest_error(line_no, order_id, 'VALIDATION_ERROR', str(e))
+        except Exception as e:
+            _logger.exception("Relatic ingest: error en la línea %s (orden %s)", line_no, order_id)
+            sync_log.record_error(payload, 'ODOO_ERROR', f"Error interno: {str(e)}", retry=True)
+            return self._ingest_error(line_no, order_id, 'ODOO_ERROR', 'Error interno del servidor')
+        
+        return {
+            'line': line_no,
+            'order_id': order_id,
+            'status': 'success',
+            'invoice_id': result['invoice'].id,
+            'invoice_number': result['invoice'].name,
+            'already_exists': result['already_exists'],
+            'sync_log_id': log.id,
+        }
+
+    @http.route('/api/relatic/v1/member/<string:email>/summary', type='http', auth='none', methods=['GET'], csrf=False)
+    def relatic_member_summary(self, email, **kwargs):
+        """
+        Resumen de cuenta de un miembro para el portal de membresia-relatic
+        
+        Lee el resumen precalculado (relatic.member.summary) con una sola
+        búsqueda por email, sin recorrer las líneas contables.
+        
+        Returns:
+            Response: JSON con facturas, facturas abiertas, totales, saldo y último pago
+        """
+        # 1. Validar autenticación (API Key)
+        api_key = request.httprequest.headers.get('Authorization', '').replace('Bearer ', '')
+        if not self._validate_api_key(api_key):
+            return self._http_error_response('INVALID_API_KEY', 'API Key inválida o faltante', 401)
+        
+        # 2. Validar email
+        email = normalize_email(email)
+        if not validate_email(email):
+            return self._http_error_response('INVALID_EMAIL', f'Formato de email inválido: {email}', 400)
+        
+        # 3. Leer resumen
+        summary = request.env['relatic.member.summary'].sudo()._get_summary(email)
+        if not summary:
+            return self._http_error_response('MEMBER_NOT_FOUND', 'El miembro no tiene facturas registradas', 404)
+        
+        return request.make_json_response(self._success_response(data=summary, message='Resumen del miembro'))
+
+    @http.route('/api/relatic/v1/export/orders', type='http', auth='none', methods=['GET'], csrf=False)
+    def relatic_export_orders(self, date_from=None, date_to=None, after_received_at=None, after_id=None,
+                              status=None, gzip=None, **kwargs):
+        """
+        Exportar órdenes de un período como NDJSON en streaming
+        
+        Una línea por log de sincronización con factura, montos, pago y estado.
+        Paginación keyset por (received_at, id): para reanudar una exportación
+        cortada se envían after_received_at y after_id de la última línea recibida.
+        
+        Query params:
+            date_from, date_to: Período YYYY-MM-DD (date_to inclusive)
+            after_received_at, after_id: Cursor de reanudación (opcional)
+            status: Filtrar por estado del log (opcional)
+            gzip: 1 para comprimir (también si Accept-Encoding incluye gzip)
+        
+        Returns:
+            Response: application/x-ndjson en streaming
+        """
+        # 1. Validar autenticación (API Key)
+        api_key = request.httprequest.headers.get('Authorization', '').replace('Bearer ', '')
+        if not self._validate_api_key(api_key):
+            return self._http_error_response('INVALID_API_KEY', 'API Key inválida o faltante', 401)
+        
+        # 2. Validar parámetros
+        try:
+            start = datetime.strptime(date_from or '', '%Y-%m-%d')
+            end = datetime.strptime(date_to or '', '%Y-%m-%d') + timedelta(days=1)
+        except ValueError:
+            return self._http_error_response(
+                'INVALID_DATE',
+                'date_from y date_to son requeridos con formato YYYY-MM-DD',
+                400
+            )
+        
+        cursor_after = (start, 0)
+        if after_received_at or after_id:
+            try:
+                cursor_after = (
+                    datetime.fromisoformat(after_received_at),
+                    int(after_id),
+                )
+            except (TypeError, ValueError):
+                return self._http_error_response(
+                    'INVALID_CURSOR',
+                    'after_received_at (ISO) y after_id (entero) deben enviarse juntos',
+                    400
+                )
+        
+        compress = gzip == '1' or 'gzip' in request.httprequest.headers.get('Accept-Encoding', '')
+        headers = [('Content-Type', 'application/x-ndjson; charset=utf-8')]
+        if compress:
+            headers.append(('Content-Encoding', 'gzip'))
+        
+        # 3. El generador abre su propio cursor: se ejecuta después de que
+        # el request haya cerrado el suyo
+        rows = self._export_orders_stream(request.db, start, end, cursor_after, status, compress)
+        return http.Response(rows, headers=headers, direct_passthrough=True)
+
+    def _export_orders_stream(self, dbname, start, end, cursor_after, status, compress):
+        """
+        Generador NDJSON con paginación keyset y cursor de servidor
+        
+        Cada página (EXPORT_PAGE_SIZE filas) se lee con un cursor con nombre
+        en bloques de EXPORT_FETCH_SIZE, así la memoria no depende del período.
+        
+        :return: Generador de bytes
+        """
+        compressor = zlib.compressobj(wbits=31) if compress else None
+        registry = Registry(dbname)
+        with registry.cursor() as cr:
+            cr.execute("SET TRANSACTION READ ONLY")
+            last_received_at, last_id = cursor_after
+            while True:
+                server_cursor = cr._cnx.cursor(name=f'relatic_export_{uuid.uuid4().hex}')
+                server_cursor.execute("""
+                    SELECT l.id, l.received_at, l.order_id, l.status, l.error_code, l.environment,
+                           l.processing_time, l.partner_name,
+                           inv.id, inv.name, inv.invoice_date, inv.amount_untaxed, inv.amount_tax,
+                           inv.amount_total, inv.amount_residual, inv.payment_state,
+                           pay.id, pay.name, pay.ref
+                      FROM relatic_sync_log l
+                 LEFT JOIN account_move inv ON inv.id = l.invoice_id
+                 LEFT JOIN account_move pay ON pay.id = l.payment_move_id
+                     WHERE l.received_at < %s
+                       AND (l.received_at, l.id) > (%s, %s)
+                       AND (%s IS NULL OR l.status = %s)
+                  ORDER BY l.received_at, l.id
+                     LIMIT %s
+                """, (end, last_received_at, last_id, status, status, EXPORT_PAGE_SIZE))
+                
+                page_rows = 0
+                while True:
+                    batch = server_cursor.fetchmany(EXPORT_FETCH_SIZE)
+                    if not batch:
+                        break
+                    page_rows += len(batch)
+                    chunk = ''.join(self._export_line(row) for row in batch).encode('utf-8')
+                    last_received_at, last_id = batch[-1][1], batch[-1][0]
+                    yield compressor.compress(chunk) if compressor else chunk
+                server_cursor.close()
+                
+                if page_rows < EXPORT_PAGE_SIZE:
+                    break
+        
+        if compressor:
+            yield compressor.flush()
+
+    def _export_line(self, row):
+        """Serializar una fila de la exportación como línea NDJSON"""
+        (log_id, received_at, order_id, status, error_code, environment, processing_time, partner_name,
+         invoice_id, invoice_number, invoice_date, amount_untaxed, amount_tax, amount_total,
+         amount_residual, payment_state, payment_move_id, payment_move_name, payment_reference) = row
+        return json.dumps({
+            'sync_log_id': log_id,
+            'received_at': received_at.isoformat(),
+            'order_id': order_id,
+            'status': status,
+            'error_code': error_code,
+            'environment': environment,
+            'processing_time': processing_time,
+            'partner_name': partner_name,
+            'invoice_id': invoice_id,
+            'invoice_number': invoice_number,
+            'invoice_date': invoice_date.isoformat() if invoice_date else None,
+            'amount_untaxed': float(amount_untaxed) if amount_untaxed is not None else None,
+            'amount_tax': float(amount_tax) if amount_tax is not None else None,
+            'amount_total': float(amount_total) if amount_total is not None else None,
+            'amount_residual': float(amount_residual) if amount_residual is not None else None,
+            'payment_state': payment_state,
+            'payment_move_id': payment_move_id,
+            'payment_move_name': payment_move_name,
+            'payment_reference': payment_reference,
+        }, ensure_ascii=False) + '\n'
+
+    def _log_success(self, log_record, payload, tx_attempts=1, attempt=1, **values):
+        """
+        Registrar resultado exitoso en el log de sincronización
+        
+        :param log_record: Log creado al inicio (modo two_phase) o None (single_write)
+        :param payload: Payload validado
+        :param tx_attempts: Ejecuciones de la transacción (ya guardado en el log two_phase)
+        :param attempt: Número de entrega (ya guardado en el log two_phase)
+        :param values: partner_id, invoice_id, payment_move_id, processing_time
+        :return: relatic.sync.log record
+        """
+        if log_record:
+            # Reentrega de una entrega ya exitosa: conservar su resultado
+            # (asiento de pago incluido) y no volver a encolar el callback
+            if log_record.status != 'success':
+                log_record.mark_success(**values)
+            return log_record
+        return request.env['relatic.sync.log'].sudo().record_success(
+            payload, tx_attempts=tx_attempts, attempt=attempt, **values
+        )
+
+    def _log_error(self, log_record, payload, error_code, error_message, retry=False, tx_attempts=1, attempt=1):
+        """
+        Registrar error en el log de sincronización
+        
+        :param log_record: Log creado al inicio (modo two_phase) o None (single_write)
+        :param payload: Payload validado o None si el error ocurrió antes de validar
+        :param tx_attempts: Ejecuciones de la transacción (ya guardado en el log two_phase)
+        :param attempt: Número de entrega (ya guardado en el log two_phase)
+        """
+        if log_record:
+            log_record.mark_error(error_code, error_message, retry=retry)
+        elif payload:
+            request.env['relatic.sync.log'].sudo().record_error(
+                payload, error_code, error_message, retry=retry, tx_attempts=tx_attempts, attempt=attempt
+            )
+
+    def _get_delivery_attempt(self):
+        """
+        Número de entrega informado por membresia-relatic
+        
+        Header X-Relatic-Delivery-Attempt (contador de reintentos del origen,
+        desde 1). Sin header, una reentrega idéntica se trata como la misma
+        entrega y reutiliza su log.
+        
+        :return: int >= 1
+        """
+        try:
+            return max(1, int(request.httprequest.headers.get('X-Relatic-Delivery-Attempt', '1')))
+        except ValueError:
+            return 1
+
+    def _is_dry_run(self):
+        """
+        Determinar si el request se procesa en modo dry-run
+        
+        El parámetro relatic_integration.dry_run fuerza el modo para todos
+        los requests (instancia de staging que recibe tráfico espejo).
+        
+        :return: True si hay que calcular la vista previa sin registrar cambios
+        """
+        header = request.httprequest.headers.get('X-Relatic-Dry-Run', '').strip().lower()
+        if header in ('1', 'true', 'yes'):
+            return True
+        return request.env['ir.config_parameter'].sudo().get_param(
+            'relatic_integration.dry_run',
+            'False'
+        ) == 'True'
+
+    def _schedule_inflight_release(self, order_id, token):
+        """
+        Liberar la marca single-flight cuando termine la transacción del request
+        
+        Debe ocurrir después del commit: si se liberara antes, un request en
+        espera podría no ver la factura aún sin confirmar y crear otra.
+        """
+        inflight = request.env['relatic.inflight.order'].sudo()
+        if request.env.registry.in_test_mode():
+            # El cursor de prueba no ejecuta los hooks de commit
+            inflight._release(order_id, token)
+            return
+        request.env.cr.postcommit.add(lambda: inflight._release(order_id, token))
+        request.env.cr.postrollback.add(lambda: inflight._release(order_id, token))
+
+    def _get_tx_retry_settings(self):
+        """
+        Parámetros de reintento de la transacción del webhook
+        
+        :return: Tupla (reintentos máximos, backoff base en milisegundos)
+        """
+        params = request.env['ir.config_parameter'].sudo()
+        return (
+            int(params.get_param('relatic_integration.tx_max_retries', '3')),
+            int(params.get_param('relatic_integration.tx_backoff_ms', '50')),
+        )
+
+    def _wait_tx_retry(self, order_id, tx_attempts, backoff_ms, error):
+        """
+        Esperar antes de repetir la transacción (backoff exponencial con jitter)
+        
+        El jitter (50%-150%) evita que las transacciones que chocaron se
+        reintenten en el mismo instante y vuelvan a chocar.
+        """
+        delay = backoff_ms * 2 ** (tx_attempts - 1) * random.uniform(0.5, 1.5) / 1000.0
+        _logger.info(
+            "Relatic webhook: %s en orden %s (intento %s), reintentando en %.0f ms",
+            type(error).__name__, order_id, tx_attempts, delay * 1000,
+        )
+        time.sleep(delay)
 
     def _validate_api_key(self, api_key):
         """
@@ -228,25 +955,19 @@ class RelaticAPIController(http.Controller):
         :param received_signature: Firma recibida en header
         :return: True si es válida, False si no
         """
-        if not received_signature:
-            return False
+        # Sin secret configurado no se valida (solo para desarrollo)
+        return verify_signature(self._get_hmac_secret(), raw_body, received_signature)
+
+    def _get_hmac_secret(self):
+        """
+        Secret compartido para las firmas HMAC
         
-        secret = request.env['ir.config_parameter'].sudo().get_param(
+        :return: str (vacío si no está configurado)
+        """
+        return request.env['ir.config_parameter'].sudo().get_param(
             'relatic_integration.hmac_secret',
             ''
         )
-        
-        if not secret:
-            # Si no hay secret configurado, no validar (solo para desarrollo)
-            return True
-        
-        expected_signature = hmac.new(
-            secret.encode('utf-8'),
-            raw_body.encode('utf-8'),
-            hashlib.sha256
-        ).hexdigest()
-        
-        return hmac.compare_digest(received_signature, expected_signature)
 
     def _validate_payload(self, payload):
         """
@@ -255,129 +976,16 @@ class RelaticAPIController(http.Controller):
         :param payload: Diccionario con el payload
         :return: Dict con error si hay problema, None si es válido
         """
-        # Validar campos requeridos
-        required_fields = ['meta', 'order_id', 'member', 'items', 'payment']
-        for field in required_fields:
-            if field not in payload:
-                return {
-                    'code': 'INVALID_PAYLOAD',
-                    'message': f'Campo requerido faltante: {field}'
-                }
-        
-        # Validar meta
-        meta = payload.get('meta', {})
-        if 'version' not in meta or 'source' not in meta or 'environment' not in meta:
-            return {
-                'code': 'INVALID_PAYLOAD',
-                'message': 'Campo meta incompleto. Requiere: version, source, environment'
-            }
-        
-        # Validar order_id
-        order_id = payload.get('order_id', '')
-        if not order_id or not isinstance(order_id, str):
-            return {
-                'code': 'INVALID_PAYLOAD',
-                'message': 'order_id debe ser un string no vacío'
-            }
-        
-        # Validar member
-        member = payload.get('member', {})
-        email = member.get('email', '')
-        if not email or '@' not in email:
-            return {
-                'code': 'INVALID_EMAIL',
-                'message': 'Email inválido o faltante en member'
-            }
-        
-        name = member.get('name', '')
-        if not name:
-            return {
-                'code': 'INVALID_PAYLOAD',
-                'message': 'Campo name faltante en member'
-            }
-        
-        # Validar items
-        items = payload.get('items', [])
-        if not items or not isinstance(items, list) or len(items) == 0:
-            return {
-                'code': 'EMPTY_ITEMS',
-                'message': 'Array de items vacío o inválido'
-            }
-        
-        total_amount = 0.0
-        for item in items:
-            if 'sku' not in item or 'name' not in item:
-                return {
-                    'code': 'INVALID_PAYLOAD',
-                    'message': 'Item incompleto. Requiere: sku, name'
-                }
-            
-            qty = item.get('qty', 0)
-            if not isinstance(qty, (int, float)) or qty <= 0:
-                return {
-                    'code': 'INVALID_QUANTITY',
-                    'message': f'Cantidad inválida en item {item.get("sku")}. Debe ser > 0'
-                }
-            
-            price = item.get('price', 0)
-            if not isinstance(price, (int, float)) or price < 0:
-                return {
-                    'code': 'INVALID_PRICE',
-                    'message': f'Precio inválido en item {item.get("sku")}. Debe ser >= 0'
-                }
-            
-            total_amount += qty * price
-        
-        # Validar payment
-        payment = payload.get('payment', {})
-        if 'method' not in payment or 'amount' not in payment or 'reference' not in payment or 'date' not in payment:
-            return {
-                'code': 'INVALID_PAYLOAD',
-                'message': 'Campo payment incompleto. Requiere: method, amount, reference, date'
-            }
-        
-        payment_amount = payment.get('amount', 0)
-        if not isinstance(payment_amount, (int, float)):
-            return {
-                'code': 'INVALID_PAYLOAD',
-                'message': 'payment.amount debe ser numérico'
-            }
-        
-        # Validar que el monto coincida (con tolerancia de 0.01 para redondeos)
-        if abs(payment_amount - total_amount) > 0.01:
-            return {
-                'code': 'AMOUNT_MISMATCH',
-                'message': f'Monto del pago ({payment_amount}) no coincide con total de items ({total_amount})'
-            }
-        
-        # Validar fecha
-        payment_date = payment.get('date', '')
-        try:
-            datetime.strptime(payment_date, '%Y-%m-%d')
-            # Validar que no sea futura
-            payment_dt = datetime.strptime(payment_date, '%Y-%m-%d').date()
-            if payment_dt > datetime.now().date():
-                return {
-                    'code': 'INVALID_DATE',
-                    'message': 'La fecha del pago no puede ser futura'
-                }
-        except ValueError:
-            return {
-                'code': 'INVALID_DATE',
-                'message': 'Formato de fecha inválido. Debe ser YYYY-MM-DD'
-            }
-        
-        # Validar VAT si existe
-        vat = member.get('vat', '')
-        if vat:
-            # Validación básica de formato (puede mejorarse según país)
-            if not isinstance(vat, str) or len(vat) < 3:
-                return {
-                    'code': 'INVALID_VAT',
-                    'message': 'Formato de VAT/RUC inválido'
-                }
-        
-        return None  # Payload válido
+        return validate_sale_payload(payload)
+
+    def _validate_refund_payload(self, payload):
+        """
+        Validar payload de reembolsos masivos
+        
+        :param payload: Diccionario con el payload
+        :return: Dict con error si hay problema, None si es válido
+        """
+        return validate_refund_payload(payload)
 
     def _success_response(self, data, message='Operación exitosa', warning=None):
         """
@@ -424,3 +1032,21 @@ class RelaticAPIController(http.Controller):
         request.httprequest.status_code = http_status
         
         return response
+
+    def _http_error_response(self, error_code, error_message, http_status=400):
+        """
+        Crear respuesta de error para rutas type='http'
+        
+        :param error_code: Código del error
+        :param error_message: Mensaje del error
+        :param http_status: Código HTTP
+        :return: Response JSON
+        """
+        return request.make_json_response({
+            'status': 'error',
+            'error': {
+                'code': error_code,
+                'message': error_message
+            },
+            'retry': False
+        }, status=http_status)
@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+"""
+Núcleo de la integración Relatic en Python puro
+
+No importa Odoo: se puede usar y probar sin registro ni base de datos.
+"""
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Partición, lectura y checkpoints de la carga histórica (cli/backfill.py)
+
+Cada worker procesa solo las líneas de su partición y guarda en un
+checkpoint JSON la última línea confirmada; al reanudar salta todas las
+líneas hasta esa.
+"""
+
+import json
+import os
+
+from .normalization import member_shard, normalize_email
+from .validation import validate_sale_payload
+
+
+def partition_of(payload, workers):
+    """
+    Worker asignado a un payload según el hash del email del miembro
+
+    Todas las órdenes de un mismo miembro caen en el mismo worker, así dos
+    procesos nunca crean o actualizan el mismo contacto a la vez. Usa el
+    mismo shard que el advisory lock y los reprocesos (member_shard).
+
+    :return: Índice de worker (0..workers-1)
+    """
+    member = payload.get('member') or {}
+    key = normalize_email(member.get('email')) or str(payload.get('order_id'))
+    return member_shard(key) % workers
+
+
+def worker_paths(checkpoint_dir, path, index, workers):
+    """
+    Rutas del checkpoint y del archivo de errores de un worker
+
+    :return: Tupla (checkpoint_path, errors_path)
+    """
+    prefix = os.path.join(checkpoint_dir, f'{os.path.basename(path)}.worker{index}of{workers}')
+    return f'{prefix}.json', f'{prefix}.errors.jsonl'
+
+
+def load_checkpoint(checkpoint_path, state):
+    """
+    Actualizar el estado del worker con el checkpoint guardado, si existe
+
+    :param state: Dict de estado inicial (se modifica y se retorna)
+    :return: state
+    """
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, encoding='utf-8') as checkpoint:
+            state.update(json.load(checkpoint))
+    return state
+
+
+def save_checkpoint(checkpoint_path, state):
+    """Escritura atómica: el checkpoint nunca queda a medias"""
+    tmp_path = f'{checkpoint_path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as checkpoint:
+        json.dump(state, checkpoint)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def read_partition(lines, index, workers, start_line=0, today=None):
+    """
+    Líneas JSONL de la partición de un worker a partir de start_line
+
+    Las líneas con JSON inválido se reportan solo en el worker 0.
+
+    :param lines: Iterable de líneas crudas (p. ej. el archivo abierto)
+    :param start_line: Última línea ya procesada (checkpoint); se salta
+    :param today: Fecha de referencia de la validación (default: hoy)
+    :return: Generador de (número de línea, payload o None, error)
+    """
+    for line_no, raw in enumerate(lines, 1):
+        if line_no <= start_line or not raw.strip():
+            continue
+        try:
+            payload = json.loads(raw)
+        except ValueError as e:
+            if index == 0:
+                yield line_no, None, {'code': 'INVALID_PAYLOAD', 'message': f'JSON inválido: {e}'}
+            continue
+        if not isinstance(payload, dict):
+            if index == 0:
+                yield line_no, None, {'code': 'INVALID_PAYLOAD', 'message': 'La línea no es un objeto JSON'}
+            continue
+        if partition_of(payload, workers) == index:
+            yield line_no, payload, validate_sale_payload(payload, today=today)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Normalización de datos del miembro (email, teléfono, VAT) y shard por miembro
+"""
+
+import hashlib
+import re
+
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+PHONE_STRIP_PATTERN = re.compile(r'[^\d+]')
+
+
+def normalize_email(email):
+    """Email normalizado del miembro (llave de contacto, lock y shard)"""
+    return (email or '').strip().lower()
+
+
+def validate_email(email):
+    """
+    Validar formato de email básico
+
+    :param email: Email a validar
+    :return: True si es válido
+    """
+    return EMAIL_PATTERN.match(email or '') is not None
+
+
+def normalize_phone(phone):
+    """
+    Normalizar formato de teléfono
+
+    :param phone: Teléfono a normalizar
+    :return: Teléfono con solo dígitos y +
+    """
+    if not phone:
+        return ''
+    return PHONE_STRIP_PATTERN.sub('', phone.strip())
+
+
+def normalize_vat(vat):
+    """
+    Normalizar formato de VAT/RUC
+
+    :param vat: VAT a normalizar
+    :return: VAT sin espacios alrededor y en mayúsculas
+    """
+    if not vat:
+        return ''
+    return vat.strip().upper()
+
+
+def member_shard(email):
+    """
+    Shard estable de un miembro: hash del email normalizado (31 bits)
+
+    Usado para el advisory lock por miembro, el reparto de reprocesos entre
+    workers y la partición del backfill.
+
+    :param email: Email del miembro
+    :return: int entre 0 y 2^31 - 1
+    """
+    digest = hashlib.sha1(normalize_email(email).encode('utf-8')).hexdigest()
+    return int(digest[:8], 16) & 0x7FFFFFFF
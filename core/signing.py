@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Firma HMAC-SHA256 de los cuerpos intercambiados con membresia-relatic
+
+Se firma el cuerpo exacto (bytes) tanto en los webhooks entrantes como en
+los callbacks salientes; la firma viaja en el header X-Relatic-Signature.
+"""
+
+import hashlib
+import hmac
+
+SIGNATURE_HEADER = 'X-Relatic-Signature'
+
+
+def _to_bytes(value):
+    return value.encode('utf-8') if isinstance(value, str) else value
+
+
+def sign(secret, body):
+    """
+    Firma HMAC-SHA256 en hexadecimal
+
+    :param secret: hmac_secret compartido
+    :param body: Cuerpo exacto (str o bytes)
+    :return: str hexadecimal
+    """
+    return hmac.new(_to_bytes(secret), _to_bytes(body), hashlib.sha256).hexdigest()
+
+
+def signer(secret):
+    """
+    Firma incremental para cuerpos que se leen por bloques
+
+    :param secret: hmac_secret compartido
+    :return: Objeto hmac (update(bytes) por bloque, hexdigest() al final)
+    """
+    return hmac.new(_to_bytes(secret), digestmod=hashlib.sha256)
+
+
+def compare_signature(secret, expected_signature, received_signature):
+    """
+    Comparar la firma calculada con la recibida en tiempo constante
+
+    Sin secret configurado no se valida (solo para desarrollo).
+
+    :param secret: hmac_secret compartido (vacío = no validar)
+    :param expected_signature: Firma calculada sobre el cuerpo
+    :param received_signature: Firma del header
+    :return: True si es válida
+    """
+    if not received_signature:
+        return False
+    if not secret:
+        return True
+    return hmac.compare_digest(received_signature, expected_signature)
+
+
+def verify_signature(secret, body, received_signature):
+    """
+    Validar la firma recibida contra el cuerpo
+
+    :param secret: hmac_secret compartido (vacío = no validar)
+    :param body: Cuerpo exacto (str o bytes)
+    :param received_signature: Firma del header
+    :return: True si es válida
+    """
+    return compare_signature(secret, sign(secret, body) if secret else '', received_signature)
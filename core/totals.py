@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Motor de totales de órdenes Relatic (Python puro, sin Odoo)
+
+Reproduce el cálculo de Odoo para las facturas que crea
+relatic.invoice.service: impuestos porcentuales (precio sin o con impuesto
+incluido), redondeo HALF-UP de la moneda y los métodos de redondeo
+round_per_line / round_globally de la compañía. Permite rechazar un pago
+que no coincide con el total antes de escribir nada en la base.
+"""
+
+import math
+from collections import namedtuple
+
+# Tasa usada cuando el item no trae tax_rate (igual que create_invoice)
+DEFAULT_TAX_RATE = 7.0
+
+# Tolerancia entre el pago y el total (igual que register_payment)
+AMOUNT_TOLERANCE = 0.01
+
+# Impuesto porcentual resuelto en Odoo para una tasa del payload
+TaxSpec = namedtuple('TaxSpec', ['amount', 'price_include'])
+
+
+def float_round(value, precision_rounding=0.01):
+    """
+    Redondeo HALF-UP equivalente a odoo.tools.float_utils.float_round
+
+    Suma un épsilon relativo a la magnitud antes de redondear para que los
+    valores binarios apenas por debajo de la mitad (0.035 → 0.034999...)
+    suban igual que en Odoo.
+
+    :param value: Valor a redondear
+    :param precision_rounding: Precisión de la moneda (ej: 0.01)
+    :return: float redondeado
+    """
+    if not value:
+        return 0.0
+    normalized = value / precision_rounding
+    epsilon = 2 ** (math.log2(abs(normalized)) - 52)
+    normalized += math.copysign(epsilon, normalized)
+    digits = max(0, -int(math.floor(math.log10(precision_rounding))))
+    return round(round(normalized) * precision_rounding, digits)
+
+
+def item_tax_rate(item):
+    """Tasa de impuesto de un item del payload (None o <= 0 = sin impuesto)"""
+    return item.get('tax_rate', DEFAULT_TAX_RATE)
+
+
+def compute_order_totals(items, taxes, rounding=0.01, rounding_method='round_per_line'):
+    """
+    Calcular líneas y totales de la factura de una orden
+
+    :param items: Lista de items del payload (qty, price, tax_rate)
+    :param taxes: Dict {tasa: TaxSpec o None}; None o tasa ausente = la
+                  factura no lleva impuesto para esa tasa
+    :param rounding: Precisión de la moneda de la compañía
+    :param rounding_method: 'round_per_line' o 'round_globally'
+    :return: Dict con lines, amount_untaxed, amount_tax y amount_total
+    """
+    lines = []
+    tax_by_rate = {}
+    for item in items:
+        rate = item_tax_rate(item)
+        tax = taxes.get(rate) if rate and rate > 0 else None
+        line_total = item.get('qty', 1) * item.get('price', 0)
+
+        if tax is None:
+            base, tax_amount = line_total, 0.0
+        elif tax.price_include:
+            tax_amount = line_total - line_total / (1 + tax.amount / 100.0)
+            base = line_total - tax_amount
+        else:
+            base, tax_amount = line_total, line_total * tax.amount / 100.0
+
+        if rounding_method == 'round_globally':
+            tax_by_rate[rate] = tax_by_rate.get(rate, 0.0) + tax_amount
+        else:
+            tax_amount = float_round(tax_amount, rounding)
+            if tax is not None and tax.price_include:
+                # El total de la línea es el precio; la base absorbe el redondeo
+                base = float_round(line_total, rounding) - tax_amount
+        subtotal = float_round(base, rounding)
+
+        lines.append({
+            'sku': item.get('sku'),
+            'tax_rate': tax.amount if tax is not None else 0.0,
+            'price_subtotal': subtotal,
+            'amount_tax': float_round(tax_amount, rounding),
+            'price_total': float_round(subtotal + tax_amount, rounding),
+        })
+
+    amount_untaxed = float_round(sum(line['price_subtotal'] for line in lines), rounding)
+    if rounding_method == 'round_globally':
+        amount_tax = float_round(sum(float_round(amount, rounding) for amount in tax_by_rate.values()), rounding)
+    else:
+        amount_tax = float_round(sum(line['amount_tax'] for line in lines), rounding)
+    return {
+        'lines': lines,
+        'amount_untaxed': amount_untaxed,
+        'amount_tax': amount_tax,
+        'amount_total': float_round(amount_untaxed + amount_tax, rounding),
+    }
+
+
+def check_payment_amount(totals, payment_amount, tolerance=AMOUNT_TOLERANCE):
+    """
+    Comparar el monto del pago con el total con impuestos
+
+    :param totals: Dict retornado por compute_order_totals
+    :param payment_amount: payment.amount del payload
+    :return: Dict con error (code, message) o None si coincide
+    """
+    if abs(payment_amount - totals['amount_total']) > tolerance:
+        return {
+            'code': 'AMOUNT_MISMATCH',
+            'message': (
+                f"Monto del pago ({payment_amount}) no coincide con el total de la factura "
+                f"({totals['amount_total']}: {totals['amount_untaxed']} + impuestos {totals['amount_tax']})"
+            ),
+        }
+    return None
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Validación de payloads del contrato JSON v1.0 de membresia-relatic
+
+Cada función retorna None si el payload es válido o un dict
+{'code': ..., 'message': ...} con el primer error encontrado, el mismo
+formato de error que responde la API.
+"""
+
+from datetime import date, datetime
+
+# Máximo de órdenes por request de reembolsos masivos
+MAX_REFUND_BATCH = 500
+
+
+def validate_sale_payload(payload, today=None):
+    """
+    Validar estructura y contenido del payload según contrato JSON v1.0
+
+    :param payload: Diccionario con el payload
+    :param today: Fecha de referencia para rechazar pagos futuros (default: hoy)
+    :return: Dict con error si hay problema, None si es válido
+    """
+    # Validar campos requeridos
+    required_fields = ['meta', 'order_id', 'member', 'items', 'payment']
+    for field in required_fields:
+        if field not in payload:
+            return {
+                'code': 'INVALID_PAYLOAD',
+                'message': f'Campo requerido faltante: {field}'
+            }
+
+    # Validar meta
+    meta = payload.get('meta', {})
+    if 'version' not in meta or 'source' not in meta or 'environment' not in meta:
+        return {
+            'code': 'INVALID_PAYLOAD',
+            'message': 'Campo meta incompleto. Requiere: version, source, environment'
+        }
+
+    # Validar order_id
+    order_id = payload.get('order_id', '')
+    if not order_id or not isinstance(order_id, str):
+        return {
+            'code': 'INVALID_PAYLOAD',
+            'message': 'order_id debe ser un string no vacío'
+        }
+
+    # Validar member
+    member = payload.get('member', {})
+    email = member.get('email', '')
+    if not email or '@' not in email:
+        return {
+            'code': 'INVALID_EMAIL',
+            'message': 'Email inválido o faltante en member'
+        }
+
+    name = member.get('name', '')
+    if not name:
+        return {
+            'code': 'INVALID_PAYLOAD',
+            'message': 'Campo name faltante en member'
+        }
+
+    # Validar items
+    items = payload.get('items', [])
+    if not items or not isinstance(items, list) or len(items) == 0:
+        return {
+            'code': 'EMPTY_ITEMS',
+            'message': 'Array de items vacío o inválido'
+        }
+
+    for item in items:
+        if 'sku' not in item or 'name' not in item:
+            return {
+                'code': 'INVALID_PAYLOAD',
+                'message': 'Item incompleto. Requiere: sku, name'
+            }
+
+        qty = item.get('qty', 0)
+        if not isinstance(qty, (int, float)) or qty <= 0:
+            return {
+                'code': 'INVALID_QUANTITY',
+                'message': f'Cantidad inválida en item {item.get("sku")}. Debe ser > 0'
+            }
+
+        price = item.get('price', 0)
+        if not isinstance(price, (int, float)) or price < 0:
+            return {
+                'code': 'INVALID_PRICE',
+                'message': f'Precio inválido en item {item.get("sku")}. Debe ser >= 0'
+            }
+
+    # Validar payment
+    payment = payload.get('payment', {})
+    if 'method' not in payment or 'amount' not in payment or 'reference' not in payment or 'date' not in payment:
+        return {
+            'code': 'INVALID_PAYLOAD',
+            'message': 'Campo payment incompleto. Requiere: method, amount, reference, date'
+        }
+
+    payment_amount = payment.get('amount', 0)
+    if not isinstance(payment_amount, (int, float)):
+        return {
+            'code': 'INVALID_PAYLOAD',
+            'message': 'payment.amount debe ser numérico'
+        }
+
+    # El monto vs. total con impuestos (AMOUNT_MISMATCH) se valida aparte
+    # con core.totals.check_payment_amount (requiere los impuestos de Odoo)
+
+    # Validar fecha
+    payment_date = payment.get('date', '')
+    try:
+        payment_dt = datetime.strptime(payment_date, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return {
+            'code': 'INVALID_DATE',
+            'message': 'Formato de fecha inválido. Debe ser YYYY-MM-DD'
+        }
+
+    # Validar que no sea futura
+    if payment_dt > (today or date.today()):
+        return {
+            'code': 'INVALID_DATE',
+            'message': 'La fecha del pago no puede ser futura'
+        }
+
+    # Validar VAT si existe
+    vat = member.get('vat', '')
+    if vat:
+        # Validación básica de formato (puede mejorarse según país)
+        if not isinstance(vat, str) or len(vat) < 3:
+            return {
+                'code': 'INVALID_VAT',
+                'message': 'Formato de VAT/RUC inválido'
+            }
+
+    return None  # Payload válido
+
+
+def validate_refund_payload(payload, max_batch=MAX_REFUND_BATCH):
+    """
+    Validar payload de reembolsos masivos
+
+    :param payload: Diccionario con el payload
+    :param max_batch: Máximo de órdenes por request
+    :return: Dict con error si hay problema, None si es válido
+    """
+    order_ids = payload.get('order_ids')
+    if not order_ids or not isinstance(order_ids, list):
+        return {
+            'code': 'INVALID_PAYLOAD',
+            'message': 'order_ids debe ser una lista no vacía'
+        }
+
+    if len(order_ids) > max_batch:
+        return {
+            'code': 'INVALID_PAYLOAD',
+            'message': f'Máximo {max_batch} órdenes por request'
+        }
+
+    if not all(order_id and isinstance(order_id, str) for order_id in order_ids):
+        return {
+            'code': 'INVALID_PAYLOAD',
+            'message': 'Cada order_id debe ser un string no vacío'
+        }
+
+    reason = payload.get('reason', '')
+    if not isinstance(reason, str):
+        return {
+            'code': 'INVALID_PAYLOAD',
+            'message': 'reason debe ser un string'
+        }
+
+    return None  # Payload válido
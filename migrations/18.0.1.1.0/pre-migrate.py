@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+
+
+def migrate(cr, version):
+    """
+    Numerar entregas existentes antes de crear el índice único
+    (order_id, payload_hash, attempt) de relatic.sync.log
+    """
+    if not version:
+        return
+
+    cr.execute("ALTER TABLE relatic_sync_log ADD COLUMN IF NOT EXISTS attempt INTEGER")
+    cr.execute("""
+        UPDATE relatic_sync_log l
+           SET attempt = n.attempt
+          FROM (
+                SELECT id, ROW_NUMBER() OVER (PARTITION BY order_id, payload_hash ORDER BY id) AS attempt
+                  FROM relatic_sync_log
+               ) n
+         WHERE l.id = n.id
+    """)
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+
+
+def migrate(cr, version):
+    """
+    Reemplazar el índice btree de relatic_sync_log.order_id por uno trigram
+
+    El ORM solo crea el índice de un campo si no existe uno con el mismo
+    nombre; se elimina el btree anterior para que se cree el trigram. Las
+    búsquedas exactas por order_id siguen cubiertas por el índice único
+    (order_id, payload_hash, attempt).
+    """
+    if not version:
+        return
+
+    cr.execute("DROP INDEX IF EXISTS relatic_sync_log__order_id_index")
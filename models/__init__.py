@@ -3,3 +3,11 @@
 from . import relatic_sync_log
 from . import account_move
 from . import product_product
+from . import relatic_settlement_import
+from . import relatic_payment_aggregate
+from . import relatic_sync_payload
+from . import relatic_sync_stats_daily
+from . import relatic_sync_error_cluster
+from . import relatic_callback_outbox
+from . import relatic_inflight_order
+from . import relatic_member_summary
@@ -2,6 +2,7 @@
 
 from odoo import models, fields, api
 from odoo.exceptions import ValidationError
+from odoo.tools.sql import create_index
 
 
 class AccountMove(models.Model):
@@ -14,12 +15,54 @@ class AccountMove(models.Model):
         help='Identificador único de la orden desde membresia-relatic para idempotencia'
     )
 
+    x_relatic_invoice_id = fields.Many2one(
+        'account.move',
+        string='Factura Relatic',
+        index='btree_not_null',
+        copy=False,
+        ondelete='set null',
+        help='Factura Relatic que concilia este movimiento de pago'
+    )
+
+    x_relatic_reconcile_pending = fields.Boolean(
+        string='Conciliación Relatic pendiente',
+        copy=False,
+        help='Pago registrado en modo diferido, pendiente de conciliar por el cron'
+    )
+
+    x_relatic_reconcile_error = fields.Char(
+        string='Error de Conciliación Relatic',
+        copy=False,
+        readonly=True,
+        help='El cron no pudo conciliar este pago; marcar de nuevo como pendiente tras corregirlo'
+    )
+
+    x_relatic_settlement_id = fields.Many2one(
+        'relatic.settlement.import',
+        string='Liquidación Relatic',
+        index='btree_not_null',
+        copy=False,
+        ondelete='set null',
+        help='Archivo de liquidación del proveedor que confirmó este pago'
+    )
+
     _sql_constraints = [
         ('relatic_order_unique',
          'UNIQUE(x_relatic_order_id)',
          'Ya existe una factura con este Order ID de Relatic. Verifique que no se esté procesando duplicado.')
     ]
 
+    def init(self):
+        super().init()
+        # Índice parcial: el cron de conciliación solo recorre los pendientes
+        create_index(
+            self.env.cr,
+            'account_move_relatic_reconcile_pending_idx',
+            self._table,
+            ['id'],
+            where='x_relatic_reconcile_pending IS TRUE',
+        )
+
     @api.model
     def search_by_relatic_order_id(self, order_id):
         """
@@ -32,3 +75,20 @@ class AccountMove(models.Model):
             ('x_relatic_order_id', '=', order_id),
             ('move_type', '=', 'out_invoice')
         ], limit=1)
+
+    @api.model
+    def search_by_relatic_order_ids(self, order_ids, move_type='out_invoice'):
+        """
+        Buscar movimientos por varios Relatic Order ID en una sola consulta
+        
+        :param order_ids: Lista de Order IDs de Relatic
+        :param move_type: Tipo de movimiento (out_invoice, out_refund)
+        :return: Dict {order_id: account.move record}
+        """
+        if not order_ids:
+            return {}
+        moves = self.search([
+            ('x_relatic_order_id', 'in', list(order_ids)),
+            ('move_type', '=', move_type)
+        ])
+        return {move.x_relatic_order_id: move for move in moves}
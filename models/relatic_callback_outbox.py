@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from odoo import models, fields, api, SUPERUSER_ID
+from odoo.modules.registry import Registry
+from odoo.tools.sql import create_index
+
+from ..core.signing import SIGNATURE_HEADER, sign
+
+_logger = logging.getLogger(__name__)
+
+# Tope del backoff exponencial de callbacks (1 hora)
+MAX_CALLBACK_BACKOFF_SECONDS = 3600
+
+# Días que se conservan los callbacks ya entregados
+SENT_RETENTION_DAYS = 7
+
+# Tiempo máximo de una ejecución del dispatcher (deja margen al timeout del cron)
+DISPATCH_TIME_BUDGET_SECONDS = 240
+
+# Flag en cr.postcommit.data: un solo trigger del dispatcher por transacción
+TRIGGER_FLAG = 'relatic_callback_dispatch_triggered'
+
+# Cliente HTTP compartido por proceso: conexiones keep-alive reutilizadas entre ejecuciones
+_session = None
+_session_lock = threading.Lock()
+
+
+def _get_session(pool_size):
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+
+class RelaticCallbackOutbox(models.Model):
+    _name = 'relatic.callback.outbox'
+    _description = 'Callbacks de Estado hacia Membresía Relatic'
+    _order = 'id desc'
+    _rec_name = 'order_id'
+
+    sync_log_id = fields.Many2one(
+        'relatic.sync.log',
+        string='Log de Sincronización',
+        ondelete='set null',
+        readonly=True
+    )
+    order_id = fields.Char(string='Order ID', required=True, index=True, readonly=True)
+    event = fields.Selection([
+        ('success', 'Exitoso'),
+        ('error', 'Error'),
+        ('retry', 'Reintento'),
+    ], string='Evento', required=True, readonly=True)
+    body = fields.Text(string='Contenido', required=True, readonly=True)
+    state = fields.Selection([
+        ('pending', 'Pendiente'),
+        ('sent', 'Entregado'),
+        ('failed', 'Fallido'),
+    ], string='Estado', required=True, default='pending', readonly=True)
+    attempts = fields.Integer(string='Intentos', readonly=True)
+    next_attempt_at = fields.Datetime(
+        string='Próximo Intento',
+        default=fields.Datetime.now,
+        readonly=True
+    )
+    last_error = fields.Text(string='Último Error', readonly=True)
+    sent_at = fields.Datetime(string='Entregado en', readonly=True)
+
+    def init(self):
+        # Cola del dispatcher: solo los callbacks pendientes
+        create_index(
+            self.env.cr,
+            'relatic_callback_outbox_pending_idx',
+            self._table,
+            ['next_attempt_at', 'id'],
+            where="state = 'pending'",
+        )
+
+    @api.model
+    def _get_settings(self):
+        params = self.env['ir.config_parameter'].sudo()
+        return {
+            'url': params.get_param('relatic_integration.callback_url', ''),
+            'secret': params.get_param('relatic_integration.hmac_secret', ''),
+            'batch_size': int(params.get_param('relatic_integration.callback_batch_size', '100')),
+            'workers': int(params.get_param('relatic_integration.callback_workers', '4')),
+            'max_attempts': int(params.get_param('relatic_integration.callback_max_attempts', '10')),
+            'timeout': int(params.get_param('relatic_integration.callback_timeout', '10')),
+            'backoff': int(params.get_param('relatic_integration.callback_backoff_seconds', '30')),
+        }
+
+    @api.model
+    def _enqueue(self, logs):
+        """
+        Encolar el callback de estado de los logs (misma transacción que el log)
+
+        No hace nada si relatic_integration.callback_url no está configurado.
+
+        :param logs: relatic.sync.log recordset ya marcado
+        :return: relatic.callback.outbox creados
+        """
+        if not logs or not self.env['ir.config_parameter'].sudo().get_param('relatic_integration.callback_url'):
+            return self.browse()
+
+        outbox = self.sudo().create([{
+            'sync_log_id': log.id,
+            'order_id': log.order_id,
+            'event': log.status,
+            'body': json.dumps({
+                'order_id': log.order_id,
+                'status': log.status,
+                'sync_log_id': log.id,
+                'attempt': log.attempt,
+                'invoice_id': log.invoice_id.id or None,
+                'invoice_number': log.invoice_number or None,
+                'payment_move_id': log.payment_move_id.id or None,
+                'error_code': log.error_code or None,
+                'error_message': log.error_message or None,
+                'next_retry_at': fields.Datetime.to_string(log.next_retry_at) if log.next_retry_at else None,
+                'event_at': fields.Datetime.to_string(fields.Datetime.now()),
+            }, sort_keys=True, separators=(',', ':'), ensure_ascii=False),
+        } for log in logs if log.status in ('success', 'error', 'retry')])
+
+        if outbox:
+            self._trigger_dispatch()
+        return outbox
+
+    @api.model
+    def _trigger_dispatch(self):
+        """
+        Despertar el dispatcher una vez por transacción, después del commit
+
+        _trigger inserta una fila en ir_cron_trigger por llamada; con
+        reprocesos o ingestas que encolan cientos de callbacks en una
+        transacción basta con una. Si el hook falla, el intervalo del cron
+        entrega los callbacks igual.
+        """
+        cron = self.env.ref('relatic_integration.ir_cron_relatic_callback_dispatch', raise_if_not_found=False)
+        if not cron:
+            return
+        if self.env.registry.in_test_mode():
+            # El cursor de prueba no ejecuta los hooks de commit
+            cron.sudo()._trigger()
+            return
+        data = self.env.cr.postcommit.data
+        if data.get(TRIGGER_FLAG):
+            return
+        data[TRIGGER_FLAG] = True
+        dbname = self.env.cr.dbname
+        cron_id = cron.id
+
+        def trigger():
+            try:
+                with Registry(dbname).cursor() as cr:
+                    api.Environment(cr, SUPERUSER_ID, {})['ir.cron'].browse(cron_id)._trigger()
+            except Exception:
+                _logger.exception("Relatic callbacks: no se pudo despertar el dispatcher")
+
+        self.env.cr.postcommit.add(trigger)
+
+    @api.model
+    def _cron_dispatch(self):
+        """
+        Entregar callbacks pendientes en lotes
+
+        Cada ronda toma hasta `workers` lotes con FOR UPDATE SKIP LOCKED,
+        los envía en paralelo (solo HTTP en los threads, sin cursor) sobre
+        una sesión keep-alive compartida, registra el resultado y confirma.
+        El throughput depende de callback_workers y del tamaño de lote, no de
+        los workers HTTP de Odoo.
+
+        :return: Dict con contadores sent/retry/failed
+        """
+        settings = self._get_settings()
+        stats = {'sent': 0, 'retry': 0, 'failed': 0}
+        if not settings['url']:
+            return stats
+
+        session = _get_session(settings['workers'])
+        deadline = time.monotonic() + DISPATCH_TIME_BUDGET_SECONDS
+        with ThreadPoolExecutor(max_workers=settings['workers']) as executor:
+            while time.monotonic() < deadline:
+                batches = self._claim_batches(settings['batch_size'], settings['workers'])
+                if not batches:
+                    break
+                futures = [
+                    executor.submit(self._post_batch, session, settings, [record.body for record in batch])
+                    for batch in batches
+                ]
+                for batch, future in zip(batches, futures):
+                    error = future.result()
+                    for status, count in self._record_result(batch, error, settings).items():
+                        stats[status] += count
+                if not self.env.registry.in_test_mode():
+                    self.env.cr.commit()
+
+        self._purge_sent()
+        if any(stats.values()):
+            _logger.info(
+                "Relatic callbacks: %s entregados, %s reintento, %s fallidos",
+                stats['sent'], stats['retry'], stats['failed'],
+            )
+        return stats
+
+    @api.model
+    def _claim_batches(self, batch_size, count):
+        """
+        Bloquear callbacks pendientes vencidos (SKIP LOCKED) y partirlos en lotes
+
+        :return: Lista de recordsets
+        """
+        self.flush_model()
+        self.env.cr.execute("""
+            SELECT id FROM relatic_callback_outbox
+             WHERE state = 'pending' AND next_attempt_at <= now() AT TIME ZONE 'UTC'
+          ORDER BY next_attempt_at, id
+             LIMIT %s
+               FOR UPDATE SKIP LOCKED
+        """, (batch_size * count,))
+        records = self.browse([row[0] for row in self.env.cr.fetchall()])
+        return [records[index:index + batch_size] for index in range(0, len(records), batch_size)]
+
+    @api.model
+    def _post_batch(self, session, settings, bodies):
+        """
+        POST firmado de un lote (se ejecuta en un thread, sin acceso a la base)
+
+        El cuerpo es {"events": [...]} y la firma HMAC-SHA256 del cuerpo exacto
+        va en X-Relatic-Signature, igual que los webhooks entrantes.
+
+        :return: None si se entregó, o mensaje de error
+        """
+        body = '{"events":[' + ','.join(bodies) + ']}'
+        headers = {'Content-Type': 'application/json'}
+        if settings['secret']:
+            headers[SIGNATURE_HEADER] = sign(settings['secret'], body)
+        try:
+            response = session.post(
+                settings['url'],
+                data=body.encode('utf-8'),
+                headers=headers,
+                timeout=settings['timeout'],
+            )
+        except requests.exceptions.RequestException as e:
+            return f"Error de conexión: {e}"
+        if response.status_code >= 300:
+            return f"HTTP {response.status_code}: {response.text[:500]}"
+        return None
+
+    def _record_result(self, batch, error, settings):
+        """
+        Registrar el resultado de un lote
+
+        :param error: None si se entregó, o mensaje de error
+        :return: Dict con contadores
+        """
+        now = fields.Datetime.now()
+        if not error:
+            self.env.cr.execute("""
+                UPDATE relatic_callback_outbox
+                   SET state = 'sent', sent_at = %s, last_error = NULL, attempts = attempts + 1,
+                       write_uid = %s, write_date = %s
+                 WHERE id = ANY(%s)
+            """, (now, self.env.uid, now, batch.ids))
+            batch.invalidate_recordset()
+            return {'sent': len(batch)}
+
+        stats = {'retry': 0, 'failed': 0}
+        for record in batch:
+            attempts = record.attempts + 1
+            if attempts >= settings['max_attempts']:
+                record.write({'state': 'failed', 'attempts': attempts, 'last_error': error})
+                stats['failed'] += 1
+                continue
+            delay = min(settings['backoff'] * 2 ** (attempts - 1), MAX_CALLBACK_BACKOFF_SECONDS)
+            record.write({
+                'attempts': attempts,
+                'last_error': error,
+                # Jitter ±10% para no reintentar todos los lotes a la vez
+                'next_attempt_at': now + timedelta(seconds=delay * random.uniform(0.9, 1.1)),
+            })
+            stats['retry'] += 1
+        return stats
+
+    @api.model
+    def _purge_sent(self):
+        """Eliminar callbacks entregados hace más de SENT_RETENTION_DAYS días"""
+        self.env.cr.execute(
+            "DELETE FROM relatic_callback_outbox WHERE state = 'sent' AND sent_at < %s",
+            (fields.Datetime.now() - timedelta(days=SENT_RETENTION_DAYS),)
+        )
+
+    def action_retry(self):
+        """Reprogramar callbacks fallidos para el próximo ciclo del dispatcher"""
+        self.filtered(lambda record: record.state == 'failed').write({
+            'state': 'pending',
+            'attempts': 0,
+            'next_attempt_at': fields.Datetime.now(),
+        })
+        self._trigger_dispatch()
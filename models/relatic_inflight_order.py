@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+import uuid
+
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+# Intervalo de consulta de los requests que esperan a otro en curso
+INFLIGHT_POLL_SECONDS = 0.1
+
+
+class RelaticInflightOrder(models.Model):
+    _name = 'relatic.inflight.order'
+    _description = 'Órdenes Relatic en Proceso (single-flight)'
+    _rec_name = 'order_id'
+
+    # Las filas se insertan y eliminan por SQL en cursores propios
+    # (confirmados al instante), fuera de la transacción del webhook: así los
+    # requests concurrentes de la misma orden las ven mientras el primero
+    # todavía no confirma.
+    order_id = fields.Char(string='Order ID', required=True, readonly=True)
+    token = fields.Char(string='Token', required=True, readonly=True)
+    started_at = fields.Datetime(string='Iniciado en', required=True, readonly=True)
+
+    _sql_constraints = [
+        ('order_id_unique',
+         'UNIQUE(order_id)',
+         'La orden ya está en proceso.')
+    ]
+
+    @api.model
+    def _get_settings(self):
+        """
+        Parámetros de single-flight
+
+        :return: Tupla (espera máxima en ms, segundos tras los que una marca se considera huérfana)
+        """
+        params = self.env['ir.config_parameter'].sudo()
+        return (
+            int(params.get_param('relatic_integration.inflight_wait_ms', '5000')),
+            int(params.get_param('relatic_integration.inflight_stale_seconds', '300')),
+        )
+
+    @api.model
+    def _acquire(self, order_id):
+        """
+        Marcar la orden como en proceso, o esperar al request que ya la procesa
+
+        El primer request inserta la marca y procesa la orden. Los demás
+        esperan (hasta inflight_wait_ms) a que la marca desaparezca, es decir
+        a que el primero confirme o revierta, y vuelven a intentar tomarla:
+        si el primero creó la factura, el pipeline la encuentra y responde
+        already_exists. Una marca más antigua que inflight_stale_seconds
+        (worker caído) se reemplaza.
+
+        :param order_id: Order ID de Relatic
+        :return: Tupla (token o None si se agotó la espera, True si hubo que esperar)
+        """
+        wait_ms, stale_seconds = self._get_settings()
+        deadline = time.monotonic() + wait_ms / 1000.0
+        waited = False
+        while True:
+            token = self._try_insert(order_id, stale_seconds)
+            if token:
+                return token, waited
+            if time.monotonic() >= deadline:
+                _logger.info("Relatic single-flight: espera agotada para la orden %s", order_id)
+                return None, waited
+            waited = True
+            time.sleep(INFLIGHT_POLL_SECONDS)
+
+    @api.model
+    def _try_insert(self, order_id, stale_seconds):
+        """
+        Insertar la marca en un cursor propio (confirmado al salir)
+
+        :return: Token de la marca o None si otro request la tiene
+        """
+        token = uuid.uuid4().hex
+        with self.env.registry.cursor() as cr:
+            cr.execute("""
+                INSERT INTO relatic_inflight_order (order_id, token, started_at)
+                     VALUES (%s, %s, now() AT TIME ZONE 'UTC')
+                ON CONFLICT (order_id) DO UPDATE
+                        SET token = EXCLUDED.token, started_at = EXCLUDED.started_at
+                      WHERE relatic_inflight_order.started_at
+                            < EXCLUDED.started_at - make_interval(secs => %s)
+                  RETURNING token
+            """, (order_id, token, stale_seconds))
+            row = cr.fetchone()
+        return row[0] if row else None
+
+    @api.model
+    def _release(self, order_id, token):
+        """
+        Eliminar la marca (solo si sigue siendo la de este request)
+
+        Se llama después del commit o rollback del webhook, en un cursor propio.
+        """
+        with self.env.registry.cursor() as cr:
+            cr.execute(
+                "DELETE FROM relatic_inflight_order WHERE order_id = %s AND token = %s",
+                (order_id, token)
+            )
@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+from psycopg2 import errors as pg_errors
+
+from odoo import models, fields, api
+
+from ..core.normalization import normalize_email
+
+_logger = logging.getLogger(__name__)
+
+# Diferencia bajo la cual una factura se considera saldada
+PAID_TOLERANCE = 0.01
+
+# Recálculo: emails por transacción e intentos ante conflictos con escrituras en vivo
+REBUILD_BATCH_SIZE = 500
+REBUILD_MAX_ATTEMPTS = 3
+TRANSIENT_ERRORS = (pg_errors.DeadlockDetected, pg_errors.SerializationFailure, pg_errors.LockNotAvailable)
+
+
+class RelaticMemberSummary(models.Model):
+    _name = 'relatic.member.summary'
+    _description = 'Resumen de Cuenta de Miembro Relatic'
+    _order = 'write_date desc'
+    _rec_name = 'email'
+
+    # Las filas se actualizan por SQL (INSERT ... ON CONFLICT) con deltas
+    # desde los servicios de factura, pago y reembolso, dentro de la misma
+    # transacción que los asientos: el portal lee el resumen con una sola
+    # búsqueda por el índice único de email, sin recorrer account_move_line.
+    email = fields.Char(string='Email', required=True, readonly=True)
+    partner_id = fields.Many2one(
+        'res.partner',
+        string='Contacto',
+        readonly=True,
+        ondelete='set null'
+    )
+    invoice_count = fields.Integer(string='Facturas', readonly=True)
+    open_invoice_count = fields.Integer(string='Facturas Abiertas', readonly=True)
+    total_billed = fields.Float(string='Total Facturado', digits=(16, 2), readonly=True)
+    total_paid = fields.Float(string='Total Pagado', digits=(16, 2), readonly=True)
+    total_refunded = fields.Float(string='Total Reembolsado', digits=(16, 2), readonly=True)
+    balance = fields.Float(
+        string='Saldo Pendiente',
+        digits=(16, 2),
+        readonly=True,
+        help='Facturado - pagado - reembolsado (negativo = saldo a favor del miembro)'
+    )
+    last_payment_date = fields.Date(string='Último Pago', readonly=True)
+    last_payment_amount = fields.Float(string='Monto Último Pago', digits=(16, 2), readonly=True)
+    last_payment_reference = fields.Char(string='Referencia Último Pago', readonly=True)
+
+    _sql_constraints = [
+        ('email_unique',
+         'UNIQUE(email)',
+         'Ya existe un resumen para este email.')
+    ]
+
+    @api.model
+    def _apply_delta(self, partner, invoices=0, open_invoices=0, billed=0.0, paid=0.0, refunded=0.0,
+                     payment_date=None, payment_amount=None, payment_reference=None):
+        """
+        Sumar un movimiento al resumen del miembro (crea la fila si no existe)
+
+        El UPDATE suma sobre el valor de la fila: dos transacciones del mismo
+        miembro nunca pierden un delta (la segunda espera el lock de la fila).
+
+        :param partner: res.partner record (el email es la llave del resumen)
+        :param invoices: Facturas nuevas
+        :param open_invoices: Variación de facturas abiertas (+1 al facturar, -1 al saldar)
+        :param billed: Monto facturado
+        :param paid: Monto pagado
+        :param refunded: Monto reembolsado
+        :param payment_date: Fecha del pago (solo si el delta es un pago)
+        """
+        email = normalize_email(partner.email)
+        if not email:
+            return
+        self.env.cr.execute("""
+            INSERT INTO relatic_member_summary
+                   (email, partner_id, invoice_count, open_invoice_count,
+                    total_billed, total_paid, total_refunded, balance,
+                    last_payment_date, last_payment_amount, last_payment_reference,
+                    create_uid, create_date, write_uid, write_date)
+            VALUES (%(email)s, %(partner_id)s, %(invoices)s, GREATEST(%(open_invoices)s, 0),
+                    %(billed)s, %(paid)s, %(refunded)s, %(billed)s - %(paid)s - %(refunded)s,
+                    %(payment_date)s, %(payment_amount)s, %(payment_reference)s,
+                    %(uid)s, now() AT TIME ZONE 'UTC', %(uid)s, now() AT TIME ZONE 'UTC')
+            ON CONFLICT (email) DO UPDATE
+               SET partner_id = EXCLUDED.partner_id,
+                   invoice_count = relatic_member_summary.invoice_count + EXCLUDED.invoice_count,
+                   open_invoice_count = GREATEST(relatic_member_summary.open_invoice_count + %(open_invoices)s, 0),
+                   total_billed = relatic_member_summary.total_billed + EXCLUDED.total_billed,
+                   total_paid = relatic_member_summary.total_paid + EXCLUDED.total_paid,
+                   total_refunded = relatic_member_summary.total_refunded + EXCLUDED.total_refunded,
+                   balance = relatic_member_summary.balance + EXCLUDED.balance,
+                   last_payment_date = GREATEST(relatic_member_summary.last_payment_date,
+                                                EXCLUDED.last_payment_date),
+                   last_payment_amount = CASE
+                       WHEN EXCLUDED.last_payment_date >= relatic_member_summary.last_payment_date
+                            OR relatic_member_summary.last_payment_date IS NULL
+                       THEN COALESCE(EXCLUDED.last_payment_amount, relatic_member_summary.last_payment_amount)
+                       ELSE relatic_member_summary.last_payment_amount END,
+                   last_payment_reference = CASE
+                       WHEN EXCLUDED.last_payment_date >= relatic_member_summary.last_payment_date
+                            OR relatic_member_summary.last_payment_date IS NULL
+                       THEN COALESCE(EXCLUDED.last_payment_reference, relatic_member_summary.last_payment_reference)
+                       ELSE relatic_member_summary.last_payment_reference END,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+        """, {
+            'email': email,
+            'partner_id': partner.id,
+            'invoices': invoices,
+            'open_invoices': open_invoices,
+            'billed': billed,
+            'paid': paid,
+            'refunded': refunded,
+            'payment_date': payment_date,
+            'payment_amount': payment_amount,
+            'payment_reference': payment_reference,
+            'uid': self.env.uid,
+        })
+        self.invalidate_model()
+
+    @api.model
+    def _apply_invoice(self, invoice):
+        """
+        Registrar una factura confirmada en el resumen de su contacto
+
+        :param invoice: account.move record (factura publicada)
+        """
+        self._apply_delta(invoice.partner_id, invoices=1, open_invoices=1, billed=invoice.amount_total)
+
+    @api.model
+    def _apply_payment(self, partner, amount, payment_date, reference, residual_before):
+        """
+        Registrar un pago en el resumen (también en modo diferido o agregado,
+        aunque la conciliación contable ocurra después en un cron)
+
+        :param partner: res.partner record
+        :param amount: Monto aplicado a la factura
+        :param residual_before: Pendiente de la factura antes del pago
+        """
+        settles = residual_before > PAID_TOLERANCE and amount >= residual_before - PAID_TOLERANCE
+        self._apply_delta(
+            partner,
+            open_invoices=-1 if settles else 0,
+            paid=amount,
+            payment_date=payment_date,
+            payment_amount=amount,
+            payment_reference=reference or None,
+        )
+
+    @api.model
+    def _apply_refund(self, invoice, refund, residual_before, reconcile):
+        """
+        Registrar una nota de crédito en el resumen
+
+        :param invoice: account.move record (factura original)
+        :param refund: account.move record (nota de crédito)
+        :param residual_before: Pendiente de la factura antes del reembolso
+        :param reconcile: Si la nota se concilió contra la factura
+        """
+        settles = reconcile and residual_before > PAID_TOLERANCE
+        self._apply_delta(
+            invoice.partner_id,
+            open_invoices=-1 if settles else 0,
+            refunded=refund.amount_total,
+        )
+
+    @api.model
+    def _get_summary(self, email):
+        """
+        Resumen de un miembro para el portal (una consulta sobre el índice único)
+
+        :param email: Email del miembro (se normaliza)
+        :return: Dict con el resumen o None si el miembro no tiene movimientos
+        """
+        summary = self.search_fetch([('email', '=', normalize_email(email))], [
+            'email', 'partner_id', 'invoice_count', 'open_invoice_count', 'total_billed', 'total_paid',
+            'total_refunded', 'balance', 'last_payment_date', 'last_payment_amount',
+            'last_payment_reference', 'write_date',
+        ], limit=1)
+        if not summary:
+            return None
+        return {
+            'email': summary.email,
+            'partner_id': summary.partner_id.id,
+            'invoice_count': summary.invoice_count,
+            'open_invoice_count': summary.open_invoice_count,
+            'total_billed': summary.total_billed,
+            'total_paid': summary.total_paid,
+            'total_refunded': summary.total_refunded,
+            'balance': summary.balance,
+            'last_payment': {
+                'date': summary.last_payment_date.isoformat(),
+                'amount': summary.last_payment_amount,
+                'reference': summary.last_payment_reference,
+            } if summary.last_payment_date else None,
+            'updated_at': summary.write_date.isoformat(),
+        }
+
+    @api.model
+    def _cron_rebuild(self, batch_size=REBUILD_BATCH_SIZE):
+        """
+        Recalcular todos los resúmenes desde la contabilidad
+
+        Corrige la deriva de operaciones hechas fuera de la integración
+        (pagos manuales, facturas canceladas) y carga los miembros previos
+        al resumen. Los pagos aún sin conciliar (modo diferido o agregado)
+        cuentan como pagados, igual que en la actualización incremental.
+
+        Se recalcula por lotes de emails, cada uno en su propia transacción:
+        un lote que choca con pagos en vivo (serialización, deadlock) se
+        reintenta con un snapshot nuevo y, si sigue fallando, se recorre
+        email por email omitiendo los que siguen en conflicto (el delta en
+        vivo ya los mantiene y el próximo recálculo los corrige).
+
+        :param batch_size: Emails por transacción
+        :return: Dict con estadísticas (rebuilt, deleted, skipped)
+        """
+        self.env.flush_all()
+        self.env.cr.execute("""
+            SELECT DISTINCT lower(trim(p.email))
+              FROM account_move m
+              JOIN res_partner p ON p.id = m.partner_id
+             WHERE m.x_relatic_order_id IS NOT NULL
+               AND m.state = 'posted'
+               AND m.move_type IN ('out_invoice', 'out_refund')
+               AND COALESCE(trim(p.email), '') != ''
+             UNION
+            SELECT email FROM relatic_member_summary
+             ORDER BY 1
+        """)
+        emails = [row[0] for row in self.env.cr.fetchall()]
+
+        stats = {'rebuilt': 0, 'deleted': 0, 'skipped': 0}
+        for start in range(0, len(emails), batch_size):
+            batch = emails[start:start + batch_size]
+            if self._rebuild_batch_with_retry(batch, stats):
+                continue
+            for email in batch:
+                if not self._rebuild_batch_with_retry([email], stats):
+                    stats['skipped'] += 1
+                    _logger.warning("Relatic member summaries: %s omitido por conflicto con escrituras en vivo", email)
+
+        _logger.info(
+            "Relatic member summaries: %(rebuilt)s recalculados, %(deleted)s eliminados, %(skipped)s omitidos",
+            stats
+        )
+        return stats
+
+    @api.model
+    def _rebuild_batch_with_retry(self, emails, stats):
+        """
+        Recalcular un lote en su propia transacción, con reintentos
+
+        :param emails: Emails normalizados del lote
+        :param stats: Dict de estadísticas a actualizar
+        :return: True si el lote se confirmó
+        """
+        for attempt in range(1, REBUILD_MAX_ATTEMPTS + 1):
+            try:
+                with self.env.cr.savepoint():
+                    rebuilt, deleted = self._rebuild_emails(emails)
+            except TRANSIENT_ERRORS as e:
+                _logger.info(
+                    "Relatic member summaries: conflicto en lote de %s emails (intento %s): %s",
+                    len(emails), attempt, e
+                )
+                self.invalidate_model()
+                if not self.env.registry.in_test_mode():
+                    # Transacción nueva: el reintento lee un snapshot posterior al conflicto
+                    self.env.cr.rollback()
+                continue
+            if not self.env.registry.in_test_mode():
+                self.env.cr.commit()
+            stats['rebuilt'] += rebuilt
+            stats['deleted'] += deleted
+            return True
+        return False
+
+    @api.model
+    def _rebuild_emails(self, emails):
+        """
+        Reemplazar los resúmenes de los emails indicados
+
+        Los emails sin facturas ni reembolsos contabilizados (asientos
+        cancelados, contacto sin movimientos) pierden su fila.
+
+        :param emails: Emails normalizados
+        :return: Tupla (recalculados, eliminados)
+        """
+        self.env.cr.execute("""
+            WITH invoices AS (
+                SELECT lower(trim(p.email)) AS email,
+                       MAX(m.partner_id) AS partner_id,
+                       COUNT(*) FILTER (WHERE m.move_type = 'out_invoice') AS invoice_count,
+                       COUNT(*) FILTER (
+                           WHERE m.move_type = 'out_invoice'
+                             AND m.amount_residual > %(tolerance)s
+                             AND NOT EXISTS (SELECT 1 FROM account_move pm
+                                              WHERE pm.x_relatic_invoice_id = m.id
+                                                AND pm.x_relatic_reconcile_pending IS TRUE
+                                                AND pm.state = 'posted')
+                             AND NOT EXISTS (SELECT 1 FROM relatic_payment_aggregate a
+                                              WHERE a.invoice_id = m.id AND a.state = 'pending')
+                       ) AS open_invoice_count,
+                       COALESCE(SUM(m.amount_total) FILTER (WHERE m.move_type = 'out_invoice'), 0) AS total_billed,
+                       COALESCE(SUM(m.amount_total) FILTER (WHERE m.move_type = 'out_refund'), 0) AS total_refunded
+                  FROM account_move m
+                  JOIN res_partner p ON p.id = m.partner_id
+                 WHERE m.x_relatic_order_id IS NOT NULL
+                   AND m.state = 'posted'
+                   AND m.move_type IN ('out_invoice', 'out_refund')
+                   AND lower(trim(p.email)) = ANY(%(emails)s)
+              GROUP BY lower(trim(p.email))
+            ),
+            payments AS (
+                SELECT lower(trim(p.email)) AS email, pm.date, pm.amount_total AS amount, pm.ref AS reference, pm.id
+                  FROM account_move pm
+                  JOIN account_move inv ON inv.id = pm.x_relatic_invoice_id
+                  JOIN res_partner p ON p.id = inv.partner_id
+                 WHERE pm.state = 'posted'
+                   AND lower(trim(p.email)) = ANY(%(emails)s)
+             UNION ALL
+                SELECT lower(trim(p.email)), a.date, a.amount, a.reference, a.id
+                  FROM relatic_payment_aggregate a
+                  JOIN res_partner p ON p.id = a.partner_id
+                 WHERE lower(trim(p.email)) = ANY(%(emails)s)
+            ),
+            paid AS (
+                SELECT email, SUM(amount) AS total_paid FROM payments GROUP BY email
+            ),
+            last_payment AS (
+                SELECT DISTINCT ON (email) email, date, amount, reference
+                  FROM payments
+              ORDER BY email, date DESC, id DESC
+            )
+            INSERT INTO relatic_member_summary
+                   (email, partner_id, invoice_count, open_invoice_count,
+                    total_billed, total_paid, total_refunded, balance,
+                    last_payment_date, last_payment_amount, last_payment_reference,
+                    create_uid, create_date, write_uid, write_date)
+            SELECT i.email, i.partner_id, i.invoice_count, i.open_invoice_count,
+                   i.total_billed, COALESCE(pd.total_paid, 0), i.total_refunded,
+                   i.total_billed - COALESCE(pd.total_paid, 0) - i.total_refunded,
+                   lp.date, lp.amount, lp.reference,
+                   %(uid)s, now() AT TIME ZONE 'UTC', %(uid)s, now() AT TIME ZONE 'UTC'
+              FROM invoices i
+         LEFT JOIN paid pd ON pd.email = i.email
+         LEFT JOIN last_payment lp ON lp.email = i.email
+            ON CONFLICT (email) DO UPDATE
+               SET partner_id = EXCLUDED.partner_id,
+                   invoice_count = EXCLUDED.invoice_count,
+                   open_invoice_count = EXCLUDED.open_invoice_count,
+                   total_billed = EXCLUDED.total_billed,
+                   total_paid = EXCLUDED.total_paid,
+                   total_refunded = EXCLUDED.total_refunded,
+                   balance = EXCLUDED.balance,
+                   last_payment_date = EXCLUDED.last_payment_date,
+                   last_payment_amount = EXCLUDED.last_payment_amount,
+                   last_payment_reference = EXCLUDED.last_payment_reference,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+         RETURNING email
+        """, {'tolerance': PAID_TOLERANCE, 'uid': self.env.uid, 'emails': emails})
+        rebuilt = [row[0] for row in self.env.cr.fetchall()]
+        self.env.cr.execute(
+            "DELETE FROM relatic_member_summary WHERE email = ANY(%s) AND NOT (email = ANY(%s))",
+            (emails, rebuilt)
+        )
+        deleted = self.env.cr.rowcount
+        self.invalidate_model()
+        return len(rebuilt), deleted
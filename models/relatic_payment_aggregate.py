@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from collections import defaultdict
+
+from odoo import models, fields, api, tools
+from odoo.tools.sql import create_index
+
+_logger = logging.getLogger(__name__)
+
+
+class RelaticPaymentAggregate(models.Model):
+    _name = 'relatic.payment.aggregate'
+    _description = 'Pago Relatic pendiente de asiento de liquidación diario'
+    _order = 'date desc, id desc'
+    _rec_name = 'reference'
+
+    invoice_id = fields.Many2one(
+        'account.move',
+        string='Factura',
+        required=True,
+        ondelete='restrict'
+    )
+
+    partner_id = fields.Many2one(
+        'res.partner',
+        string='Contacto',
+        required=True,
+        ondelete='restrict'
+    )
+
+    journal_id = fields.Many2one(
+        'account.journal',
+        string='Diario',
+        required=True,
+        ondelete='restrict'
+    )
+
+    receivable_account_id = fields.Many2one(
+        'account.account',
+        string='Cuenta por Cobrar',
+        required=True,
+        ondelete='restrict'
+    )
+
+    amount = fields.Float(string='Monto', digits=(16, 2), required=True)
+    reference = fields.Char(string='Referencia')
+    date = fields.Date(string='Fecha de Pago', required=True)
+
+    state = fields.Selection([
+        ('pending', 'Pendiente'),
+        ('posted', 'Contabilizado'),
+    ], string='Estado', default='pending', required=True)
+
+    move_id = fields.Many2one(
+        'account.move',
+        string='Asiento de Liquidación',
+        index='btree_not_null',
+        readonly=True,
+        ondelete='set null'
+    )
+
+    move_line_id = fields.Many2one(
+        'account.move.line',
+        string='Línea por Cobrar',
+        readonly=True,
+        ondelete='set null'
+    )
+
+    settlement_id = fields.Many2one(
+        'relatic.settlement.import',
+        string='Liquidación',
+        index='btree_not_null',
+        readonly=True,
+        ondelete='set null',
+        help='Archivo de liquidación del proveedor en que apareció este pago'
+    )
+
+    def init(self):
+        # El cron solo recorre pendientes agrupados por diario y fecha
+        create_index(
+            self.env.cr,
+            'relatic_payment_aggregate_pending_idx',
+            self._table,
+            ['journal_id', 'date'],
+            where="state = 'pending'",
+        )
+
+    @api.model
+    def _is_enabled(self):
+        """
+        Modo agregado activo
+
+        :return: True si los pagos se consolidan en un asiento diario por diario
+        """
+        return self.env['ir.config_parameter'].sudo().get_param(
+            'relatic_integration.payment_aggregation',
+            'False'
+        ) == 'True'
+
+    @api.model
+    def _cron_post_daily_settlements(self, include_today=False):
+        """
+        Crear un asiento de liquidación por diario y día con los pagos pendientes
+
+        El lado banco se consolida en una sola línea; cada pago conserva su
+        línea por cobrar y se concilia individualmente con su factura.
+
+        :param include_today: Si es True, también liquida el día en curso
+        :return: account.move recordset con los asientos creados
+        """
+        domain = [('state', '=', 'pending')]
+        if not include_today:
+            domain.append(('date', '<', fields.Date.context_today(self)))
+
+        groups = defaultdict(lambda: self.browse())
+        for aggregate in self.search(domain, order='journal_id, date, id'):
+            groups[(aggregate.journal_id, aggregate.date)] |= aggregate
+
+        moves = self.env['account.move']
+        for (journal, date), aggregates in groups.items():
+            # Un grupo con diario/cuenta mal configurados o un error de
+            # conciliación queda pendiente para la próxima ejecución sin
+            # detener los demás
+            try:
+                with self.env.cr.savepoint():
+                    moves |= aggregates._post_settlement(journal, date)
+            except Exception:
+                _logger.exception(
+                    "Relatic daily settlements: no se pudo liquidar %s pagos de %s del %s",
+                    len(aggregates), journal.name, date
+                )
+                continue
+            if not self.env.registry.in_test_mode():
+                self.env.cr.commit()
+
+        if moves:
+            _logger.info("Relatic daily settlements: %s", self.get_ledger_reduction_report())
+        return moves
+
+    def _post_settlement(self, journal, date):
+        """
+        Contabilizar un asiento de liquidación para los pagos de self
+
+        :param journal: account.journal record
+        :param date: Fecha del asiento
+        :return: account.move record
+        """
+        line_vals = [(0, 0, {
+            'account_id': journal.default_account_id.id,
+            'debit': sum(self.mapped('amount')),
+            'credit': 0.0,
+            'name': f"Liquidación Relatic {journal.name} {date}",
+        })]
+        for aggregate in self:
+            line_vals.append((0, 0, {
+                'account_id': aggregate.receivable_account_id.id,
+                'debit': 0.0,
+                'credit': aggregate.amount,
+                'partner_id': aggregate.partner_id.id,
+                'name': f"Pago {aggregate.reference or ''} - {aggregate.invoice_id.name}",
+            }))
+
+        move = self.env['account.move'].create({
+            'move_type': 'entry',
+            'date': date,
+            'journal_id': journal.id,
+            'ref': f"Liquidación Relatic {date}",
+            'line_ids': line_vals,
+        })
+        move.action_post()
+
+        # Las líneas se crean en el mismo orden que los pagos
+        receivable_lines = move.line_ids.filtered(lambda l: l.credit).sorted('id')
+        pairs = []
+        for aggregate, line in zip(self, receivable_lines):
+            aggregate.write({
+                'state': 'posted',
+                'move_id': move.id,
+                'move_line_id': line.id,
+            })
+            pairs.append((aggregate.invoice_id, line))
+
+        self.env['relatic.reconcile.service'].reconcile_pairs(pairs)
+        return move
+
+    @api.model
+    def get_ledger_reduction_report(self, date_from=None, date_to=None):
+        """
+        Reducción de filas en account_move / account_move_line del modo agregado
+
+        Sin agregación cada pago genera 1 asiento y 2 líneas; con agregación
+        cada diario/día genera 1 asiento con 1 línea banco + 1 línea por pago.
+
+        :param date_from: Fecha inicial (opcional)
+        :param date_to: Fecha final (opcional)
+        :return: Dict con filas esperadas, filas reales y reducción
+        """
+        domain = [('state', '=', 'posted')]
+        if date_from:
+            domain.append(('date', '>=', date_from))
+        if date_to:
+            domain.append(('date', '<=', date_to))
+
+        groups = self._read_group(domain, ['move_id'], ['__count'])
+        payments = sum(count for dummy, count in groups)
+        settlement_moves = len(groups)
+
+        moves_without = payments
+        lines_without = payments * 2
+        lines_with = payments + settlement_moves
+        rows_without = moves_without + lines_without
+        rows_with = settlement_moves + lines_with
+        return {
+            'payments': payments,
+            'moves_without_aggregation': moves_without,
+            'moves_with_aggregation': settlement_moves,
+            'lines_without_aggregation': lines_without,
+            'lines_with_aggregation': lines_with,
+            'rows_saved': rows_without - rows_with,
+            'reduction_pct': round(100.0 * (rows_without - rows_with) / rows_without, 2) if rows_without else 0.0,
+        }
+
+
+class RelaticPaymentAggregateReport(models.Model):
+    _name = 'relatic.payment.aggregate.report'
+    _description = 'Reporte de Reducción de Filas Contables Relatic'
+    _auto = False
+    _order = 'date desc'
+
+    date = fields.Date(string='Fecha', readonly=True)
+    journal_id = fields.Many2one('account.journal', string='Diario', readonly=True)
+    payment_count = fields.Integer(string='Pagos', readonly=True)
+    move_count = fields.Integer(string='Asientos Creados', readonly=True)
+    lines_without_aggregation = fields.Integer(string='Líneas sin Agregación', readonly=True)
+    lines_with_aggregation = fields.Integer(string='Líneas con Agregación', readonly=True)
+    rows_saved = fields.Integer(string='Filas Ahorradas', readonly=True)
+
+    def init(self):
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        self.env.cr.execute(f"""
+            CREATE OR REPLACE VIEW {self._table} AS (
+                SELECT MIN(a.id) AS id,
+                       a.date,
+                       a.journal_id,
+                       COUNT(*) AS payment_count,
+                       COUNT(DISTINCT a.move_id) AS move_count,
+                       COUNT(*) * 2 AS lines_without_aggregation,
+                       COUNT(*) + COUNT(DISTINCT a.move_id) AS lines_with_aggregation,
+                       (COUNT(*) * 3) - (COUNT(*) + COUNT(DISTINCT a.move_id) * 2) AS rows_saved
+                  FROM relatic_payment_aggregate a
+                 WHERE a.state = 'posted'
+              GROUP BY a.date, a.journal_id
+            )
+        """)
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+import io
+
+from odoo import models, fields
+from odoo.exceptions import UserError
+
+
+class RelaticSettlementImport(models.Model):
+    _name = 'relatic.settlement.import'
+    _description = 'Importación de Liquidación de Proveedor de Pago'
+    _order = 'id desc'
+
+    name = fields.Char(
+        string='Nombre',
+        required=True,
+        help='Nombre de la liquidación (ej: YAPPY 2026-01-20)'
+    )
+
+    journal_id = fields.Many2one(
+        'account.journal',
+        string='Diario',
+        required=True,
+        domain=[('type', '=', 'bank')],
+        help='Diario de los pagos Relatic liquidados (YAPPY, TARJETA, ...)'
+    )
+
+    settlement_account_id = fields.Many2one(
+        'account.account',
+        string='Cuenta Banco Liquidación',
+        help='Si se indica y la cuenta del diario es conciliable, se crea un asiento '
+             'de liquidación por bloque y se concilia el lado banco de cada pago'
+    )
+
+    date = fields.Date(
+        string='Fecha',
+        default=fields.Date.today,
+        required=True
+    )
+
+    file = fields.Binary(
+        string='Archivo CSV',
+        attachment=True
+    )
+
+    filename = fields.Char(string='Nombre de Archivo')
+
+    state = fields.Selection([
+        ('draft', 'Borrador'),
+        ('done', 'Procesado'),
+    ], string='Estado', default='draft', required=True, readonly=True)
+
+    row_count = fields.Integer(string='Filas', readonly=True)
+    matched_count = fields.Integer(string='Conciliadas', readonly=True)
+    unmatched_count = fields.Integer(string='Sin Match', readonly=True)
+    reconciled_count = fields.Integer(string='Conciliadas en Banco', readonly=True)
+
+    processing_time = fields.Float(
+        string='Tiempo Procesamiento (seg)',
+        digits=(16, 3),
+        readonly=True
+    )
+
+    line_ids = fields.One2many(
+        'relatic.settlement.import.line',
+        'import_id',
+        string='Filas sin Match',
+        readonly=True
+    )
+
+    def action_import(self):
+        """Procesar el archivo adjunto leyéndolo en streaming desde el filestore"""
+        for record in self:
+            if record.state != 'draft':
+                raise UserError(f'La liquidación {record.name} ya fue procesada')
+
+            attachment = self.env['ir.attachment'].sudo().search([
+                ('res_model', '=', record._name),
+                ('res_id', '=', record.id),
+                ('res_field', '=', 'file'),
+            ], limit=1)
+            if not attachment:
+                raise UserError('Adjunte el archivo CSV de liquidación')
+
+            if attachment.store_fname:
+                stream = open(attachment._full_path(attachment.store_fname), 'rb')
+            else:
+                stream = io.BytesIO(attachment.raw)
+
+            with stream:
+                record.import_stream(stream)
+        return True
+
+    def import_stream(self, stream, **kwargs):
+        """
+        Procesar un archivo de liquidación ya abierto
+
+        :param stream: Archivo binario con el CSV
+        :param kwargs: Opciones de relatic.settlement.service.match_settlement_file
+        :return: Dict con contadores
+        """
+        self.ensure_one()
+        stats = self.env['relatic.settlement.service'].match_settlement_file(self, stream, **kwargs)
+        self.write({
+            'state': 'done',
+            'row_count': stats['rows'],
+            'matched_count': stats['matched'],
+            'unmatched_count': stats['unmatched'],
+            'reconciled_count': stats['reconciled'],
+            'processing_time': stats['duration'],
+        })
+        return stats
+
+
+class RelaticSettlementImportLine(models.Model):
+    _name = 'relatic.settlement.import.line'
+    _description = 'Fila sin Match de Liquidación'
+    _order = 'import_id, row_number'
+
+    import_id = fields.Many2one(
+        'relatic.settlement.import',
+        string='Liquidación',
+        required=True,
+        index=True,
+        ondelete='cascade'
+    )
+
+    row_number = fields.Integer(string='Fila')
+    reference = fields.Char(string='Referencia', index=True)
+    amount = fields.Float(string='Monto', digits=(16, 2))
+    date = fields.Date(string='Fecha')
+
+    reason = fields.Selection([
+        ('not_found', 'Referencia no encontrada'),
+        ('amount_mismatch', 'Monto no coincide'),
+        ('date_mismatch', 'Fecha fuera de tolerancia'),
+        ('invalid_row', 'Fila inválida'),
+    ], string='Motivo', required=True)
+
+    raw_data = fields.Char(string='Datos Originales')
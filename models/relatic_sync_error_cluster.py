@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import logging
+import re
+
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+# Normalización de mensajes: el orden importa (primero lo más específico)
+TEMPLATE_PATTERNS = [
+    (re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}', re.I), '<uuid>'),
+    (re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+'), '<email>'),
+    (re.compile(r"'[^']*'|\"[^\"]*\""), "'<val>'"),
+    (re.compile(r'\b[A-Za-z]+[\w]*[-/_][\w/-]*\d[\w/-]*'), '<id>'),
+    (re.compile(r'-?\d+(?:[.,]\d+)+'), '<amount>'),
+    (re.compile(r'\d+'), '<n>'),
+    (re.compile(r'\s+'), ' '),
+]
+
+# Logs sin hash de plantilla (anteriores a la agrupación) normalizados por ejecución
+BACKFILL_BATCH_SIZE = 5000
+
+# Watermark por transacción (ver relatic.sync.stats.daily._cron_refresh)
+WATERMARK_PARAM = 'relatic_integration.error_cluster_watermark_txid'
+
+# Los logs nuevos ya nacen con hash: una vez vacío el histórico no se vuelve a buscar
+BACKFILL_DONE_PARAM = 'relatic_integration.error_cluster_backfill_done'
+
+
+class RelaticSyncErrorCluster(models.Model):
+    _name = 'relatic.sync.error.cluster'
+    _description = 'Grupo de Errores de Sincronización Relatic'
+    _order = 'open_count desc, last_seen desc'
+    _rec_name = 'template'
+
+    template_hash = fields.Char(string='Hash Plantilla', required=True, readonly=True)
+    error_code = fields.Char(string='Código de Error', readonly=True)
+    template = fields.Text(
+        string='Plantilla',
+        readonly=True,
+        help='Mensaje de error sin ids, montos, emails ni valores entre comillas'
+    )
+    sample_order_id = fields.Char(string='Orden de Ejemplo', readonly=True)
+    log_count = fields.Integer(string='Logs', readonly=True)
+    open_count = fields.Integer(
+        string='Abiertos',
+        readonly=True,
+        help='Logs del grupo que siguen en error o reintento'
+    )
+    first_seen = fields.Datetime(string='Primera Vez', readonly=True)
+    last_seen = fields.Datetime(string='Última Vez', readonly=True)
+
+    _sql_constraints = [
+        ('template_hash_unique',
+         'UNIQUE(template_hash)',
+         'Ya existe un grupo para esta plantilla de error.')
+    ]
+
+    @api.model
+    def _normalize_message(self, error_message):
+        """
+        Plantilla de un mensaje de error (sin ids, montos ni valores)
+
+        :param error_message: Mensaje original
+        :return: str normalizado
+        """
+        template = error_message or ''
+        for pattern, replacement in TEMPLATE_PATTERNS:
+            template = pattern.sub(replacement, template)
+        return template.strip()[:500]
+
+    @api.model
+    def _template_hash(self, error_code, error_message):
+        """
+        Llave del grupo de un error: código + plantilla normalizada
+
+        :return: str hash SHA256 o False si no hay error
+        """
+        if not error_code and not error_message:
+            return False
+        template = self._normalize_message(error_message)
+        return hashlib.sha256(f'{error_code or ""}|{template}'.encode('utf-8')).hexdigest()
+
+    @api.model
+    def _cron_refresh(self):
+        """
+        Recalcular los grupos de errores tocados desde la última ejecución
+
+        Primero asigna hash de plantilla a los logs en error que no lo
+        tienen (datos anteriores). Luego, con el mismo watermark por
+        transacción que las estadísticas diarias (change_txid), solo se
+        reagregan las plantillas con logs escritos desde la ejecución
+        anterior. Sin watermark (primera ejecución) se recalculan todas.
+
+        :return: Número de grupos recalculados
+        """
+        self._backfill_template_hashes()
+
+        params = self.env['ir.config_parameter'].sudo()
+        watermark = params.get_param(WATERMARK_PARAM)
+        self.env['relatic.sync.log'].flush_model()
+        self.env.cr.execute("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+        horizon = self.env.cr.fetchone()[0]
+
+        if watermark:
+            self.env.cr.execute("""
+                SELECT DISTINCT error_template_hash FROM relatic_sync_log
+                 WHERE change_txid >= %s AND error_template_hash IS NOT NULL
+            """, (int(watermark),))
+            hashes = [row[0] for row in self.env.cr.fetchall()]
+        else:
+            self.flush_model()
+            self.env.cr.execute("""
+                SELECT DISTINCT error_template_hash FROM relatic_sync_log
+                 WHERE error_template_hash IS NOT NULL
+                 UNION
+                SELECT template_hash FROM relatic_sync_error_cluster
+            """)
+            hashes = [row[0] for row in self.env.cr.fetchall()]
+
+        count = self._refresh_hashes(hashes)
+        params.set_param(WATERMARK_PARAM, str(horizon))
+        return count
+
+    @api.model
+    def _refresh_hashes(self, hashes):
+        """
+        Reagregar conteos y primera/última aparición de las plantillas indicadas
+
+        GROUP BY sobre el índice parcial de error_template_hash; las
+        plantillas que ya no tienen logs (archivados) se eliminan.
+
+        :param hashes: Lista de hashes de plantilla
+        :return: Número de grupos actualizados
+        """
+        if not hashes:
+            return 0
+        self.env['relatic.sync.log'].flush_model()
+        self.env.cr.execute("""
+            SELECT error_template_hash, COUNT(*),
+                   COUNT(*) FILTER (WHERE status IN ('error', 'retry')),
+                   MIN(received_at), MAX(received_at)
+              FROM relatic_sync_log
+             WHERE error_template_hash = ANY(%s)
+          GROUP BY error_template_hash
+        """, (hashes,))
+        aggregates = self.env.cr.fetchall()
+        found = [row[0] for row in aggregates]
+
+        # Plantilla y orden de ejemplo para los grupos nuevos
+        self.flush_model()
+        self.env.cr.execute(
+            "SELECT template_hash FROM relatic_sync_error_cluster WHERE template_hash = ANY(%s)",
+            (found,)
+        )
+        known = {row[0] for row in self.env.cr.fetchall()}
+        samples = {}
+        new_hashes = [template_hash for template_hash in found if template_hash not in known]
+        if new_hashes:
+            self.env.cr.execute("""
+                SELECT DISTINCT ON (error_template_hash) error_template_hash, error_code, error_message, order_id
+                  FROM relatic_sync_log
+                 WHERE error_template_hash = ANY(%s)
+              ORDER BY error_template_hash, received_at DESC
+            """, (new_hashes,))
+            samples = {row[0]: row[1:] for row in self.env.cr.fetchall()}
+
+        for template_hash, log_count, open_count, first_seen, last_seen in aggregates:
+            error_code, error_message, order_id = samples.get(template_hash, (None, None, None))
+            self.env.cr.execute("""
+                INSERT INTO relatic_sync_error_cluster
+                       (template_hash, error_code, template, sample_order_id,
+                        log_count, open_count, first_seen, last_seen,
+                        create_uid, create_date, write_uid, write_date)
+                VALUES (%(hash)s, %(code)s, %(template)s, %(order_id)s,
+                        %(log_count)s, %(open_count)s, %(first_seen)s, %(last_seen)s,
+                        %(uid)s, now() AT TIME ZONE 'UTC', %(uid)s, now() AT TIME ZONE 'UTC')
+                ON CONFLICT (template_hash) DO UPDATE
+                   SET log_count = EXCLUDED.log_count,
+                       open_count = EXCLUDED.open_count,
+                       first_seen = EXCLUDED.first_seen,
+                       last_seen = EXCLUDED.last_seen,
+                       write_date = EXCLUDED.write_date
+            """, {
+                'hash': template_hash,
+                'code': error_code,
+                'template': self._normalize_message(error_message) if template_hash in samples else None,
+                'order_id': order_id,
+                'log_count': log_count,
+                'open_count': open_count,
+                'first_seen': first_seen,
+                'last_seen': last_seen,
+                'uid': self.env.uid,
+            })
+
+        # Grupos cuyos logs ya fueron archivados
+        gone = sorted(set(hashes) - set(found))
+        if gone:
+            self.env.cr.execute(
+                "DELETE FROM relatic_sync_error_cluster WHERE template_hash = ANY(%s)",
+                (gone,)
+            )
+        self.invalidate_model()
+        return len(aggregates)
+
+    @api.model
+    def _backfill_template_hashes(self, batch_size=BACKFILL_BATCH_SIZE):
+        """
+        Asignar hash de plantilla a logs en error creados antes de la agrupación
+
+        Los logs nuevos reciben el hash al registrar el error, así que al
+        vaciarse el histórico se guarda un flag y la búsqueda (sin índice
+        que la cubra) no vuelve a ejecutarse.
+
+        :return: Número de logs actualizados
+        """
+        params = self.env['ir.config_parameter'].sudo()
+        if params.get_param(BACKFILL_DONE_PARAM):
+            return 0
+
+        self.env['relatic.sync.log'].flush_model()
+        self.env.cr.execute("""
+            SELECT id, error_code, error_message FROM relatic_sync_log
+             WHERE error_template_hash IS NULL
+               AND (error_code IS NOT NULL OR error_message IS NOT NULL)
+             LIMIT %s
+        """, (batch_size,))
+        rows = self.env.cr.fetchall()
+        if len(rows) < batch_size:
+            params.set_param(BACKFILL_DONE_PARAM, 'True')
+        if not rows:
+            return 0
+
+        self.env.cr.execute("""
+            UPDATE relatic_sync_log l
+               SET error_template_hash = v.template_hash
+              FROM (SELECT unnest(%s::int[]) AS id, unnest(%s::varchar[]) AS template_hash) v
+             WHERE l.id = v.id
+        """, (
+            [row[0] for row in rows],
+            [self._template_hash(row[1], row[2]) for row in rows],
+        ))
+        self.env['relatic.sync.log'].invalidate_model(['error_template_hash'])
+        _logger.info("Relatic error clusters: %s logs históricos normalizados", len(rows))
+        return len(rows)
+
+    def action_view_logs(self):
+        """Abrir los logs del grupo"""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': self.error_code or 'Logs',
+            'res_model': 'relatic.sync.log',
+            'view_mode': 'list,form',
+            'domain': [('error_template_hash', '=', self.template_hash)],
+            'context': {'create': False},
+        }
@@ -1,22 +1,41 @@
 # -*- coding: utf-8 -*-
 
 from odoo import models, fields, api
-from odoo.exceptions import ValidationError
+from odoo.tools import config
+from odoo.tools.sql import create_index
+from datetime import timedelta
+import gzip
 import hashlib
 import json
+import logging
+import os
+import random
+
+from ..core.normalization import member_shard
+
+_logger = logging.getLogger(__name__)
+
+# Columnas de la llave de deduplicación
+DEDUP_KEY_FIELDS = ('order_id', 'payload_hash', 'attempt')
+
+# Estados que una reentrega todavía puede avanzar
+OPEN_STATUSES = ('pending', 'retry')
+
+# Tope del backoff exponencial de reprocesos (6 horas)
+MAX_BACKOFF_SECONDS = 6 * 3600
 
 
 class RelaticSyncLog(models.Model):
     _name = 'relatic.sync.log'
     _description = 'Log de Sincronización Relatic'
-    _order = 'create_date desc'
+    _order = 'received_at desc, id desc'
     _rec_name = 'order_id'
 
     # Campos principales
     order_id = fields.Char(
         string='Order ID',
         required=True,
-        index=True,
+        index='trigram',
         help='Identificador único de la orden desde membresia-relatic'
     )
     
@@ -33,14 +52,29 @@ class RelaticSyncLog(models.Model):
         ('retry', 'Reintento'),
     ], string='Estado', required=True, default='pending', index=True)
     
+    attempt = fields.Integer(
+        string='Entrega',
+        default=1,
+        required=True,
+        readonly=True,
+        help='Número de entrega del mismo payload para esta orden (parte de la llave de deduplicación)'
+    )
+    
     retries = fields.Integer(
         string='Reintentos',
         default=0,
         help='Número de intentos de sincronización'
     )
     
+    next_retry_at = fields.Datetime(
+        string='Próximo Reintento',
+        readonly=True,
+        help='Fecha a partir de la cual el motor de reprocesos tomará este log (backoff exponencial)'
+    )
+    
     error_message = fields.Text(
         string='Mensaje de Error',
+        index='trigram',
         help='Mensaje detallado del error si ocurrió'
     )
     
@@ -49,6 +83,12 @@ class RelaticSyncLog(models.Model):
         help='Código estándar del error (ej: PRODUCT_NOT_FOUND)'
     )
     
+    error_template_hash = fields.Char(
+        string='Hash Plantilla de Error',
+        readonly=True,
+        help='Llave del grupo de errores (código + mensaje sin ids ni montos)'
+    )
+    
     # Relaciones
     partner_id = fields.Many2one(
         'res.partner',
@@ -73,6 +113,14 @@ class RelaticSyncLog(models.Model):
         help='Movimiento contable del pago registrado'
     )
     
+    payment_aggregate_id = fields.Many2one(
+        'relatic.payment.aggregate',
+        string='Pago Agregado',
+        compute='_compute_payment_aggregate_id',
+        help='Modo agregado: el pago no tiene asiento propio; la factura queda sin pagar hasta que '
+             'el cron diario crea el asiento de liquidación y la concilia'
+    )
+    
     # Metadata
     payload_version = fields.Char(
         string='Versión Payload',
@@ -91,17 +139,31 @@ class RelaticSyncLog(models.Model):
         ('dev', 'Desarrollo'),
     ], string='Ambiente', help='Ambiente del sistema origen')
     
+    member_shard = fields.Integer(
+        string='Shard Miembro',
+        readonly=True,
+        help='Hash del email normalizado del miembro: los reprocesos de un mismo miembro van al mismo worker'
+    )
+    
     processing_time = fields.Float(
         string='Tiempo Procesamiento (seg)',
         digits=(16, 3),
         help='Tiempo total de procesamiento en segundos'
     )
     
+    tx_attempts = fields.Integer(
+        string='Intentos de Transacción',
+        default=1,
+        readonly=True,
+        help='Ejecuciones de la transacción del webhook (>1 si hubo deadlocks o fallas de serialización)'
+    )
+    
     # Campos calculados
     invoice_number = fields.Char(
         string='Número de Factura',
         related='invoice_id.name',
         store=True,
+        precompute=True,
         readonly=True
     )
     
@@ -109,10 +171,31 @@ class RelaticSyncLog(models.Model):
         string='Nombre Contacto',
         related='partner_id.name',
         store=True,
+        precompute=True,
         readonly=True
     )
     
+    payload_json = fields.Text(
+        string='Payload',
+        compute='_compute_payload_json',
+        help='Payload original descomprimido (se carga solo al abrir el registro)'
+    )
+    
     # Timestamps
+    profiled = fields.Boolean(
+        string='Perfilado',
+        readonly=True,
+        help='El request superó el umbral de latencia y tiene un perfil adjunto'
+    )
+    
+    profile_attachment_ids = fields.One2many(
+        'ir.attachment',
+        'res_id',
+        string='Perfiles',
+        domain=[('res_model', '=', 'relatic.sync.log')],
+        readonly=True,
+    )
+    
     received_at = fields.Datetime(
         string='Recibido en',
         default=fields.Datetime.now,
@@ -126,40 +209,181 @@ class RelaticSyncLog(models.Model):
         help='Fecha y hora en que se completó el procesamiento'
     )
 
+    _sql_constraints = [
+        ('dedup_key_unique',
+         'UNIQUE(order_id, payload_hash, attempt)',
+         'Ya existe un log para esta orden, payload y número de entrega.')
+    ]
+
+    def init(self):
+        # Orden de la vista lista y barrido de retención por rango de fecha
+        create_index(
+            self.env.cr,
+            'relatic_sync_log_received_at_id_idx',
+            self._table,
+            ['received_at', 'id'],
+        )
+        # Watermark de los crons incrementales: id de la transacción que
+        # insertó o modificó la fila, asignado por trigger (cubre también
+        # los INSERT/UPDATE por SQL que no pasan por el ORM)
+        self.env.cr.execute(f'ALTER TABLE "{self._table}" ADD COLUMN IF NOT EXISTS change_txid bigint')
+        self.env.cr.execute("""
+            CREATE OR REPLACE FUNCTION relatic_sync_log_set_change_txid() RETURNS trigger AS $$
+            BEGIN
+                NEW.change_txid := txid_current();
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql
+        """)
+        self.env.cr.execute(f'DROP TRIGGER IF EXISTS relatic_sync_log_change_txid ON "{self._table}"')
+        self.env.cr.execute(f"""
+            CREATE TRIGGER relatic_sync_log_change_txid
+            BEFORE INSERT OR UPDATE ON "{self._table}"
+            FOR EACH ROW EXECUTE FUNCTION relatic_sync_log_set_change_txid()
+        """)
+        self.env.cr.execute('DROP INDEX IF EXISTS relatic_sync_log_write_date_idx')
+        create_index(
+            self.env.cr,
+            'relatic_sync_log_change_txid_idx',
+            self._table,
+            ['change_txid'],
+        )
+        # Índice parcial: los escaneos de reintento solo tocan logs abiertos
+        create_index(
+            self.env.cr,
+            'relatic_sync_log_open_status_idx',
+            self._table,
+            ['status', 'id'],
+            where="status IN ('pending', 'retry')",
+        )
+        # Agrupación de errores: solo indexa logs que alguna vez fallaron
+        create_index(
+            self.env.cr,
+            'relatic_sync_log_error_template_hash_idx',
+            self._table,
+            ['error_template_hash'],
+            where='error_template_hash IS NOT NULL',
+        )
+
+    def _compute_payment_aggregate_id(self):
+        aggregates = self.env['relatic.payment.aggregate'].search([
+            ('invoice_id', 'in', self.invoice_id.ids),
+        ])
+        by_invoice = {aggregate.invoice_id.id: aggregate for aggregate in aggregates}
+        for log in self:
+            log.payment_aggregate_id = by_invoice.get(log.invoice_id.id, False)
+
+    def _compute_payload_json(self):
+        payloads = self.env['relatic.sync.payload']._load_many(self.mapped('payload_hash'))
+        for record in self:
+            payload = payloads.get(record.payload_hash)
+            record.payload_json = json.dumps(payload, indent=2, ensure_ascii=False) if payload else False
+
+    def get_payload(self):
+        """
+        Payload original del log para reprocesarlo
+        
+        :return: dict con el payload o None si no está guardado
+        """
+        self.ensure_one()
+        return self.env['relatic.sync.payload']._load(self.payload_hash)
+
     @api.model
-    def create_log(self, order_id, payload, status='pending', **kwargs):
+    def create_log(self, order_id, payload, status='pending', attempt=1, **kwargs):
         """
         Método helper para crear un log de sincronización
         
+        La llave de deduplicación es (order_id, payload_hash, attempt), con
+        attempt tomado de la entrega (contador de reintentos de
+        membresia-relatic). Una reentrega idéntica con el mismo attempt no
+        crea otro log: retorna el existente, sin retroceder un resultado
+        final (success/error) a pending.
+        
         :param order_id: ID de la orden
         :param payload: Diccionario con el payload recibido
         :param status: Estado inicial ('pending', 'success', 'error', 'retry')
+        :param attempt: Número de entrega informado por el origen (1 si no lo envía)
         :param kwargs: Campos adicionales (partner_id, invoice_id, etc.)
-        :return: registro creado
+        :return: registro creado o existente
         """
         # Calcular hash del payload
         payload_json = json.dumps(payload, sort_keys=True, separators=(',', ':'))
         payload_hash = hashlib.sha256(payload_json.encode('utf-8')).hexdigest()
         
+        # Guardar payload comprimido (una sola vez por hash) para reprocesos
+        self.env['relatic.sync.payload']._store(payload_hash, payload_json)
+        
         # Extraer metadata del payload si existe
         meta = payload.get('meta', {})
         
         values = {
             'order_id': order_id,
             'payload_hash': payload_hash,
+            'attempt': attempt or 1,
             'status': status,
+            'retries': 0,
+            'tx_attempts': 1,
             'payload_version': meta.get('version'),
             'source': meta.get('source', 'membresia-relatic'),
             'environment': meta.get('environment'),
+            'member_shard': member_shard((payload.get('member') or {}).get('email')),
+            'received_at': fields.Datetime.now(),
             **kwargs
         }
         
-        return self.create(values)
+        log_id = self._insert_dedup(values)
+        if log_id:
+            return self.browse(log_id)
+        
+        # Reentrega de la misma entrega: el log existente conserva su
+        # resultado; solo avanza si seguía abierto (pending/retry) y la
+        # reentrega trae un resultado
+        self.env.cr.execute(
+            "SELECT id FROM relatic_sync_log WHERE order_id = %s AND payload_hash = %s AND attempt = %s",
+            (order_id, payload_hash, values['attempt'])
+        )
+        log = self.browse(self.env.cr.fetchone()[0])
+        if log.status in OPEN_STATUSES and status != 'pending':
+            log.write(dict(kwargs, status=status))
+        return log
+
+    @api.model
+    def _insert_dedup(self, values):
+        """
+        Insertar el log con INSERT ... ON CONFLICT DO NOTHING sobre la llave única
+        
+        Un solo INSERT, sin lookup previo ni excepciones: si la llave ya
+        existe (reentrega o entrega concurrente) no se inserta nada.
+        
+        :param values: Valores del log (columnas almacenadas)
+        :return: ID insertado o None si la llave ya existía
+        """
+        # Campos related almacenados (precompute) que el ORM calcularía al crear
+        if values.get('invoice_id'):
+            values['invoice_number'] = self.env['account.move'].browse(values['invoice_id']).name
+        if values.get('partner_id'):
+            values['partner_name'] = self.env['res.partner'].browse(values['partner_id']).name
+        
+        self.flush_model(list(DEDUP_KEY_FIELDS))
+        columns = list(values)
+        params = [self._fields[name].convert_to_column_insert(values[name], self, values) for name in columns]
+        self.env.cr.execute(f"""
+            INSERT INTO relatic_sync_log
+                   ({', '.join(f'"{name}"' for name in columns)}, create_uid, create_date, write_uid, write_date)
+            VALUES ({', '.join(['%s'] * len(columns))}, %s, now() AT TIME ZONE 'UTC', %s, now() AT TIME ZONE 'UTC')
+            ON CONFLICT (order_id, payload_hash, attempt) DO NOTHING
+            RETURNING id
+        """, params + [self.env.uid, self.env.uid])
+        row = self.env.cr.fetchone()
+        return row[0] if row else None
 
     def mark_success(self, partner_id=None, invoice_id=None, payment_move_id=None, processing_time=0.0):
         """
         Marcar log como exitoso
         
+        Si hay callback_url configurado, encola el callback de estado en la
+        misma transacción.
+        
         :param partner_id: ID del contacto creado/actualizado
         :param invoice_id: ID de la factura creada
         :param payment_move_id: ID del movimiento de pago
@@ -171,24 +395,113 @@ class RelaticSyncLog(models.Model):
             'invoice_id': invoice_id,
             'payment_move_id': payment_move_id,
             'processing_time': processing_time,
+            'next_retry_at': False,
             'processed_at': fields.Datetime.now(),
         })
+        self.env['relatic.callback.outbox']._enqueue(self)
 
     def mark_error(self, error_code, error_message, retry=False):
         """
         Marcar log como error
         
+        Con retry=True el log queda programado para el motor de reprocesos
+        con backoff exponencial según `retries`; al superar el máximo de
+        reintentos configurado queda como 'error'.
+        
         :param error_code: Código del error
         :param error_message: Mensaje del error
         :param retry: Si es True, marca como 'retry', sino como 'error'
         """
-        self.write({
+        self.write(self._prepare_error_values(error_code, error_message, retry, self.retries + 1))
+        self.env['relatic.callback.outbox']._enqueue(self)
+
+    @api.model
+    def _prepare_error_values(self, error_code, error_message, retry, retries):
+        """
+        Valores de un log en error, con el próximo reintento programado
+        
+        :param retries: Número de reintentos tras este error
+        :return: Dict de valores
+        """
+        params = self.env['ir.config_parameter'].sudo()
+        max_retries = int(params.get_param('relatic_integration.replay_max_retries', '8'))
+        if retry and retries > max_retries:
+            retry = False
+        
+        next_retry_at = False
+        if retry:
+            base = int(params.get_param('relatic_integration.replay_backoff_seconds', '60'))
+            delay = min(base * 2 ** (retries - 1), MAX_BACKOFF_SECONDS)
+            # Jitter ±10% para no reprocesar en ráfaga tras un incidente
+            next_retry_at = fields.Datetime.now() + timedelta(seconds=delay * random.uniform(0.9, 1.1))
+        
+        return {
             'status': 'retry' if retry else 'error',
             'error_code': error_code,
             'error_message': error_message,
-            'retries': self.retries + 1,
+            'error_template_hash': self.env['relatic.sync.error.cluster']._template_hash(error_code, error_message),
+            'retries': retries,
+            'next_retry_at': next_retry_at,
             'processed_at': fields.Datetime.now(),
-        })
+        }
+
+    @api.model
+    def _is_single_write(self):
+        """
+        Modo de escritura de logs
+        
+        :return: True si el log se inserta una sola vez al final del request
+        """
+        return self.env['ir.config_parameter'].sudo().get_param(
+            'relatic_integration.log_mode',
+            'two_phase'
+        ) == 'single_write'
+
+    @api.model
+    def record_success(self, payload, partner_id=None, invoice_id=None, payment_move_id=None, processing_time=0.0,
+                       tx_attempts=1, attempt=1):
+        """
+        Insertar el log ya exitoso en una sola escritura (modo single_write)
+        
+        :param payload: Diccionario con el payload recibido
+        :param tx_attempts: Ejecuciones de la transacción del webhook
+        :param attempt: Número de entrega informado por el origen
+        :return: registro creado (o el existente si es la misma entrega)
+        """
+        log = self.create_log(
+            order_id=payload.get('order_id'),
+            payload=payload,
+            status='success',
+            partner_id=partner_id,
+            invoice_id=invoice_id,
+            payment_move_id=payment_move_id,
+            processing_time=processing_time,
+            tx_attempts=tx_attempts,
+            attempt=attempt,
+            processed_at=fields.Datetime.now(),
+        )
+        self.env['relatic.callback.outbox']._enqueue(log)
+        return log
+
+    @api.model
+    def record_error(self, payload, error_code, error_message, retry=False, tx_attempts=1, attempt=1):
+        """
+        Insertar el log de un request fallido en una sola escritura (modo single_write)
+        
+        Es el único marcador persistente del modo single_write: solo los
+        requests que fallan dejan rastro para el motor de reprocesos.
+        
+        :param payload: Diccionario con el payload recibido
+        :param tx_attempts: Ejecuciones de la transacción del webhook
+        :param attempt: Número de entrega informado por el origen
+        :return: registro creado (o el existente si es la misma entrega)
+        """
+        values = self._prepare_error_values(error_code, error_message, retry, 1)
+        log = self.create_log(
+            order_id=payload.get('order_id'), payload=payload, tx_attempts=tx_attempts, attempt=attempt, **values
+        )
+        self.env['relatic.callback.outbox']._enqueue(log)
+        return log
 
     def increment_retry(self):
         """Incrementar contador de reintentos"""
@@ -197,19 +510,95 @@ class RelaticSyncLog(models.Model):
             'status': 'retry',
         })
 
-    @api.constrains('order_id')
-    def _check_order_id_unique(self):
-        """Validar que no haya duplicados por order_id en mismo día"""
-        for record in self:
-            if self.search_count([
-                ('order_id', '=', record.order_id),
-                ('id', '!=', record.id),
-                ('create_date', '>=', fields.Datetime.today()),
-            ]) > 0:
-                raise ValidationError(
-                    f'Ya existe un log para la orden {record.order_id} hoy. '
-                    'Verifique que no se esté procesando duplicado.'
-                )
+    @api.model
+    def _cron_archive_old_logs(self, retention_days=None, chunk_size=None, max_chunks=None):
+        """
+        Archivar y eliminar logs más antiguos que la retención configurada
+        
+        Cada bloque se agrega como JSONL comprimido (gzip) en el filestore,
+        un archivo por mes de recepción, y luego se elimina de la tabla.
+        Cada bloque se confirma por separado; si el proceso se interrumpe
+        antes del commit el bloque puede quedar duplicado en el archivo,
+        nunca perdido.
+        
+        :param retention_days: Días a conservar (default: parámetro log_retention_days)
+        :param chunk_size: Logs por bloque (default: parámetro log_archive_chunk_size)
+        :param max_chunks: Límite de bloques por ejecución (None = sin límite)
+        :return: Número de logs archivados
+        """
+        params = self.env['ir.config_parameter'].sudo()
+        if retention_days is None:
+            retention_days = int(params.get_param('relatic_integration.log_retention_days', '365'))
+        if chunk_size is None:
+            chunk_size = int(params.get_param('relatic_integration.log_archive_chunk_size', '5000'))
+        if retention_days <= 0:
+            return 0
+        
+        cutoff = fields.Datetime.now() - timedelta(days=retention_days)
+        archive_dir = os.path.join(config.filestore(self.env.cr.dbname), 'relatic_sync_log_archive')
+        os.makedirs(archive_dir, exist_ok=True)
+        export_fields = [
+            name for name, field in self._fields.items()
+            if field.store and field.type not in ('binary', 'one2many', 'many2many')
+        ]
+        
+        archived = 0
+        chunks = 0
+        # Grupos de errores afectados: el watermark del cron no ve filas borradas
+        template_hashes = set()
+        while max_chunks is None or chunks < max_chunks:
+            logs = self.search([('received_at', '<', cutoff)], order='received_at, id', limit=chunk_size)
+            if not logs:
+                break
+            
+            # Agrupar por mes de recepción: un archivo .jsonl.gz por mes
+            payloads = self.env['relatic.sync.payload']._load_many(logs.mapped('payload_hash'))
+            by_month = {}
+            for row in logs.read(export_fields, load=None):
+                row['payload'] = payloads.get(row['payload_hash'])
+                by_month.setdefault(row['received_at'].strftime('%Y-%m'), []).append(row)
+            
+            for month, rows in by_month.items():
+                path = os.path.join(archive_dir, f'relatic_sync_log_{month}.jsonl.gz')
+                # Modo append: cada bloque es un miembro gzip adicional
+                with gzip.open(path, 'at', encoding='utf-8') as archive:
+                    for row in rows:
+                        archive.write(json.dumps(row, default=str, ensure_ascii=False) + '\n')
+            
+            payload_hashes = logs.mapped('payload_hash')
+            template_hashes.update(logs.filtered('error_template_hash').mapped('error_template_hash'))
+            logs.unlink()
+            self.env['relatic.sync.payload']._gc(payload_hashes)
+            archived += len(logs)
+            chunks += 1
+            if not self.env.registry.in_test_mode():
+                self.env.cr.commit()
+        
+        if template_hashes:
+            self.env['relatic.sync.error.cluster']._refresh_hashes(sorted(template_hashes))
+        if archived:
+            _logger.info("Relatic sync log retention: %s logs archivados en %s", archived, archive_dir)
+        return archived
+
+    def action_replay(self):
+        """Acción de lista: reprocesar los logs seleccionados en error o reintento"""
+        stats = self.env['relatic.replay.service'].replay(
+            log_ids=self.filtered(lambda l: l.status in ('error', 'retry')).ids,
+            ignore_schedule=True,
+        )
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'Reproceso Relatic',
+                'message': (
+                    f"Exitosos: {stats['success']} · Reintento: {stats['retry']} · "
+                    f"Error: {stats['error']}"
+                ),
+                'type': 'info',
+                'next': {'type': 'ir.actions.act_window_close'},
+            },
+        }
 
     def name_get(self):
         """Personalizar nombre mostrado"""
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+import json
+import zlib
+
+from odoo import models, fields, api
+from odoo.tools.sql import column_exists, create_column
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class RelaticSyncPayload(models.Model):
+    _name = 'relatic.sync.payload'
+    _description = 'Payload Relatic Comprimido'
+    _rec_name = 'payload_hash'
+
+    # El contenido comprimido vive en la columna bytea "data", fuera del ORM:
+    # solo se lee con _load()/_load_many(), nunca en vistas ni en caché.
+    payload_hash = fields.Char(
+        string='Hash Payload',
+        required=True,
+        readonly=True,
+        help='Hash SHA256 del payload canónico (llave de contenido)'
+    )
+
+    compression = fields.Selection([
+        ('zlib', 'zlib'),
+        ('zstd', 'zstd'),
+    ], string='Compresión', required=True, readonly=True)
+
+    raw_size = fields.Integer(string='Tamaño Original (bytes)', readonly=True)
+    compressed_size = fields.Integer(string='Tamaño Comprimido (bytes)', readonly=True)
+
+    _sql_constraints = [
+        ('payload_hash_unique',
+         'UNIQUE(payload_hash)',
+         'Ya existe un payload con este hash.')
+    ]
+
+    def init(self):
+        if not column_exists(self.env.cr, self._table, 'data'):
+            create_column(self.env.cr, self._table, 'data', 'bytea')
+
+    @api.model
+    def _get_compression(self):
+        """
+        Algoritmo de compresión configurado (zstd solo si está instalado)
+
+        :return: 'zlib' o 'zstd'
+        """
+        compression = self.env['ir.config_parameter'].sudo().get_param(
+            'relatic_integration.payload_compression',
+            'zlib'
+        )
+        if compression == 'zstd' and zstandard is not None:
+            return 'zstd'
+        return 'zlib'
+
+    @api.model
+    def _compress(self, raw, compression):
+        if compression == 'zstd':
+            return zstandard.ZstdCompressor(level=9).compress(raw)
+        return zlib.compress(raw, 9)
+
+    @api.model
+    def _decompress(self, data, compression):
+        if compression == 'zstd':
+            if zstandard is None:
+                raise ImportError('Se requiere la librería zstandard para leer este payload')
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    @api.model
+    def _store(self, payload_hash, payload_json):
+        """
+        Guardar el payload canónico una sola vez por hash
+
+        Las reentregas idénticas no escriben nada (ON CONFLICT DO NOTHING).
+
+        :param payload_hash: Hash SHA256 del payload
+        :param payload_json: JSON canónico (str)
+        """
+        raw = payload_json.encode('utf-8')
+        compression = self._get_compression()
+        data = self._compress(raw, compression)
+        self.env.cr.execute("""
+            INSERT INTO relatic_sync_payload
+                   (payload_hash, compression, data, raw_size, compressed_size,
+                    create_uid, create_date, write_uid, write_date)
+            VALUES (%s, %s, %s, %s, %s, %s, now() AT TIME ZONE 'UTC', %s, now() AT TIME ZONE 'UTC')
+            ON CONFLICT (payload_hash) DO NOTHING
+        """, (payload_hash, compression, data, len(raw), len(data), self.env.uid, self.env.uid))
+
+    @api.model
+    def _load(self, payload_hash):
+        """
+        Leer y descomprimir un payload
+
+        :param payload_hash: Hash SHA256 del payload
+        :return: dict con el payload o None si no está guardado
+        """
+        return self._load_many([payload_hash]).get(payload_hash)
+
+    @api.model
+    def _load_many(self, payload_hashes):
+        """
+        Leer y descomprimir varios payloads en una consulta
+
+        :param payload_hashes: Lista de hashes
+        :return: Dict {payload_hash: dict}
+        """
+        hashes = list({payload_hash for payload_hash in payload_hashes if payload_hash})
+        if not hashes:
+            return {}
+        self.env.cr.execute(
+            "SELECT payload_hash, compression, data FROM relatic_sync_payload WHERE payload_hash = ANY(%s)",
+            (hashes,)
+        )
+        return {
+            payload_hash: json.loads(self._decompress(bytes(data), compression))
+            for payload_hash, compression, data in self.env.cr.fetchall()
+            if data is not None
+        }
+
+    @api.model
+    def _gc(self, payload_hashes):
+        """
+        Eliminar payloads que ya no referencia ningún log
+
+        :param payload_hashes: Hashes candidatos (p. ej. de logs archivados)
+        """
+        hashes = list({payload_hash for payload_hash in payload_hashes if payload_hash})
+        if not hashes:
+            return
+        self.env['relatic.sync.log'].flush_model(['payload_hash'])
+        self.env.cr.execute("""
+            DELETE FROM relatic_sync_payload p
+             WHERE p.payload_hash = ANY(%s)
+               AND NOT EXISTS (SELECT 1 FROM relatic_sync_log l WHERE l.payload_hash = p.payload_hash)
+        """, (hashes,))
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from datetime import timedelta
+
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+# Watermark: xmin del snapshot de la última ejecución (ver _cron_refresh)
+WATERMARK_PARAM = 'relatic_integration.stats_watermark_txid'
+
+
+class RelaticSyncStatsDaily(models.Model):
+    _name = 'relatic.sync.stats.daily'
+    _description = 'Estadísticas Diarias de Sincronización Relatic'
+    _order = 'date desc, environment, status, error_code'
+    _rec_name = 'date'
+
+    date = fields.Date(string='Fecha', required=True, index=True, readonly=True)
+
+    environment = fields.Selection([
+        ('prod', 'Producción'),
+        ('staging', 'Staging'),
+        ('dev', 'Desarrollo'),
+    ], string='Ambiente', readonly=True)
+
+    status = fields.Selection([
+        ('pending', 'Pendiente'),
+        ('success', 'Exitoso'),
+        ('error', 'Error'),
+        ('retry', 'Reintento'),
+    ], string='Estado', readonly=True)
+
+    error_code = fields.Char(string='Código de Error', readonly=True)
+
+    log_count = fields.Integer(string='Logs', readonly=True)
+
+    processing_time_total = fields.Float(
+        string='Tiempo Total (seg)',
+        digits=(16, 3),
+        readonly=True
+    )
+
+    processing_time_count = fields.Integer(
+        string='Logs con Tiempo',
+        readonly=True,
+        help='Logs del grupo con tiempo de procesamiento registrado'
+    )
+
+    # Promedio de la fila; al agrupar se deriva de total / count (read_group)
+    processing_time_avg = fields.Float(
+        string='Tiempo Promedio (seg)',
+        digits=(16, 3),
+        aggregator='avg',
+        readonly=True
+    )
+
+    processing_time_p50 = fields.Float(
+        string='Latencia p50 (seg)',
+        digits=(16, 3),
+        aggregator='max',
+        readonly=True
+    )
+
+    processing_time_p95 = fields.Float(
+        string='Latencia p95 (seg)',
+        digits=(16, 3),
+        aggregator='max',
+        readonly=True
+    )
+
+    processing_time_p99 = fields.Float(
+        string='Latencia p99 (seg)',
+        digits=(16, 3),
+        aggregator='max',
+        readonly=True
+    )
+
+    @api.model
+    def read_group(self, domain, fields, groupby, offset=0, limit=None, orderby=False, lazy=True):
+        """
+        Promedio ponderado al agrupar: total / count en vez de promediar promedios
+
+        Un día con 10.000 logs y otro con 3 pesan lo mismo en un AVG de la
+        columna processing_time_avg; aquí se suman total y count del grupo
+        y se deriva el promedio.
+        """
+        wants_avg = any(spec.split(':')[0] == 'processing_time_avg' for spec in fields)
+        if wants_avg:
+            fields = [spec for spec in fields if spec.split(':')[0] != 'processing_time_avg']
+            fields += ['processing_time_total:sum', 'processing_time_count:sum']
+        groups = super().read_group(
+            domain, fields, groupby, offset=offset, limit=limit, orderby=orderby, lazy=lazy
+        )
+        if wants_avg:
+            for group in groups:
+                count = group.get('processing_time_count') or 0
+                group['processing_time_avg'] = (group.get('processing_time_total') or 0.0) / count if count else 0.0
+        return groups
+
+    @api.model
+    def _retention_start(self):
+        """
+        Primer día con todos sus logs aún en la tabla
+
+        Los días anteriores ya fueron (total o parcialmente) archivados por
+        _cron_archive_old_logs: sus estadísticas no deben recalcularse.
+
+        :return: date o None si la retención está desactivada
+        """
+        params = self.env['ir.config_parameter'].sudo()
+        retention_days = int(params.get_param('relatic_integration.log_retention_days', '365'))
+        if retention_days <= 0:
+            return None
+        cutoff = fields.Datetime.now() - timedelta(days=retention_days)
+        return cutoff.date() + timedelta(days=1)
+
+    @api.model
+    def _cron_refresh(self):
+        """
+        Recalcular las estadísticas de los días con logs modificados
+
+        Watermark por transacción: cada log guarda en change_txid el id de
+        la transacción que lo escribió. Al final de cada ejecución se guarda
+        el xmin del snapshot (la transacción abierta más antigua); todas las
+        transacciones anteriores ya confirmaron y fueron vistas. La siguiente
+        ejecución vuelve a leer desde ese xmin, así que las transacciones que
+        seguían abiertas (commits tardíos) entran en la ventana de solape en
+        vez de perderse como con un margen fijo sobre write_date.
+
+        Solo se recalculan días dentro de la retención de logs.
+
+        :return: Lista de días recalculados
+        """
+        params = self.env['ir.config_parameter'].sudo()
+        watermark = params.get_param(WATERMARK_PARAM)
+        retention_start = self._retention_start()
+
+        self.env['relatic.sync.log'].flush_model()
+        self.env.cr.execute("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+        horizon = self.env.cr.fetchone()[0]
+
+        query = "SELECT DISTINCT received_at::date FROM relatic_sync_log WHERE TRUE"
+        args = []
+        if watermark:
+            query += " AND change_txid >= %s"
+            args.append(int(watermark))
+        if retention_start:
+            query += " AND received_at >= %s"
+            args.append(retention_start)
+        self.env.cr.execute(query, args)
+        days = [row[0] for row in self.env.cr.fetchall()]
+
+        if days:
+            self._refresh_days(days)
+            _logger.info("Relatic sync stats: %s días recalculados", len(days))
+
+        params.set_param(WATERMARK_PARAM, str(horizon))
+        return days
+
+    @api.model
+    def _refresh_days(self, days):
+        """
+        Reemplazar las filas de estadísticas de los días indicados
+
+        Cada día se recalcula con un GROUP BY sobre el rango de received_at
+        (índice (received_at, id)), incluyendo percentiles de latencia.
+        Los días fuera de la retención se ignoran: sus logs ya no están
+        completos y las estadísticas guardadas son la única fuente.
+
+        :param days: Lista de fechas
+        """
+        retention_start = self._retention_start()
+        if retention_start:
+            days = [day for day in days if day >= retention_start]
+        if not days:
+            return
+        self.env.cr.execute(
+            "DELETE FROM relatic_sync_stats_daily WHERE date = ANY(%s)",
+            (days,)
+        )
+        for day in days:
+            self.env.cr.execute("""
+                INSERT INTO relatic_sync_stats_daily
+                       (date, environment, status, error_code, log_count,
+                        processing_time_total, processing_time_count, processing_time_avg,
+                        processing_time_p50, processing_time_p95, processing_time_p99,
+                        create_uid, create_date, write_uid, write_date)
+                SELECT %(day)s, environment, status, error_code, COUNT(*),
+                       COALESCE(SUM(processing_time), 0),
+                       COUNT(processing_time),
+                       COALESCE(AVG(processing_time), 0),
+                       COALESCE(percentile_cont(0.50) WITHIN GROUP (ORDER BY processing_time), 0),
+                       COALESCE(percentile_cont(0.95) WITHIN GROUP (ORDER BY processing_time), 0),
+                       COALESCE(percentile_cont(0.99) WITHIN GROUP (ORDER BY processing_time), 0),
+                       %(uid)s, now() AT TIME ZONE 'UTC', %(uid)s, now() AT TIME ZONE 'UTC'
+                  FROM relatic_sync_log
+                 WHERE received_at >= %(start)s AND received_at < %(end)s
+              GROUP BY environment, status, error_code
+            """, {
+                'day': day,
+                'start': day,
+                'end': day + timedelta(days=1),
+                'uid': self.env.uid,
+            })
+        self.invalidate_model()
+
+    @api.model
+    def action_rebuild(self):
+        """
+        Recalcular desde cero las estadísticas de los días dentro de la retención
+
+        Los días anteriores se conservan: sus logs ya fueron archivados.
+        """
+        retention_start = self._retention_start()
+        self.env['ir.config_parameter'].sudo().set_param(WATERMARK_PARAM, False)
+        if retention_start:
+            self.env.cr.execute(
+                "DELETE FROM relatic_sync_stats_daily WHERE date >= %s",
+                (retention_start,)
+            )
+        else:
+            self.env.cr.execute("DELETE FROM relatic_sync_stats_daily")
+        self.invalidate_model()
+        return self._cron_refresh()
@@ -3,3 +3,8 @@
 from . import partner_service
 from . import invoice_service
 from . import payment_service
+from . import reconcile_service
+from . import settlement_service
+from . import sale_service
+from . import replay_service
+from . import profiler_service
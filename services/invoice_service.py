@@ -3,12 +3,14 @@
 from odoo import models, fields, api
 from odoo.exceptions import ValidationError
 
+from ..core.totals import item_tax_rate
+
 
 class RelaticInvoiceService(models.Model):
     _name = 'relatic.invoice.service'
     _description = 'Servicio para crear facturas desde Relatic'
 
-    def create_invoice(self, partner, order_id, items, payment_data):
+    def create_invoice(self, partner, order_id, items, payment_data, post=True):
         """
         Crear factura desde datos de orden
         
@@ -16,6 +18,7 @@ class RelaticInvoiceService(models.Model):
         :param order_id: Order ID de Relatic
         :param items: Lista de items
         :param payment_data: Datos del pago
+        :param post: Si es False la factura queda en borrador (sin número de secuencia)
         :return: account.move record (factura)
         """
         # Verificar que no exista ya
@@ -37,7 +40,7 @@ class RelaticInvoiceService(models.Model):
             
             # Calcular impuesto
             tax_ids = []
-            tax_rate = item.get('tax_rate', 7.0)
+            tax_rate = item_tax_rate(item)
             if tax_rate and tax_rate > 0:
                 tax = self._get_tax(tax_rate)
                 if tax:
@@ -82,7 +85,9 @@ class RelaticInvoiceService(models.Model):
         invoice._onchange_invoice_line_ids()
         
         # Confirmar factura
-        invoice.action_post()
+        if post:
+            invoice.action_post()
+            self.env['relatic.member.summary']._apply_invoice(invoice)
         
         return invoice
 
@@ -2,7 +2,17 @@
 
 from odoo import models, fields, api
 from odoo.exceptions import ValidationError
-import re
+
+from ..core.normalization import (
+    member_shard,
+    normalize_email,
+    normalize_phone,
+    normalize_vat,
+    validate_email,
+)
+
+# Espacio de nombres de los advisory locks por miembro (pg_advisory_xact_lock(int, int))
+MEMBER_LOCK_NAMESPACE = 0x52454C  # 'REL'
 
 
 class RelaticPartnerService(models.Model):
@@ -16,7 +26,7 @@ class RelaticPartnerService(models.Model):
         :param member_data: Dict con datos del miembro
         :return: res.partner record
         """
-        email = member_data.get('email', '').strip().lower()
+        email = normalize_email(member_data.get('email', ''))
         if not email:
             raise ValidationError('Email es requerido para crear/actualizar contacto')
         
@@ -75,6 +85,37 @@ class RelaticPartnerService(models.Model):
         
         return partner
 
+    def _lock_member(self, email):
+        """
+        Serializar las órdenes de un mismo miembro (advisory lock de transacción)
+
+        Dos webhooks del mismo miembro (renovación + complemento) esperan uno
+        al otro en vez de chocar sobre el mismo res_partner y la misma cuenta
+        por cobrar; miembros distintos siguen en paralelo. El lock se libera
+        al terminar la transacción.
+
+        :param email: Email del miembro
+        """
+        if not normalize_email(email):
+            return
+        self.env.cr.execute(
+            "SELECT pg_advisory_xact_lock(%s, %s)",
+            (MEMBER_LOCK_NAMESPACE, member_shard(email))
+        )
+
+    def _member_lock_key(self, email):
+        """
+        Orden de adquisición de los advisory locks por miembro
+
+        Quien procesa varias órdenes en una sola transacción (bloques de
+        /ingest) las ordena por esta llave: todas las transacciones toman
+        los locks en el mismo orden y no pueden esperarse en ciclo.
+
+        :param email: Email del miembro
+        :return: Shard del lock (-1 sin email: la orden no toma lock)
+        """
+        return member_shard(email) if normalize_email(email) else -1
+
     def _validate_email(self, email):
         """
         Validar formato de email básico
@@ -82,8 +123,7 @@ class RelaticPartnerService(models.Model):
         :param email: Email a validar
         :return: True si es válido
         """
-        pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        return re.match(pattern, email) is not None
+        return validate_email(email)
 
     def _normalize_phone(self, phone):
         """
@@ -92,12 +132,7 @@ class RelaticPartnerService(models.Model):
         :param phone: Teléfono a normalizar
         :return: Teléfono normalizado
         """
-        if not phone:
-            return ''
-        
-        # Remover espacios y caracteres especiales excepto + y números
-        phone = re.sub(r'[^\d+]', '', phone.strip())
-        return phone
+        return normalize_phone(phone)
 
     def _normalize_vat(self, vat):
         """
@@ -106,11 +141,7 @@ class RelaticPartnerService(models.Model):
         :param vat: VAT a normalizar
         :return: VAT normalizado
         """
-        if not vat:
-            return ''
-        
-        # Remover espacios y mantener formato
-        return vat.strip().upper()
+        return normalize_vat(vat)
 
     def _get_or_create_category(self, category_name):
         """
@@ -18,7 +18,8 @@ class RelaticPaymentService(models.Model):
         :param partner: res.partner record
         :param payment_data: Dict con datos del pago
         :param partial: Si es True, permite pago parcial
-        :return: account.move record (movimiento de pago)
+        :return: account.move record (movimiento de pago); vacío en modo agregado,
+                 donde el pago queda pendiente del asiento de liquidación diario
         """
         # Validar que la factura esté confirmada
         if invoice.state != 'posted':
@@ -62,12 +63,38 @@ class RelaticPaymentService(models.Model):
         if partial:
             amount = min(amount, invoice_residual)
         
+        # Resumen del miembro para el portal (pagado desde este momento,
+        # aunque la conciliación ocurra después)
+        self.env['relatic.member.summary']._apply_payment(
+            partner, amount, payment_date, payment_data.get('reference', ''), invoice_residual
+        )
+        
+        # Modo agregado: el lado banco se consolida en un asiento diario por
+        # diario (cron); el pago se concilia individualmente al contabilizarse
+        aggregate_model = self.env['relatic.payment.aggregate']
+        if aggregate_model._is_enabled():
+            aggregate_model.create({
+                'invoice_id': invoice.id,
+                'partner_id': partner.id,
+                'journal_id': journal.id,
+                'receivable_account_id': receivable_account.id,
+                'amount': amount,
+                'reference': payment_data.get('reference', ''),
+                'date': payment_date,
+            })
+            return self.env['account.move']
+        
+        # En modo diferido el cron concilia por lotes fuera de la transacción del webhook
+        deferred = self.env['relatic.reconcile.service']._get_reconcile_mode() == 'deferred'
+        
         # Crear movimiento contable de pago (Odoo 18)
         payment_move = self.env['account.move'].create({
             'move_type': 'entry',  # Movimiento contable
             'date': payment_date,
             'journal_id': journal.id,
             'ref': payment_data.get('reference', ''),
+            'x_relatic_invoice_id': invoice.id,
+            'x_relatic_reconcile_pending': deferred,
             'line_ids': [
                 # Línea banco / método de pago (débito)
                 (0, 0, {
@@ -92,7 +119,8 @@ class RelaticPaymentService(models.Model):
         payment_move.action_post()
         
         # Conciliar factura con pago (soporta parcial)
-        self._reconcile_invoice(invoice, payment_move, partial=partial)
+        if not deferred:
+            self._reconcile_invoice(invoice, payment_move, partial=partial)
         
         return payment_move
 
@@ -129,68 +157,102 @@ class RelaticPaymentService(models.Model):
         :param payment_move: account.move record (pago)
         :param partial: Si es True, permite conciliación parcial
         """
-        # Obtener líneas conciliables de la factura
-        invoice_lines = invoice.line_ids.filtered(
-            lambda l: l.account_id.reconcile and 
-                      l.account_id == invoice.partner_id.property_account_receivable_id and
-                      not l.reconciled
-        )
-        
-        # Obtener líneas conciliables del pago
-        payment_lines = payment_move.line_ids.filtered(
-            lambda l: l.account_id.reconcile and 
-                      l.account_id == invoice.partner_id.property_account_receivable_id and
-                      not l.reconciled
-        )
-        
-        # Conciliar (soporta parcial automáticamente)
-        if invoice_lines and payment_lines:
-            (invoice_lines + payment_lines).reconcile()
+        # Selección por dominio indexado y reconcile en una sola llamada
+        self.env['relatic.reconcile.service'].reconcile_pairs([(invoice, payment_move)])
 
     def create_refund(self, invoice, order_id, reason=''):
         """
         Crear nota de crédito (reembolso) para una factura
         
         :param invoice: account.move record (factura original)
-        :param order_id: Order ID de Relatic (con sufijo -REFUND)
+        :param order_id: Order ID de Relatic (se agrega sufijo -REFUND)
         :param reason: Razón del reembolso
         :return: account.move record (nota de crédito)
         """
-        # Verificar que la factura esté confirmada
-        if invoice.state != 'posted':
-            raise ValidationError(f'La factura {invoice.name} debe estar confirmada para crear reembolso')
-        
-        # Verificar que no exista ya el reembolso
-        refund_order_id = f"{order_id}-REFUND"
-        existing_refund = self.env['account.move'].search_by_relatic_order_id(refund_order_id)
-        if existing_refund:
-            return existing_refund
-        
-        # Crear nota de crédito copiando líneas de la factura original
-        refund_lines = []
-        for line in invoice.invoice_line_ids:
-            refund_lines.append((0, 0, {
-                'product_id': line.product_id.id,
-                'name': line.name,
-                'quantity': line.quantity,
-                'price_unit': -line.price_unit,  # Negativo para nota de crédito
-                'tax_ids': [(6, 0, line.tax_ids.ids)],
-                'account_id': line.account_id.id,
-            }))
-        
-        # Crear nota de crédito
-        refund = self.env['account.move'].create({
-            'move_type': 'out_refund',
-            'partner_id': invoice.partner_id.id,
-            'invoice_origin': order_id,
-            'ref': reason or f'Reembolso de {invoice.name}',
-            'invoice_date': fields.Date.today(),
-            'invoice_line_ids': refund_lines,
-            'x_relatic_order_id': refund_order_id,
-        })
+        return self.create_refunds({order_id: invoice}, reason=reason)[order_id]
+
+    def create_refunds(self, invoices_by_order, reason='', reconcile=False):
+        """
+        Crear notas de crédito en lote usando la reversión nativa de Odoo
+        
+        Idempotente por Order ID con sufijo -REFUND: los reembolsos ya
+        existentes se retornan sin volver a crearse.
+        
+        :param invoices_by_order: Dict {order_id: account.move record (factura original)}
+        :param reason: Razón del reembolso
+        :param reconcile: Si es True, concilia cada nota de crédito con su factura (solo facturas con saldo)
+        :return: Dict {order_id: account.move record (nota de crédito)}
+        """
+        return {
+            order_id: outcome['refund']
+            for order_id, outcome in self._create_refunds(invoices_by_order, reason, reconcile).items()
+        }
+
+    def _create_refunds(self, invoices_by_order, reason='', reconcile=False):
+        """
+        Crear notas de crédito en lote e indicar el resultado de cada orden
+        
+        La conciliación con cancel=True solo aplica a facturas con saldo
+        pendiente: una factura ya pagada no tiene nada contra qué conciliar,
+        así que su nota se publica abierta (saldo a favor del miembro, a
+        devolver o aplicar aparte) y se reporta reconciled=False.
+        
+        :param invoices_by_order: Dict {order_id: account.move record (factura original)}
+        :param reason: Razón del reembolso
+        :param reconcile: Si es True, concilia las notas de facturas con saldo
+        :return: Dict {order_id: {'refund', 'already_exists', 'reconciled'}}
+        """
+        # Verificar que las facturas estén confirmadas
+        for invoice in invoices_by_order.values():
+            if invoice.state != 'posted':
+                raise ValidationError(f'La factura {invoice.name} debe estar confirmada para crear reembolso')
+        
+        # Verificar reembolsos existentes en una sola consulta
+        refund_order_ids = {order_id: f"{order_id}-REFUND" for order_id in invoices_by_order}
+        existing_refunds = self.env['account.move'].search_by_relatic_order_ids(
+            list(refund_order_ids.values()),
+            move_type='out_refund'
+        )
+        
+        result = {}
+        to_reconcile = []
+        to_post = []
+        for order_id, invoice in invoices_by_order.items():
+            existing_refund = existing_refunds.get(refund_order_ids[order_id])
+            if existing_refund:
+                result[order_id] = {
+                    'refund': existing_refund,
+                    'already_exists': True,
+                    'reconciled': existing_refund.payment_state != 'not_paid',
+                }
+            elif reconcile and not invoice.currency_id.is_zero(invoice.amount_residual):
+                to_reconcile.append((order_id, invoice))
+            else:
+                to_post.append((order_id, invoice))
         
-        # Validar y confirmar nota de crédito
-        refund._onchange_invoice_line_ids()
-        refund.action_post()
+        member_summary = self.env['relatic.member.summary']
+        today = fields.Date.today()
+        for batch, cancel in ((to_reconcile, True), (to_post, False)):
+            if not batch:
+                continue
+            # Reversión nativa en lote: una nota de crédito por factura
+            invoices = self.env['account.move'].union(*[invoice for dummy, invoice in batch])
+            default_values_list = [{
+                'ref': reason or f'Reembolso de {invoice.name}',
+                'date': today,
+                'invoice_date': today,
+                'invoice_origin': order_id,
+                'x_relatic_order_id': refund_order_ids[order_id],
+            } for order_id, invoice in batch]
+            residuals = [abs(invoice.amount_residual) for dummy, invoice in batch]
+            
+            # cancel=True publica y concilia contra la factura original
+            refunds = invoices._reverse_moves(default_values_list, cancel=cancel)
+            if not cancel:
+                refunds.action_post()
+            
+            for (order_id, invoice), refund, residual in zip(batch, refunds, residuals):
+                result[order_id] = {'refund': refund, 'already_exists': False, 'reconciled': cancel}
+                member_summary._apply_refund(invoice, refund, residual, cancel)
         
-        return refund
+        return result
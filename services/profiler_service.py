@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+import base64
+import cProfile
+import io
+import json
+import logging
+import marshal
+import pstats
+import random
+import time
+from contextlib import contextmanager
+
+from odoo import models, fields, api, SUPERUSER_ID
+from odoo.modules.registry import Registry
+from odoo.tools.profiler import Profiler
+
+_logger = logging.getLogger(__name__)
+
+# Funciones listadas en el resumen de texto (orden por tiempo acumulado)
+PSTATS_LIMIT = 60
+
+
+class RelaticProfilerService(models.Model):
+    _name = 'relatic.profiler.service'
+    _description = 'Perfilado de requests lentos del webhook Relatic'
+
+    @api.model
+    def _get_settings(self):
+        """
+        Parámetros del perfilado
+
+        :return: Tupla (tasa de muestreo 0..1, umbral en milisegundos)
+        """
+        params = self.env['ir.config_parameter'].sudo()
+        sample_rate = float(params.get_param('relatic_integration.profile_sample_rate', '0') or 0)
+        threshold_ms = int(params.get_param('relatic_integration.profile_threshold_ms', '2000') or 0)
+        return sample_rate, threshold_ms
+
+    @api.model
+    def _should_sample(self):
+        """Sortear si el request actual se perfila (costo cero para los no muestreados)"""
+        sample_rate, threshold_ms = self._get_settings()
+        return sample_rate > 0 and threshold_ms > 0 and random.random() < sample_rate
+
+    @contextmanager
+    def _capture(self):
+        """
+        Perfilar el bloque con cProfile y el colector SQL de Odoo
+
+        El resultado queda en el dict retornado: elapsed (segundos),
+        cprofile (cProfile.Profile o None) y queries (entradas del colector).
+        """
+        capture = {'elapsed': 0.0, 'cprofile': None, 'queries': []}
+        sql_profiler = Profiler(collectors=['sql'], db=None)
+        cprofile = cProfile.Profile()
+        start = time.perf_counter()
+        with sql_profiler:
+            try:
+                cprofile.enable()
+                capture['cprofile'] = cprofile
+            except ValueError:
+                # Otro profiler activo en el proceso (p. ej. el de Odoo): solo SQL
+                _logger.debug("Relatic profiler: cProfile no disponible, se captura solo SQL")
+            try:
+                yield capture
+            finally:
+                if capture['cprofile']:
+                    cprofile.disable()
+        capture['elapsed'] = time.perf_counter() - start
+        capture['queries'] = sql_profiler.collectors[0].entries
+
+    @api.model
+    def _schedule_save(self, capture, order_id):
+        """
+        Guardar el perfil después del commit del request, en un cursor propio
+
+        El perfilado nunca cambia el resultado del request: un error al
+        guardar el perfil (adjuntos, pstats, cursor abortado) se registra en
+        el log del servidor y no revierte una venta ya procesada.
+
+        :param capture: Dict retornado por _capture
+        :param order_id: Order ID del request
+        """
+        dummy, threshold_ms = self._get_settings()
+        if capture['elapsed'] * 1000 < threshold_ms or not order_id:
+            return
+        dbname = self.env.cr.dbname
+
+        def save():
+            try:
+                with Registry(dbname).cursor() as cr:
+                    env = api.Environment(cr, SUPERUSER_ID, {})
+                    env['relatic.profiler.service']._save_if_slow(capture, order_id)
+            except Exception:
+                _logger.exception("Relatic profiler: no se pudo guardar el perfil de la orden %s", order_id)
+
+        if self.env.registry.in_test_mode():
+            # El cursor de prueba no ejecuta los hooks de commit
+            save()
+            return
+        self.env.cr.postcommit.add(save)
+
+    @api.model
+    def _save_if_slow(self, capture, order_id):
+        """
+        Adjuntar el perfil al log de la orden si superó el umbral
+
+        Crea tres adjuntos en relatic.sync.log: resumen de texto (funciones
+        y consultas más costosas), .prof (pstats, abrir con snakeviz) y la
+        lista completa de consultas SQL con tiempos en JSON.
+
+        :param capture: Dict retornado por _capture
+        :param order_id: Order ID del request
+        :return: relatic.sync.log perfilado o recordset vacío
+        """
+        dummy, threshold_ms = self._get_settings()
+        elapsed_ms = capture['elapsed'] * 1000
+        SyncLog = self.env['relatic.sync.log']
+        if elapsed_ms < threshold_ms or not order_id:
+            return SyncLog
+
+        log = SyncLog.search([('order_id', '=', order_id)], order='id desc', limit=1)
+        if not log:
+            return SyncLog
+
+        queries = sorted(capture['queries'], key=lambda entry: entry['time'], reverse=True)
+        sql_time_ms = sum(entry['time'] for entry in queries) * 1000
+        basename = f"profile_{log.id}_{fields.Datetime.now().strftime('%Y%m%d%H%M%S')}"
+
+        summary = io.StringIO()
+        summary.write(
+            f"Order ID: {order_id}\n"
+            f"Duración: {elapsed_ms:.1f} ms (umbral {threshold_ms} ms)\n"
+            f"Consultas SQL: {len(queries)} en {sql_time_ms:.1f} ms\n\n"
+            f"== Consultas más lentas ==\n"
+        )
+        for entry in queries[:20]:
+            summary.write(f"{entry['time'] * 1000:9.2f} ms  {entry['full_query']}\n")
+
+        attachments = []
+        cprofile = capture['cprofile']
+        if cprofile:
+            summary.write("\n== Funciones (tiempo acumulado) ==\n")
+            pstats.Stats(cprofile, stream=summary).sort_stats('cumulative').print_stats(PSTATS_LIMIT)
+            cprofile.create_stats()
+            attachments.append((f'{basename}.prof', marshal.dumps(cprofile.stats), 'application/octet-stream'))
+
+        attachments.append((f'{basename}.txt', summary.getvalue().encode('utf-8'), 'text/plain'))
+        attachments.append((f'{basename}_sql.json', json.dumps([{
+            'time_ms': round(entry['time'] * 1000, 3),
+            'start': entry['start'],
+            'query': entry['full_query'],
+        } for entry in queries], ensure_ascii=False, indent=1).encode('utf-8'), 'application/json'))
+
+        self.env['ir.attachment'].sudo().create([{
+            'name': name,
+            'datas': base64.b64encode(raw),
+            'mimetype': mimetype,
+            'res_model': 'relatic.sync.log',
+            'res_id': log.id,
+        } for name, raw, mimetype in attachments])
+        log.profiled = True
+
+        _logger.info(
+            "Relatic profiler: orden %s tardó %.0f ms (%s consultas), perfil adjunto al log %s",
+            order_id, elapsed_ms, len(queries), log.id,
+        )
+        return log
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+from collections import defaultdict
+
+from psycopg2 import errors as pg_errors
+
+from odoo import models, api
+
+_logger = logging.getLogger(__name__)
+
+# Errores transitorios: el lote se reintenta en la próxima ejecución del cron
+TRANSIENT_ERRORS = (pg_errors.DeadlockDetected, pg_errors.SerializationFailure, pg_errors.LockNotAvailable)
+
+
+class RelaticReconcileService(models.Model):
+    _name = 'relatic.reconcile.service'
+    _description = 'Motor de conciliación por lotes para pagos Relatic'
+
+    def reconcile_pairs(self, pairs):
+        """
+        Conciliar muchos pares factura/pago en una sola llamada a reconcile
+
+        Las líneas por cobrar se seleccionan con una única consulta sobre
+        índices (move_id, account_id) en lugar de filtrar line_ids en Python.
+
+        :param pairs: Lista de tuplas (factura, pago). El pago puede ser el
+                      movimiento (account.move) o directamente sus líneas por
+                      cobrar (account.move.line), p. ej. en asientos agregados
+        :return: Dict con estadísticas y tiempos del lote; outcomes tiene el
+                 resultado de cada par en el orden recibido: 'reconciled',
+                 'settled' (el pago ya no tiene saldo abierto) o 'skipped'
+        """
+        stats = {
+            'pairs': len(pairs),
+            'reconciled': 0,
+            'skipped': 0,
+            'select_ms': 0.0,
+            'reconcile_ms': 0.0,
+            'outcomes': [],
+        }
+        if not pairs:
+            return stats
+
+        start = time.perf_counter()
+        lines_by_move = self._get_open_receivable_lines(pairs)
+        stats['select_ms'] = (time.perf_counter() - start) * 1000
+
+        # Construir plan: un grupo de líneas por par factura/pago
+        plan = []
+        for invoice, payment in pairs:
+            invoice_lines = lines_by_move.get(invoice.id)
+            if payment._name == 'account.move.line':
+                payment_lines = payment.filtered(lambda l: not l.reconciled)
+            else:
+                payment_lines = lines_by_move.get(payment.id)
+            if not invoice_lines or not payment_lines:
+                stats['skipped'] += 1
+                stats['outcomes'].append('skipped' if payment_lines else 'settled')
+                continue
+            plan.append(invoice_lines + payment_lines)
+            stats['outcomes'].append('reconciled')
+
+        if plan:
+            # Orden estable por cuenta/contacto para tomar los locks siempre
+            # en el mismo orden y reducir interbloqueos entre workers
+            plan.sort(key=lambda lines: (lines[0].account_id.id, lines[0].partner_id.id, lines[0].id))
+            start = time.perf_counter()
+            self.env['account.move.line']._reconcile_plan(plan)
+            stats['reconcile_ms'] = (time.perf_counter() - start) * 1000
+            stats['reconciled'] = len(plan)
+
+        _logger.info(
+            "Relatic reconcile batch: %(pairs)s pares, %(reconciled)s conciliados, "
+            "%(skipped)s omitidos, select %(select_ms).1f ms, reconcile %(reconcile_ms).1f ms",
+            stats,
+        )
+        return stats
+
+    def _get_open_receivable_lines(self, pairs):
+        """
+        Obtener líneas por cobrar abiertas de todos los movimientos del lote
+
+        :param pairs: Lista de tuplas (factura, pago)
+        :return: Dict {move_id: account.move.line recordset}
+        """
+        Move = self.env['account.move']
+        invoices = Move.union(*[invoice for invoice, dummy in pairs])
+        payments = Move.union(*[payment for dummy, payment in pairs if payment._name == 'account.move'])
+
+        receivable_accounts = invoices.partner_id.property_account_receivable_id.filtered('reconcile')
+        if not receivable_accounts:
+            return {}
+
+        lines = self.env['account.move.line'].search([
+            ('move_id', 'in', (invoices | payments).ids),
+            ('account_id', 'in', receivable_accounts.ids),
+            ('reconciled', '=', False),
+        ], order='id')
+
+        lines_by_move = defaultdict(lambda: self.env['account.move.line'])
+        for line in lines:
+            lines_by_move[line.move_id.id] |= line
+        return lines_by_move
+
+    @api.model
+    def _get_reconcile_mode(self):
+        """
+        Modo de conciliación configurado
+
+        :return: 'inline' (en la transacción del webhook) o 'deferred' (cron)
+        """
+        mode = self.env['ir.config_parameter'].sudo().get_param(
+            'relatic_integration.reconcile_mode',
+            'inline'
+        )
+        return mode if mode in ('inline', 'deferred') else 'inline'
+
+    @api.model
+    def _cron_reconcile_pending(self, batch_size=None, max_batches=None):
+        """
+        Conciliar en lotes los pagos marcados como pendientes (modo deferred)
+
+        Cada lote se confirma por separado para liberar los locks de la
+        cuenta por cobrar lo antes posible. Solo salen de la cola los pagos
+        conciliados (o ya saldados); un par que falla se aísla por bisección
+        y queda marcado con su error en vez de bloquear los lotes siguientes.
+
+        :param batch_size: Pares por lote (default: parámetro reconcile_batch_size)
+        :param max_batches: Límite de lotes por ejecución (None = sin límite)
+        :return: Lista con las estadísticas de cada lote
+        """
+        if batch_size is None:
+            batch_size = int(self.env['ir.config_parameter'].sudo().get_param(
+                'relatic_integration.reconcile_batch_size',
+                '500'
+            ))
+
+        results = []
+        while max_batches is None or len(results) < max_batches:
+            payment_moves = self.env['account.move'].search([
+                ('x_relatic_reconcile_pending', '=', True),
+                ('state', '=', 'posted'),
+            ], order='id', limit=batch_size)
+            if not payment_moves:
+                break
+
+            errors = {
+                move.id: 'Pago sin factura Relatic asociada'
+                for move in payment_moves if not move.x_relatic_invoice_id
+            }
+            pairs = [(move.x_relatic_invoice_id, move) for move in payment_moves if move.x_relatic_invoice_id]
+            stats = {'pairs': len(pairs), 'reconciled': 0, 'skipped': 0, 'failed': 0,
+                     'select_ms': 0.0, 'reconcile_ms': 0.0}
+            for (invoice, payment), outcome in self._reconcile_isolated(pairs, stats):
+                if outcome == 'skipped':
+                    errors[payment.id] = f'La factura {invoice.name} no tiene saldo por cobrar abierto'
+                elif outcome not in ('reconciled', 'settled'):
+                    errors[payment.id] = outcome
+
+            done = payment_moves.filtered(lambda move: move.id not in errors)
+            done.write({'x_relatic_reconcile_pending': False, 'x_relatic_reconcile_error': False})
+            for move in payment_moves - done:
+                move.write({'x_relatic_reconcile_pending': False, 'x_relatic_reconcile_error': errors[move.id]})
+            if errors:
+                _logger.warning("Relatic reconcile: %s pagos marcados con error de conciliación", len(errors))
+            results.append(stats)
+
+            if not self.env.registry.in_test_mode():
+                self.env.cr.commit()
+
+        return results
+
+    def _reconcile_isolated(self, pairs, stats):
+        """
+        Conciliar los pares en un savepoint, bisecando el lote si falla
+
+        Un par inválido hace fallar el _reconcile_plan de todo su grupo: el
+        grupo se divide en mitades hasta aislarlo, así los pares sanos se
+        concilian en pocas llamadas y el par problemático se reporta solo.
+        Los errores transitorios (deadlocks, serialización) no se aíslan: se
+        propagan y el cron reintenta el lote completo en la próxima ejecución.
+
+        :param pairs: Lista de tuplas (factura, pago)
+        :param stats: Dict de estadísticas del lote (se acumula)
+        :return: Lista de (par, resultado), con resultado 'reconciled',
+                 'settled', 'skipped' o el mensaje de error del par
+        """
+        if not pairs:
+            return []
+        try:
+            with self.env.cr.savepoint():
+                batch_stats = self.reconcile_pairs(pairs)
+        except TRANSIENT_ERRORS:
+            raise
+        except Exception as e:
+            if len(pairs) == 1:
+                invoice, payment = pairs[0]
+                _logger.exception("Relatic reconcile: no se pudo conciliar el pago %s con %s", payment.id, invoice.name)
+                stats['failed'] += 1
+                return [(pairs[0], f"Error de conciliación: {e}")]
+            middle = len(pairs) // 2
+            return self._reconcile_isolated(pairs[:middle], stats) + self._reconcile_isolated(pairs[middle:], stats)
+
+        for key in ('reconciled', 'skipped', 'select_ms', 'reconcile_ms'):
+            stats[key] += batch_stats[key]
+        return list(zip(pairs, batch_stats['outcomes']))
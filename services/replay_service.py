@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from odoo import models, api, SUPERUSER_ID
+from odoo.exceptions import ValidationError
+from odoo.modules.registry import Registry
+
+_logger = logging.getLogger(__name__)
+
+
+class RelaticReplayService(models.Model):
+    _name = 'relatic.replay.service'
+    _description = 'Motor de reprocesos de logs Relatic fallidos'
+
+    @api.model
+    def _cron_replay_logs(self):
+        """Cron: reprocesar logs en 'retry' cuyo backoff ya venció"""
+        params = self.env['ir.config_parameter'].sudo()
+        return self.replay(
+            limit=int(params.get_param('relatic_integration.replay_batch_size', '200')),
+            workers=int(params.get_param('relatic_integration.replay_workers', '4')),
+        )
+
+    @api.model
+    def replay(self, log_ids=None, limit=None, workers=None, ignore_schedule=False):
+        """
+        Reprocesar logs fallidos con concurrencia acotada
+
+        Cada worker toma logs con FOR UPDATE SKIP LOCKED en su propio cursor
+        y confirma cada intento por separado, de modo que varios crons o
+        acciones manuales simultáneas nunca procesan el mismo log. Los logs
+        se reparten por member_shard: los de un mismo miembro los procesa
+        siempre el mismo worker, en serie.
+
+        :param log_ids: Restringir a estos logs (acción de lista)
+        :param limit: Máximo de logs a procesar (default: todos los de log_ids o 200)
+        :param workers: Número de workers en paralelo (default: parámetro replay_workers)
+        :param ignore_schedule: Si es True, ignora next_retry_at e incluye logs en 'error'
+        :return: Dict con contadores success/retry/error
+        """
+        if log_ids is not None and not log_ids:
+            return {'success': 0, 'retry': 0, 'error': 0}
+        if limit is None:
+            limit = len(log_ids) if log_ids else 200
+        if workers is None:
+            workers = int(self.env['ir.config_parameter'].sudo().get_param(
+                'relatic_integration.replay_workers', '4'
+            ))
+        workers = max(1, min(workers, limit))
+
+        claim = {
+            'log_ids': log_ids,
+            'statuses': ['retry', 'error'] if ignore_schedule else ['retry'],
+            'ignore_schedule': ignore_schedule,
+        }
+        stats = {'success': 0, 'retry': 0, 'error': 0}
+        start = time.perf_counter()
+
+        if self.env.registry.in_test_mode() or workers == 1:
+            # Mismo cursor: sin commits intermedios (tests o un solo worker)
+            for dummy in range(limit):
+                log = self._claim_next(**claim)
+                if not log:
+                    break
+                stats[self._replay_one(log)] += 1
+        else:
+            self.env.flush_all()
+            remaining = [limit]
+            lock = threading.Lock()
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(
+                        self._replay_worker, self.env.cr.dbname, self.env.context,
+                        dict(claim, shard=(index, workers)), remaining, lock,
+                    )
+                    for index in range(workers)
+                ]
+                for future in futures:
+                    for status, count in future.result().items():
+                        stats[status] += count
+
+        if any(stats.values()):
+            _logger.info(
+                "Relatic replay: %s exitosos, %s reintento, %s error en %.1f s (%s workers)",
+                stats['success'], stats['retry'], stats['error'], time.perf_counter() - start, workers,
+            )
+        return stats
+
+    @api.model
+    def _replay_worker(self, dbname, context, claim, remaining, lock):
+        """
+        Worker de reprocesos: un cursor y un commit por intento
+
+        :return: Dict con contadores del worker
+        """
+        threading.current_thread().dbname = dbname
+        registry = Registry(dbname)
+        stats = {'success': 0, 'retry': 0, 'error': 0}
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+            try:
+                with registry.cursor() as cr:
+                    env = api.Environment(cr, SUPERUSER_ID, context)
+                    service = env['relatic.replay.service']
+                    log = service._claim_next(**claim)
+                    if not log:
+                        break
+                    stats[service._replay_one(log)] += 1
+            except Exception:
+                _logger.exception("Relatic replay: error inesperado en worker")
+        return stats
+
+    @api.model
+    def _claim_next(self, log_ids=None, statuses=('retry',), ignore_schedule=False, shard=None):
+        """
+        Tomar el siguiente log a reprocesar bloqueándolo (SKIP LOCKED)
+
+        :param shard: Tupla (índice, total de workers) para tomar solo los
+                      logs de los miembros asignados a este worker
+        :return: relatic.sync.log record o recordset vacío
+        """
+        query = """
+            SELECT id FROM relatic_sync_log
+             WHERE status = ANY(%s)
+        """
+        params = [list(statuses)]
+        if not ignore_schedule:
+            query += " AND (next_retry_at IS NULL OR next_retry_at <= now() AT TIME ZONE 'UTC')"
+        if log_ids:
+            query += " AND id = ANY(%s)"
+            params.append(list(log_ids))
+        if shard:
+            query += " AND COALESCE(member_shard, 0) %% %s = %s"
+            params.extend([shard[1], shard[0]])
+        query += " ORDER BY next_retry_at NULLS FIRST, id LIMIT 1 FOR UPDATE SKIP LOCKED"
+
+        self.env['relatic.sync.log'].flush_model()
+        self.env.cr.execute(query, params)
+        row = self.env.cr.fetchone()
+        return self.env['relatic.sync.log'].browse(row[0] if row else [])
+
+    @api.model
+    def _replay_one(self, log):
+        """
+        Reprocesar un log con el mismo pipeline del webhook
+
+        :param log: relatic.sync.log record (bloqueado por _claim_next)
+        :return: Estado final ('success', 'retry' o 'error')
+        """
+        start_time = time.time()
+        payload = log.get_payload()
+        if not payload:
+            log.mark_error('PAYLOAD_MISSING', 'Payload original no disponible para reprocesar', retry=False)
+            return 'error'
+
+        try:
+            with self.env.cr.savepoint():
+                result = self.env['relatic.sale.service'].process_order(payload)
+            log.mark_success(
+                partner_id=result['partner'].id,
+                invoice_id=result['invoice'].id,
+                payment_move_id=result['payment_move'].id or log.payment_move_id.id,
+                processing_time=time.time() - start_time
+            )
+        except ValidationError as e:
+            log.mark_error('VALIDATION_ERROR', str(e), retry=False)
+        except Exception as e:
+            log.mark_error('ODOO_ERROR', f"Error interno: {str(e)}", retry=True)
+        return log.status
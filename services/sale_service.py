@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields
+from odoo.exceptions import ValidationError
+
+from ..core.normalization import normalize_email
+from ..core.totals import TaxSpec, check_payment_amount, compute_order_totals, item_tax_rate
+
+
+class RelaticSaleService(models.Model):
+    _name = 'relatic.sale.service'
+    _description = 'Servicio para procesar ventas completas desde Relatic'
+
+    def process_order(self, payload):
+        """
+        Ejecutar el pipeline contacto → factura → pago de una orden ya validada
+
+        Usado por el webhook y por el motor de reprocesos; el registro del
+        log de sincronización queda a cargo del llamador.
+
+        :param payload: Dict con el payload (contrato JSON v1.0)
+        :return: Dict con partner, invoice, payment_move y already_exists
+        """
+        order_id = payload.get('order_id')
+
+        # 1. Verificar idempotencia (factura ya existe)
+        existing_invoice = self.env['account.move'].search_by_relatic_order_id(order_id)
+        if existing_invoice:
+            return self._existing_result(existing_invoice)
+
+        # 2. Verificar totales con impuestos antes de cualquier escritura
+        # (el webhook y la ingesta ya lo verificaron: relatic_preflight_done)
+        if not self.env.context.get('relatic_preflight_done'):
+            amount_error = self._preflight_check(payload)
+            if amount_error:
+                raise ValidationError(amount_error['message'])
+
+        # 3. Serializar órdenes del mismo miembro (advisory lock por email)
+        member_data = payload.get('member', {})
+        if not self.env.context.get('relatic_skip_member_lock'):
+            self.env['relatic.partner.service']._lock_member(member_data.get('email'))
+
+        # 4. Procesar con lock transaccional (idempotencia)
+        with self.env.cr.savepoint():
+            # Lock transaccional para evitar duplicados simultáneos
+            self.env.cr.execute(
+                "SELECT id FROM account_move WHERE x_relatic_order_id=%s FOR UPDATE",
+                (order_id,)
+            )
+
+            # Verificar nuevamente después del lock
+            existing_invoice = self.env['account.move'].search_by_relatic_order_id(order_id)
+            if existing_invoice:
+                return self._existing_result(existing_invoice)
+
+            partner_service = self.env['relatic.partner.service']
+            invoice_service = self.env['relatic.invoice.service']
+            payment_service = self.env['relatic.payment.service']
+
+            # 5. Crear/actualizar contacto
+            partner = partner_service.create_or_update_partner(member_data)
+
+            # 6. Crear factura
+            items = payload.get('items', [])
+            payment_data = payload.get('payment', {})
+            invoice = invoice_service.create_invoice(
+                partner=partner,
+                order_id=order_id,
+                items=items,
+                payment_data=payment_data
+            )
+
+            # 7. Registrar pago
+            payment_move = payment_service.register_payment(
+                invoice=invoice,
+                partner=partner,
+                payment_data=payment_data
+            )
+
+        return {
+            'partner': partner,
+            'invoice': invoice,
+            'payment_move': payment_move,
+            'already_exists': False,
+        }
+
+    def _preflight_check(self, payload):
+        """
+        Comparar payment.amount con el total con impuestos de la factura
+        
+        Se calcula con el motor de totales (core.totals) sin escribir en la
+        base, así un pago que register_payment rechazaría no deja contacto
+        ni factura confirmada.
+        
+        :param payload: Dict con el payload validado
+        :return: Dict con error (AMOUNT_MISMATCH) o None
+        """
+        payment_amount = (payload.get('payment') or {}).get('amount')
+        if not isinstance(payment_amount, (int, float)):
+            return None
+        totals = self._preflight_totals(payload.get('items', []))
+        if totals is None:
+            return None
+        return check_payment_amount(totals, payment_amount)
+
+    def _preflight_totals(self, items):
+        """
+        Totales de la factura que crearía create_invoice para estos items
+        
+        Resuelve cada tasa con el mismo _get_tax que la factura y usa la
+        precisión de moneda y el método de redondeo de la compañía.
+        
+        :param items: Lista de items del payload
+        :return: Dict de compute_order_totals, o None si algún impuesto no
+                 es un porcentaje simple (el cálculo queda a cargo de Odoo)
+        """
+        invoice_service = self.env['relatic.invoice.service']
+        taxes = {}
+        for item in items:
+            rate = item_tax_rate(item)
+            if not rate or rate <= 0 or rate in taxes:
+                continue
+            tax = invoice_service._get_tax(rate)
+            if not tax:
+                taxes[rate] = None
+                continue
+            if tax.amount_type != 'percent':
+                return None
+            taxes[rate] = TaxSpec(tax.amount, tax.price_include)
+
+        company = self.env.company
+        return compute_order_totals(
+            items,
+            taxes,
+            rounding=company.currency_id.rounding,
+            rounding_method=company.tax_calculation_rounding_method,
+        )
+
+    def preview_order(self, payload):
+        """
+        Ejecutar el pipeline en modo dry-run y retornar la vista previa
+        
+        Resuelve contacto, productos, cuentas e impuestos, calcula los
+        totales de la factura (en borrador, sin número de secuencia) y el
+        diario del pago, y revierte todo al terminar: no deja asientos,
+        contactos ni huecos de secuencia.
+        
+        :param payload: Dict con el payload (contrato JSON v1.0) ya validado
+        :return: Dict serializable con la vista previa
+        """
+        order_id = payload.get('order_id')
+        member_data = payload.get('member', {})
+        payment_data = payload.get('payment', {})
+        
+        existing_invoice = self.env['account.move'].search_by_relatic_order_id(order_id)
+        if existing_invoice:
+            return dict(self._preview_values(existing_invoice, payment_data), already_exists=True)
+        
+        partner_exists = bool(self.env['res.partner'].search_count([
+            ('email', '=ilike', normalize_email(member_data.get('email'))),
+        ], limit=1))
+        
+        with self.env.cr.savepoint() as savepoint:
+            partner = self.env['relatic.partner.service'].create_or_update_partner(member_data)
+            invoice = self.env['relatic.invoice.service'].create_invoice(
+                partner=partner,
+                order_id=order_id,
+                items=payload.get('items', []),
+                payment_data=payment_data,
+                post=False
+            )
+            preview = self._preview_values(invoice, payment_data)
+            preview['partner']['exists'] = partner_exists
+            savepoint.rollback()
+        
+        return dict(preview, already_exists=False)
+
+    def _preview_values(self, invoice, payment_data):
+        """
+        Valores de la vista previa de una factura (solo tipos JSON)
+        
+        :param invoice: account.move (borrador del dry-run o factura existente)
+        :param payment_data: Datos del pago del payload
+        :return: Dict con contacto, factura, líneas y pago
+        """
+        currency = invoice.currency_id
+        journal = self.env['relatic.payment.service']._get_journal(payment_data.get('method', ''))
+        amount = float(payment_data.get('amount', 0) or 0)
+        residual = abs(invoice.amount_residual) if invoice.state == 'posted' else invoice.amount_total
+        return {
+            'order_id': invoice.x_relatic_order_id,
+            'partner': {
+                'name': invoice.partner_id.name,
+                'email': invoice.partner_id.email,
+                'receivable_account': invoice.partner_id.property_account_receivable_id.code,
+                'exists': True,
+            },
+            'invoice': {
+                'state': invoice.state,
+                'number': invoice.name if invoice.state == 'posted' else None,
+                'journal': invoice.journal_id.code,
+                'date': fields.Date.to_string(invoice.invoice_date),
+                'currency': currency.name,
+                'amount_untaxed': invoice.amount_untaxed,
+                'amount_tax': invoice.amount_tax,
+                'amount_total': invoice.amount_total,
+                'amount_residual': residual,
+                'lines': [{
+                    'sku': line.product_id.default_code,
+                    'name': line.name,
+                    'quantity': line.quantity,
+                    'price_unit': line.price_unit,
+                    'account': line.account_id.code,
+                    'taxes': line.tax_ids.mapped('name'),
+                    'price_subtotal': line.price_subtotal,
+                    'price_total': line.price_total,
+                } for line in invoice.invoice_line_ids],
+            },
+            'payment': {
+                'method': payment_data.get('method'),
+                'journal': journal.code if journal else None,
+                'amount': amount,
+                # Misma tolerancia que register_payment
+                'matches_residual': abs(amount - residual) <= 0.01,
+                'difference': currency.round(amount - residual),
+            },
+        }
+
+    def _existing_result(self, invoice):
+        """Resultado para una orden cuya factura ya existe"""
+        return {
+            'partner': invoice.partner_id,
+            'invoice': invoice,
+            'payment_move': self.env['account.move'],
+            'already_exists': True,
+        }
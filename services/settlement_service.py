@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import io
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from odoo import models, fields
+from odoo.exceptions import ValidationError
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_COLUMN_MAP = {
+    'reference': 'reference',
+    'amount': 'amount',
+    'date': 'date',
+}
+
+
+class RelaticSettlementService(models.Model):
+    _name = 'relatic.settlement.service'
+    _description = 'Servicio para conciliar archivos de liquidación de proveedores de pago'
+
+    def match_settlement_file(self, settlement_import, stream, column_map=None, date_format='%Y-%m-%d',
+                              date_tolerance_days=3, chunk_size=2000):
+        """
+        Conciliar un CSV de liquidación (YAPPY/TARJETA) contra los pagos Relatic abiertos
+
+        El archivo se lee fila por fila y los matches se vacían por bloques,
+        por lo que la memoria depende del número de pagos abiertos y de
+        chunk_size, no del tamaño del archivo.
+
+        :param settlement_import: relatic.settlement.import record
+        :param stream: Archivo binario (file object) con el CSV
+        :param column_map: Dict {reference, amount, date} -> nombre de columna en el CSV
+        :param date_format: Formato de fecha del CSV
+        :param date_tolerance_days: Días de diferencia permitidos entre pago y liquidación
+        :param chunk_size: Filas conciliadas por bloque
+        :return: Dict con contadores del proceso
+        """
+        column_map = dict(DEFAULT_COLUMN_MAP, **(column_map or {}))
+        journal = settlement_import.journal_id
+        clearing_account = journal.default_account_id
+        if not clearing_account:
+            raise ValidationError(f"Cuenta por defecto no configurada en diario: {journal.name}")
+
+        start = time.perf_counter()
+        index = self._build_payment_index(journal, clearing_account)
+
+        stats = {
+            'rows': 0,
+            'matched': 0,
+            'unmatched': 0,
+            'reconciled': 0,
+        }
+        matched = []
+        unmatched = []
+
+        reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+        missing = [column for column in column_map.values() if column not in (reader.fieldnames or [])]
+        if missing:
+            raise ValidationError(f"Columnas faltantes en el archivo de liquidación: {', '.join(missing)}")
+
+        for row_number, row in enumerate(reader, start=2):
+            stats['rows'] += 1
+            reference = (row.get(column_map['reference']) or '').strip()
+            try:
+                amount_cents = self._parse_amount_cents(row.get(column_map['amount']))
+                row_date = datetime.strptime((row.get(column_map['date']) or '').strip(), date_format).date()
+            except ValueError:
+                unmatched.append(self._unmatched_values(settlement_import, row_number, reference, row, 'invalid_row'))
+            else:
+                candidate, reason = self._pop_candidate(index, reference, amount_cents, row_date, date_tolerance_days)
+                if candidate:
+                    matched.append(candidate)
+                else:
+                    unmatched.append(self._unmatched_values(
+                        settlement_import, row_number, reference, row, reason,
+                        amount=amount_cents / 100.0, row_date=row_date,
+                    ))
+
+            if len(matched) >= chunk_size:
+                stats['reconciled'] += self._flush_matched(settlement_import, matched)
+                stats['matched'] += len(matched)
+                matched = []
+            if len(unmatched) >= chunk_size:
+                self._flush_unmatched(unmatched)
+                stats['unmatched'] += len(unmatched)
+                unmatched = []
+
+        if matched:
+            stats['reconciled'] += self._flush_matched(settlement_import, matched)
+            stats['matched'] += len(matched)
+        if unmatched:
+            self._flush_unmatched(unmatched)
+            stats['unmatched'] += len(unmatched)
+
+        stats['duration'] = time.perf_counter() - start
+        _logger.info(
+            "Relatic settlement %s: %s filas, %s conciliadas, %s sin match en %.1f s",
+            settlement_import.display_name, stats['rows'], stats['matched'], stats['unmatched'], stats['duration'],
+        )
+        return stats
+
+    def _build_payment_index(self, journal, clearing_account):
+        """
+        Índice hash {referencia: [candidatos]} de pagos Relatic abiertos del diario
+
+        Se construye con dos consultas: los asientos de pago individuales y
+        los pagos del modo agregado (relatic.payment.aggregate), que no
+        tienen asiento propio. Cada candidato es una tupla (move_id,
+        line_id, monto en centavos, fecha, aggregate_id); los pagos
+        agregados llevan move_id y line_id en None.
+
+        :param journal: account.journal record
+        :param clearing_account: account.account record (lado banco del pago)
+        :return: defaultdict(list)
+        """
+        self.env['account.move'].flush_model(['ref', 'date', 'state', 'journal_id',
+                                              'x_relatic_invoice_id', 'x_relatic_settlement_id'])
+        self.env['account.move.line'].flush_model(['move_id', 'account_id', 'debit'])
+        self.env['relatic.payment.aggregate'].flush_model(['journal_id', 'reference', 'amount', 'date',
+                                                           'settlement_id'])
+        self.env.cr.execute("""
+            SELECT am.id, aml.id, am.ref, aml.debit, am.date
+              FROM account_move am
+              JOIN account_move_line aml
+                ON aml.move_id = am.id
+               AND aml.account_id = %s
+               AND aml.debit > 0
+             WHERE am.journal_id = %s
+               AND am.state = 'posted'
+               AND am.x_relatic_invoice_id IS NOT NULL
+               AND am.x_relatic_settlement_id IS NULL
+        """, (clearing_account.id, journal.id))
+
+        index = defaultdict(list)
+        for move_id, line_id, ref, debit, move_date in self.env.cr.fetchall():
+            if ref:
+                index[ref.strip()].append((move_id, line_id, round(debit * 100), move_date, None))
+
+        self.env.cr.execute("""
+            SELECT id, reference, amount, date
+              FROM relatic_payment_aggregate
+             WHERE journal_id = %s
+               AND settlement_id IS NULL
+        """, (journal.id,))
+        for aggregate_id, reference, amount, payment_date in self.env.cr.fetchall():
+            if reference:
+                index[reference.strip()].append((None, None, round(amount * 100), payment_date, aggregate_id))
+        return index
+
+    def _pop_candidate(self, index, reference, amount_cents, row_date, date_tolerance_days):
+        """
+        Buscar y consumir el pago que corresponde a una fila del archivo
+
+        :return: Tupla (candidato o None, motivo si no hay match)
+        """
+        candidates = index.get(reference)
+        if not candidates:
+            return None, 'not_found'
+
+        reason = 'amount_mismatch'
+        for position, candidate in enumerate(candidates):
+            if candidate[2] != amount_cents:
+                continue
+            if abs((candidate[3] - row_date).days) > date_tolerance_days:
+                reason = 'date_mismatch'
+                continue
+            candidates.pop(position)
+            if not candidates:
+                del index[reference]
+            return candidate, None
+        return None, reason
+
+    def _flush_matched(self, settlement_import, matched):
+        """
+        Marcar pagos como liquidados y conciliar el lado banco en bloque
+
+        Los pagos del modo agregado solo se marcan liquidados: su lado banco
+        es la línea consolidada del asiento diario, que no se concilia pago
+        por pago.
+
+        :param settlement_import: relatic.settlement.import record
+        :param matched: Lista de candidatos (move_id, line_id, centavos, fecha, aggregate_id)
+        :return: Número de líneas conciliadas
+        """
+        aggregate_ids = [candidate[4] for candidate in matched if candidate[4]]
+        if aggregate_ids:
+            self.env.cr.execute(
+                "UPDATE relatic_payment_aggregate SET settlement_id = %s WHERE id = ANY(%s)",
+                (settlement_import.id, aggregate_ids)
+            )
+            self.env['relatic.payment.aggregate'].invalidate_model(['settlement_id'])
+
+        matched = [candidate for candidate in matched if not candidate[4]]
+        if not matched:
+            return 0
+        move_ids = [candidate[0] for candidate in matched]
+        self.env.cr.execute(
+            "UPDATE account_move SET x_relatic_settlement_id = %s WHERE id = ANY(%s)",
+            (settlement_import.id, move_ids)
+        )
+        self.env['account.move'].invalidate_model(['x_relatic_settlement_id'])
+
+        journal = settlement_import.journal_id
+        clearing_account = journal.default_account_id
+        bank_account = settlement_import.settlement_account_id
+        if not bank_account or not clearing_account.reconcile:
+            return 0
+
+        payment_lines = self.env['account.move.line'].browse([candidate[1] for candidate in matched])
+        total = sum(candidate[2] for candidate in matched) / 100.0
+
+        # Un asiento de liquidación por bloque: débito único al banco y un
+        # crédito por pago en la cuenta puente para conciliar uno a uno
+        line_vals = [(0, 0, {
+            'account_id': bank_account.id,
+            'debit': total,
+            'credit': 0.0,
+            'name': f"Liquidación {settlement_import.display_name}",
+        })]
+        for line in payment_lines:
+            line_vals.append((0, 0, {
+                'account_id': clearing_account.id,
+                'debit': 0.0,
+                'credit': line.debit,
+                'partner_id': line.partner_id.id,
+                'name': f"Liquidación {line.move_id.ref}",
+            }))
+
+        settlement_move = self.env['account.move'].create({
+            'move_type': 'entry',
+            'date': settlement_import.date or fields.Date.today(),
+            'journal_id': journal.id,
+            'ref': settlement_import.display_name,
+            'x_relatic_settlement_id': settlement_import.id,
+            'line_ids': line_vals,
+        })
+        settlement_move.action_post()
+
+        credit_lines = settlement_move.line_ids.filtered(
+            lambda l: l.account_id == clearing_account
+        ).sorted('id')
+        plan = [payment_line + credit_line for payment_line, credit_line in zip(payment_lines, credit_lines)]
+        self.env['account.move.line']._reconcile_plan(plan)
+        return len(plan)
+
+    def _flush_unmatched(self, unmatched):
+        """Crear en bloque las filas sin match"""
+        self.env['relatic.settlement.import.line'].create(unmatched)
+
+    def _unmatched_values(self, settlement_import, row_number, reference, row, reason, amount=0.0, row_date=False):
+        """Valores de una fila sin match"""
+        return {
+            'import_id': settlement_import.id,
+            'row_number': row_number,
+            'reference': reference,
+            'amount': amount,
+            'date': row_date,
+            'reason': reason,
+            'raw_data': ','.join(value or '' for value in row.values() if isinstance(value, str))[:500],
+        }
+
+    def _parse_amount_cents(self, value):
+        """
+        Convertir monto del CSV a centavos
+
+        :param value: Texto del monto (ej: "1,128.40")
+        :return: int
+        """
+        if value is None:
+            raise ValueError('Monto faltante')
+        return round(float(value.strip().replace(',', '')) * 100)
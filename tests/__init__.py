@@ -1 +1,4 @@
 # -*- coding: utf-8 -*-
+
+from . import test_odoo_services
+from . import test_api_controller
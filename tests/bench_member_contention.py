@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: contención de órdenes concurrentes del mismo miembro
+
+Lanza N threads (cada uno con su propio cursor, como los workers HTTP) que
+ejecutan process_order en paralelo en tres escenarios:
+
+    same_member_locked    Todas las órdenes del mismo miembro, con advisory lock
+    same_member_unlocked  Igual, sin el lock (contexto relatic_skip_member_lock)
+    distinct_members      Un miembro distinto por orden, con advisory lock
+
+Reporta tiempo total, órdenes/s y errores de deadlock / serialización por
+escenario. Cada orden se revierte al terminar; solo el contacto compartido
+se confirma antes de medir (para que las órdenes choquen sobre la misma
+fila de res_partner, como en producción) y se elimina al final.
+
+Requiere el diario YAPPY y el producto MEMB-ANUAL configurados.
+
+Ejecutar desde Odoo shell:
+    odoo-bin shell -d relatic -c /etc/odoo/odoo.conf
+    >>> exec(open('tests/bench_member_contention.py').read())
+    >>> run_benchmark(env)                           # 8 threads x 5 órdenes
+    >>> run_benchmark(env, threads=16, orders_per_thread=10)
+"""
+
+import json
+import threading
+import time
+from datetime import date
+
+from psycopg2 import errors as pg_errors
+
+from odoo import api, SUPERUSER_ID
+from odoo.modules.registry import Registry
+
+
+SHARED_EMAIL = 'bench-contention@relatic.test'
+
+
+def _payload(order_id, email):
+    return {
+        'meta': {'version': '1.0', 'source': 'bench', 'environment': 'dev'},
+        'order_id': order_id,
+        'member': {
+            'email': email,
+            'name': 'Bench Contention',
+            'vat': '8-123-456',
+            'phone': '+507-6123-4567',
+            'country_code': 'PA',
+        },
+        'items': [{'sku': 'MEMB-ANUAL', 'name': 'Membresía Anual', 'qty': 1, 'price': 120.00, 'tax_rate': 0}],
+        'payment': {
+            'method': 'YAPPY',
+            'amount': 120.00,
+            'reference': f'BENCH-{order_id}',
+            'date': date.today().strftime('%Y-%m-%d'),
+            'currency': 'PAB',
+        },
+    }
+
+
+def _worker(dbname, scenario, thread_index, orders_per_thread, barrier, results, lock):
+    """Procesar las órdenes del thread, cada una en su transacción revertida"""
+    threading.current_thread().dbname = dbname
+    registry = Registry(dbname)
+    context = {'relatic_skip_member_lock': True} if scenario == 'same_member_unlocked' else {}
+    stats = {'ok': 0, 'deadlocks': 0, 'serialization': 0, 'other_errors': 0}
+    barrier.wait()
+    for index in range(orders_per_thread):
+        order_id = f'BENCH-{scenario}-{thread_index}-{index}'
+        if scenario == 'distinct_members':
+            email = f'bench-{thread_index}-{index}@relatic.test'
+        else:
+            email = SHARED_EMAIL
+        cr = registry.cursor()
+        try:
+            env = api.Environment(cr, SUPERUSER_ID, context)
+            env['relatic.sale.service'].process_order(_payload(order_id, email))
+            env.flush_all()
+            stats['ok'] += 1
+        except pg_errors.DeadlockDetected:
+            stats['deadlocks'] += 1
+        except pg_errors.SerializationFailure:
+            stats['serialization'] += 1
+        except Exception:
+            stats['other_errors'] += 1
+        finally:
+            cr.rollback()
+            cr.close()
+    with lock:
+        for key, value in stats.items():
+            results[key] += value
+
+
+def _run_scenario(dbname, scenario, threads, orders_per_thread):
+    results = {'ok': 0, 'deadlocks': 0, 'serialization': 0, 'other_errors': 0}
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads + 1)
+    workers = [
+        threading.Thread(
+            target=_worker,
+            args=(dbname, scenario, index, orders_per_thread, barrier, results, lock),
+        )
+        for index in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    total = threads * orders_per_thread
+    return {
+        'scenario': scenario,
+        'orders': total,
+        'elapsed_s': round(elapsed, 3),
+        'orders_per_second': round(total / elapsed, 1) if elapsed else None,
+        **results,
+    }
+
+
+def run_benchmark(env, threads=8, orders_per_thread=5):
+    """
+    Ejecutar benchmark y retornar resultados como JSON
+
+    :param env: Environment de Odoo
+    :param threads: Threads concurrentes (cada uno con su cursor)
+    :param orders_per_thread: Órdenes por thread
+    :return: str JSON con resultados por escenario
+    """
+    dbname = env.cr.dbname
+    partner = env['relatic.partner.service'].create_or_update_partner(
+        _payload('BENCH-SETUP', SHARED_EMAIL)['member']
+    )
+    env.cr.commit()
+
+    results = []
+    try:
+        for scenario in ('same_member_locked', 'same_member_unlocked', 'distinct_members'):
+            print(f"→ {scenario}: {threads} threads x {orders_per_thread} órdenes...")
+            result = _run_scenario(dbname, scenario, threads, orders_per_thread)
+            results.append(result)
+            print(f"✓ {json.dumps(result)}")
+    finally:
+        env.cr.rollback()
+        partner.unlink()
+        env.cr.commit()
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    return output
+
+
+if __name__ == '__main__':
+    print("Este script debe ejecutarse desde Odoo shell:")
+    print("odoo-bin shell -d relatic -c /etc/odoo/odoo.conf")
+    print(">>> exec(open('tests/bench_member_contention.py').read())")
+    print(">>> run_benchmark(env)")
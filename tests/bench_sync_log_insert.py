@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: costo de inserción de relatic.sync.log vs tamaño de la tabla
+
+Llena la tabla con filas sintéticas (10k → 10M) y mide create_log en cada
+tamaño. También mide la consulta del antiguo constraint _check_order_id_unique
+(search_count por order_id/create_date) como referencia.
+Todo se ejecuta en una transacción que se revierte al final.
+
+Ejecutar desde Odoo shell:
+    odoo-bin shell -d relatic -c /etc/odoo/odoo.conf
+    >>> exec(open('tests/bench_sync_log_insert.py').read())
+    >>> run_benchmark(env)                       # 10k, 100k, 1M, 10M
+    >>> run_benchmark(env, sizes=[10000, 100000])
+"""
+
+import json
+import statistics
+import time
+
+
+DEFAULT_SIZES = [10000, 100000, 1000000, 10000000]
+SAMPLES = 500
+
+
+def _fill_table(env, start, end):
+    """Insertar filas sintéticas [start, end) directamente por SQL"""
+    env.cr.execute("""
+        INSERT INTO relatic_sync_log
+               (order_id, payload_hash, attempt, status, retries, source,
+                received_at, create_date, write_date, create_uid, write_uid)
+        SELECT 'BENCH-' || g, md5(g::text), 1, 'success', 0, 'bench',
+               now() - (g || ' seconds')::interval, now(), now(), 1, 1
+          FROM generate_series(%s, %s - 1) g
+    """, (start, end))
+    env.cr.execute("ANALYZE relatic_sync_log")
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def _measure_inserts(env, size):
+    """Medir create_log (INSERT ... ON CONFLICT DO NOTHING) en milisegundos"""
+    SyncLog = env['relatic.sync.log']
+    timings = []
+    for index in range(SAMPLES):
+        payload = {
+            'order_id': f'BENCH-NEW-{size}-{index}',
+            'meta': {'version': '1.0', 'source': 'bench', 'environment': 'dev'},
+        }
+        start = time.perf_counter()
+        SyncLog.create_log(order_id=payload['order_id'], payload=payload)
+        SyncLog.flush_model()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def _measure_legacy_check(env, size):
+    """Medir la consulta del constraint anterior (search_count por día)"""
+    timings = []
+    for index in range(SAMPLES):
+        start = time.perf_counter()
+        env.cr.execute("""
+            SELECT COUNT(*) FROM relatic_sync_log
+             WHERE order_id = %s AND id != %s AND create_date >= current_date
+        """, (f'BENCH-{index * 7}', 0))
+        env.cr.fetchone()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def run_benchmark(env, sizes=None):
+    """
+    Ejecutar benchmark y retornar resultados como JSON
+
+    :param env: Environment de Odoo
+    :param sizes: Tamaños de tabla a medir
+    :return: str JSON con resultados por tamaño
+    """
+    sizes = sizes or DEFAULT_SIZES
+    results = []
+    current = 0
+    try:
+        for size in sizes:
+            print(f"→ Llenando tabla hasta {size} filas...")
+            _fill_table(env, current, size)
+            current = size
+
+            inserts = _measure_inserts(env, size)
+            legacy = _measure_legacy_check(env, size)
+            result = {
+                'table_rows': size,
+                'insert_ms_mean': round(statistics.mean(inserts), 3),
+                'insert_ms_p95': round(_percentile(inserts, 0.95), 3),
+                'legacy_check_ms_mean': round(statistics.mean(legacy), 3),
+            }
+            results.append(result)
+            print(f"✓ {json.dumps(result)}")
+    finally:
+        env.cr.rollback()
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    return output
+
+
+if __name__ == '__main__':
+    print("Este script debe ejecutarse desde Odoo shell:")
+    print("odoo-bin shell -d relatic -c /etc/odoo/odoo.conf")
+    print(">>> exec(open('tests/bench_sync_log_insert.py').read())")
+    print(">>> run_benchmark(env)")
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Servidor stub para probar los callbacks de estado hacia membresia-relatic
+
+Recibe los lotes {"events": [...]} del dispatcher, valida la firma
+X-Relatic-Signature (HMAC-SHA256 del cuerpo exacto) y responde 200, o un
+error simulado según --fail-rate para ejercitar reintentos y backoff.
+
+Ejecutar:
+    python3 tests/callback_stub_server.py --port 8099 --secret TU_SECRET --fail-rate 0.2
+
+Configurar en Odoo:
+    relatic_integration.callback_url = http://localhost:8099/callbacks
+
+Ctrl+C imprime el resumen en JSON (lotes, eventos, firmas inválidas, duplicados).
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import random
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class CallbackStats:
+    """Contadores compartidos entre threads del servidor"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.events = 0
+        self.rejected = 0
+        self.simulated_failures = 0
+        self.seen = set()
+        self.duplicates = 0
+        self.by_status = {}
+
+    def as_dict(self):
+        return {
+            'batches': self.batches,
+            'events': self.events,
+            'unique_events': len(self.seen),
+            'duplicates': self.duplicates,
+            'invalid_signatures': self.rejected,
+            'simulated_failures': self.simulated_failures,
+            'by_status': self.by_status,
+        }
+
+
+def make_handler(secret, fail_rate, stats, verbose):
+
+    class CallbackHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, como el cliente del dispatcher
+
+        def _reply(self, status, body):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            raw = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if secret:
+                expected = hmac.new(secret.encode('utf-8'), raw, hashlib.sha256).hexdigest()
+                if not hmac.compare_digest(expected, self.headers.get('X-Relatic-Signature', '')):
+                    with stats.lock:
+                        stats.rejected += 1
+                    return self._reply(401, {'status': 'error', 'message': 'Firma inválida'})
+
+            if random.random() < fail_rate:
+                with stats.lock:
+                    stats.simulated_failures += 1
+                return self._reply(503, {'status': 'error', 'message': 'Falla simulada'})
+
+            events = json.loads(raw).get('events', [])
+            with stats.lock:
+                stats.batches += 1
+                stats.events += len(events)
+                for event in events:
+                    key = (event.get('sync_log_id'), event.get('status'), event.get('event_at'))
+                    if key in stats.seen:
+                        stats.duplicates += 1
+                    stats.seen.add(key)
+                    stats.by_status[event.get('status')] = stats.by_status.get(event.get('status'), 0) + 1
+            if verbose:
+                print(f"← lote de {len(events)} eventos: {[event.get('order_id') for event in events][:5]}")
+            self._reply(200, {'status': 'ok', 'received': len(events)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return CallbackHandler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Servidor stub de callbacks Relatic')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--secret', default='', help='hmac_secret configurado en Odoo (vacío = no validar)')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Fracción de lotes que responden 503')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    stats = CallbackStats()
+    server = ThreadingHTTPServer(
+        (args.host, args.port),
+        make_handler(args.secret, args.fail_rate, stats, args.verbose),
+    )
+    print(f"Escuchando callbacks en http://{args.host}:{args.port}/callbacks", flush=True)
+    # SIGTERM (p. ej. `timeout` en CI) también imprime el resumen
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(stats.as_dict(), indent=2), flush=True)
+
+
+if __name__ == '__main__':
+    main()
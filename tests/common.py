@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+from contextlib import contextmanager
+
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+
+QUERY_BUDGETS_PATH = os.path.join(os.path.dirname(__file__), 'data', 'query_budgets.json')
+
+# RELATIC_UPDATE_QUERY_BUDGETS=1: registrar los conteos observados en query_budgets.json
+UPDATE_QUERY_BUDGETS = os.environ.get('RELATIC_UPDATE_QUERY_BUDGETS') == '1'
+
+
+class RelaticTestCommon(AccountTestInvoicingCommon):
+    """Datos base de las pruebas Relatic: diario YAPPY, impuesto 7% y productos por SKU"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        params = cls.env['ir.config_parameter'].sudo()
+        params.set_param('relatic_integration.reconcile_mode', 'inline')
+        params.set_param('relatic_integration.payment_aggregation', 'False')
+        params.set_param('relatic_integration.log_mode', 'two_phase')
+
+        cls.journal_yappy = cls.env['account.journal'].create({
+            'name': 'YAPPY',
+            'code': 'YAPY',
+            'type': 'bank',
+        })
+        cls.tax_7 = cls.env['account.tax'].create({
+            'name': 'ITBMS 7%',
+            'amount': 7.0,
+            'amount_type': 'percent',
+            'type_tax_use': 'sale',
+        })
+        income_account = cls.company_data['default_account_revenue']
+        cls.product_annual = cls.env['product.product'].create({
+            'name': 'Membresía Anual',
+            'default_code': 'MEMB-ANUAL',
+            'type': 'service',
+            'sale_ok': True,
+            'property_account_income_id': income_account.id,
+        })
+        cls.product_monthly = cls.env['product.product'].create({
+            'name': 'Membresía Mensual',
+            'default_code': 'MEMB-MENSUAL',
+            'type': 'service',
+            'sale_ok': True,
+            'property_account_income_id': income_account.id,
+        })
+
+    @classmethod
+    def _member_data(cls, suffix):
+        return {
+            'email': f'test{suffix}@relatic.test',
+            'name': f'Test User {suffix}',
+            'phone': '+507-6123-4567',
+            'vat': '8-123-456',
+            'street': 'Calle Test 123',
+            'city': 'Panamá',
+            'country_code': 'PA',
+        }
+
+    @classmethod
+    def _items(cls, count=1, tax_rate=7.0):
+        """Items de prueba alternando membresía anual y mensual"""
+        return [{
+            'sku': 'MEMB-ANUAL' if index % 2 == 0 else 'MEMB-MENSUAL',
+            'name': 'Membresía Anual' if index % 2 == 0 else 'Membresía Mensual',
+            'qty': 1,
+            'price': 120.00 if index % 2 == 0 else 15.00,
+            'tax_rate': tax_rate,
+        } for index in range(count)]
+
+    def _create_invoice(self, suffix, items=None):
+        partner = self.env['relatic.partner.service'].create_or_update_partner(self._member_data(suffix))
+        return self.env['relatic.invoice.service'].create_invoice(
+            partner=partner,
+            order_id=f'ORD-TEST-{suffix}',
+            items=items or self._items(),
+            payment_data={'reference': f'TEST-{suffix}', 'date': '2026-01-20'},
+        )
+
+    def _payment_data(self, invoice, suffix):
+        return {
+            'method': 'YAPPY',
+            'amount': invoice.amount_residual,
+            'reference': f'YAPPY-TEST-{suffix}',
+            'date': '2026-01-20',
+        }
+
+    @contextmanager
+    def assertQueryBudget(self, name):
+        """
+        Verificar que una operación no supere su presupuesto de consultas
+
+        Los presupuestos (tests/data/query_budgets.json) son techos: más
+        consultas que el presupuesto es una regresión del camino caliente.
+        Con RELATIC_UPDATE_QUERY_BUDGETS=1 se registran los conteos
+        observados en el archivo.
+
+        :param name: Llave del presupuesto
+        """
+        with open(QUERY_BUDGETS_PATH, encoding='utf-8') as budgets_file:
+            budgets = json.load(budgets_file)
+        self.env.flush_all()
+        start = self.cr.sql_log_count
+        yield
+        self.env.flush_all()
+        count = self.cr.sql_log_count - start
+
+        if UPDATE_QUERY_BUDGETS:
+            budgets[name] = count
+            with open(QUERY_BUDGETS_PATH, 'w', encoding='utf-8') as budgets_file:
+                json.dump(budgets, budgets_file, indent=2, sort_keys=True)
+                budgets_file.write('\n')
+            return
+
+        budget = budgets[name]
+        self.assertLessEqual(count, budget, f"{name}: {count} consultas, presupuesto {budget}")
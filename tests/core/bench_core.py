@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark del paquete core (sin Odoo ni base de datos)
+
+Mide operaciones por segundo de la validación del payload, la
+normalización del miembro, la firma HMAC y el motor de totales sobre
+payloads como los del webhook (1 y 5 items).
+
+Ejecutar desde la raíz del módulo:
+    python3 tests/core/bench_core.py
+    python3 tests/core/bench_core.py --iterations 50000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date
+
+MODULE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if MODULE_ROOT not in sys.path:
+    sys.path.insert(0, MODULE_ROOT)
+
+from core.normalization import member_shard, normalize_email, normalize_phone, normalize_vat, validate_email  # noqa: E402
+from core.signing import sign, verify_signature  # noqa: E402
+from core.totals import TaxSpec, check_payment_amount, compute_order_totals  # noqa: E402
+from core.validation import validate_sale_payload  # noqa: E402
+
+TAXES = {7.0: TaxSpec(7.0, False), 10.0: TaxSpec(10.0, False)}
+SECRET = 'bench-hmac-secret'
+
+
+def _payload(items_count):
+    items = [{
+        'sku': 'MEMB-ANUAL' if index % 2 == 0 else 'MEMB-MENSUAL',
+        'name': 'Membresía',
+        'qty': 1,
+        'price': 120.0 if index % 2 == 0 else 15.0,
+        'tax_rate': 7.0,
+    } for index in range(items_count)]
+    return {
+        'meta': {'version': '1.0', 'source': 'bench', 'environment': 'dev'},
+        'order_id': f'ORD-BENCH-{items_count}',
+        'member': {'email': 'Bench@Relatic.test', 'name': 'Bench', 'vat': '8-123-456', 'phone': '+507 6123-4567'},
+        'items': items,
+        'payment': {
+            'method': 'YAPPY',
+            'amount': compute_order_totals(items, TAXES)['amount_total'],
+            'reference': 'YAPPY-BENCH',
+            'date': '2026-01-20',
+        },
+    }
+
+
+def _measure(name, func, iterations):
+    start = time.perf_counter()
+    for dummy in range(iterations):
+        func()
+    elapsed = time.perf_counter() - start
+    return {
+        'operation': name,
+        'iterations': iterations,
+        'us_per_op': round(elapsed / iterations * 1e6, 2),
+        'ops_per_second': round(iterations / elapsed),
+    }
+
+
+def run_benchmark(iterations=20000):
+    """
+    Ejecutar benchmark y retornar resultados como JSON
+
+    :param iterations: Repeticiones por operación
+    :return: str JSON con resultados por operación
+    """
+    today = date(2026, 1, 31)
+    results = []
+    for items_count in (1, 5):
+        payload = _payload(items_count)
+        body = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+        signature = sign(SECRET, body)
+        member = payload['member']
+
+        def full_preflight():
+            verify_signature(SECRET, body, signature)
+            validate_sale_payload(payload, today=today)
+            validate_email(normalize_email(member['email']))
+            normalize_phone(member['phone'])
+            normalize_vat(member['vat'])
+            member_shard(member['email'])
+            check_payment_amount(compute_order_totals(payload['items'], TAXES), payload['payment']['amount'])
+
+        results.extend([
+            _measure(f'validate_sale_payload[{items_count}]', lambda: validate_sale_payload(payload, today=today), iterations),
+            _measure(f'verify_signature[{items_count}]', lambda: verify_signature(SECRET, body, signature), iterations),
+            _measure(f'compute_order_totals[{items_count}]', lambda: compute_order_totals(payload['items'], TAXES), iterations),
+            _measure(f'preflight_completo[{items_count}]', full_preflight, iterations),
+        ])
+    results.append(_measure('normalize_member', lambda: (
+        normalize_email('Bench@Relatic.test'), normalize_phone('+507 6123-4567'), normalize_vat(' 8-123-456 '),
+    ), iterations))
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    return output
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark del paquete core de Relatic')
+    parser.add_argument('--iterations', type=int, default=20000)
+    run_benchmark(parser.parse_args().iterations)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Pruebas rápidas del paquete core: sin Odoo ni base de datos
+
+Ejecutar desde la raíz del módulo:
+    python -m pytest -q
+"""
+
+import json
+import os
+import sys
+from datetime import date
+
+import pytest
+
+MODULE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if MODULE_ROOT not in sys.path:
+    sys.path.insert(0, MODULE_ROOT)
+
+CORPUS_PATH = os.path.join(MODULE_ROOT, 'tests', 'data', 'totals_corpus.json')
+
+
+@pytest.fixture
+def sale_payload():
+    """Payload v1.0 válido (mismo formato que test_integration.create_payload)"""
+    return {
+        'meta': {'version': '1.0', 'source': 'membresia-relatic', 'environment': 'test'},
+        'order_id': 'ORD-2026-CORE001',
+        'member': {
+            'email': 'Test.Core@Relatic.test',
+            'name': 'Test Core',
+            'vat': '8-123-456',
+            'phone': '+507 6123-4567',
+            'country_code': 'PA',
+        },
+        'items': [{'sku': 'MEMB-ANUAL', 'name': 'Membresía Anual', 'qty': 1, 'price': 120.0, 'tax_rate': 7.0}],
+        'payment': {
+            'method': 'YAPPY',
+            'amount': 128.4,
+            'reference': 'YAPPY-CORE-001',
+            'date': '2026-01-20',
+            'currency': 'PAB',
+        },
+    }
+
+
+@pytest.fixture
+def today():
+    return date(2026, 1, 31)
+
+
+@pytest.fixture(scope='session')
+def totals_corpus():
+    with open(CORPUS_PATH, encoding='utf-8') as corpus_file:
+        return json.load(corpus_file)
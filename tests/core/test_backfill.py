@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import copy
+import json
+
+from core.backfill import load_checkpoint, partition_of, read_partition, save_checkpoint, worker_paths
+from core.normalization import member_shard
+
+
+def _lines(sale_payload, count):
+    """Export JSONL con una orden por línea, un miembro distinto cada una"""
+    lines = []
+    for index in range(count):
+        payload = copy.deepcopy(sale_payload)
+        payload['order_id'] = f'ORD-2026-BF{index:03d}'
+        payload['member']['email'] = f'miembro{index}@relatic.test'
+        lines.append(json.dumps(payload) + '\n')
+    return lines
+
+
+def test_checkpoint_round_trip(tmp_path):
+    checkpoint_path, errors_path = worker_paths(str(tmp_path), '/datos/ordenes.jsonl', 1, 4)
+    assert checkpoint_path == str(tmp_path / 'ordenes.jsonl.worker1of4.json')
+    assert errors_path == str(tmp_path / 'ordenes.jsonl.worker1of4.errors.jsonl')
+
+    initial = {'line': 0, 'created': 0, 'existing': 0, 'errors': 0, 'elapsed': 0.0}
+    assert load_checkpoint(checkpoint_path, dict(initial)) == initial
+
+    state = {'line': 42, 'created': 30, 'existing': 5, 'errors': 2, 'elapsed': 1.5}
+    save_checkpoint(checkpoint_path, state)
+    assert load_checkpoint(checkpoint_path, dict(initial)) == state
+    assert not (tmp_path / 'ordenes.jsonl.worker1of4.json.tmp').exists()
+
+
+def test_resume_skips_processed_lines(sale_payload, today, tmp_path):
+    lines = _lines(sale_payload, 6)
+    checkpoint_path = worker_paths(str(tmp_path), 'ordenes.jsonl', 0, 1)[0]
+    save_checkpoint(checkpoint_path, {'line': 4})
+
+    state = load_checkpoint(checkpoint_path, {'line': 0})
+    resumed = list(read_partition(lines, 0, 1, state['line'], today=today))
+    assert [line_no for line_no, payload, error in resumed] == [5, 6]
+    assert [payload['order_id'] for line_no, payload, error in resumed] == ['ORD-2026-BF004', 'ORD-2026-BF005']
+    assert all(error is None for line_no, payload, error in resumed)
+
+
+def test_partition_by_member_shard(sale_payload, today):
+    workers = 3
+    lines = _lines(sale_payload, 30)
+    # Otra orden del primer miembro, con el email en otro formato
+    repeat = json.loads(lines[0])
+    repeat['order_id'] = 'ORD-2026-BF999'
+    repeat['member']['email'] = ' MIEMBRO0@Relatic.TEST'
+    lines.append(json.dumps(repeat) + '\n')
+
+    assigned = {}
+    for index in range(workers):
+        for line_no, payload, error in read_partition(lines, index, workers, today=today):
+            assert line_no not in assigned
+            assigned[line_no] = index
+            assert index == member_shard(payload['member']['email']) % workers
+            assert index == partition_of(payload, workers)
+
+    # Cada línea en exactamente un worker; el mismo miembro siempre en el mismo
+    assert sorted(assigned) == list(range(1, len(lines) + 1))
+    assert assigned[len(lines)] == assigned[1]
+    assert len(set(assigned.values())) == workers
+
+
+def test_invalid_lines_reported_once(sale_payload, today):
+    lines = _lines(sale_payload, 2) + ['{no es json\n', '[1, 2]\n', '\n']
+    reported = [
+        (index, line_no, error['code'])
+        for index in range(2)
+        for line_no, payload, error in read_partition(lines, index, 2, today=today)
+        if payload is None
+    ]
+    assert reported == [(0, 3, 'INVALID_PAYLOAD'), (0, 4, 'INVALID_PAYLOAD')]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+
+import subprocess
+import sys
+
+from conftest import MODULE_ROOT
+
+
+def test_core_imports_without_odoo():
+    """El paquete core no arrastra Odoo ni psycopg2 y carga en milisegundos"""
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import core.backfill, core.normalization, core.signing, core.totals, core.validation\n"
+        "elapsed = time.perf_counter() - start\n"
+        "assert not {'odoo', 'psycopg2'} & set(sys.modules), sorted(sys.modules)\n"
+        "print(elapsed)\n"
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', code], cwd=MODULE_ROOT, capture_output=True, text=True, check=True,
+    )
+    assert float(result.stdout) < 0.5
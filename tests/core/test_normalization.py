@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from core.normalization import member_shard, normalize_email, normalize_phone, normalize_vat, validate_email
+
+
+@pytest.mark.parametrize('email, valid', [
+    ('miembro@relatic.org', True),
+    ('nombre.apellido+tag@sub.relatic.org', True),
+    ('sin-arroba.relatic.org', False),
+    ('miembro@relatic', False),
+    ('', False),
+    (None, False),
+])
+def test_validate_email(email, valid):
+    assert validate_email(email) is valid
+
+
+def test_normalize_email():
+    assert normalize_email('  Test.Core@Relatic.TEST ') == 'test.core@relatic.test'
+    assert normalize_email(None) == ''
+
+
+def test_normalize_phone():
+    assert normalize_phone(' +507 6123-4567 ') == '+50761234567'
+    assert normalize_phone('(507) 612.34.567') == '50761234567'
+    assert normalize_phone('') == ''
+
+
+def test_normalize_vat():
+    assert normalize_vat(' 8-123-456 ') == '8-123-456'
+    assert normalize_vat('pe-12-345') == 'PE-12-345'
+    assert normalize_vat(None) == ''
+
+
+def test_member_shard_stable_per_member():
+    shard = member_shard('Test.Core@Relatic.test')
+    assert shard == member_shard('  test.core@relatic.TEST')
+    assert 0 <= shard < 2 ** 31
+    assert shard != member_shard('otro@relatic.test')
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import hmac
+import json
+
+from core.signing import compare_signature, sign, signer, verify_signature
+
+SECRET = 'test-hmac-secret'
+
+
+def test_sign_matches_membresia():
+    """Misma firma que genera membresia-relatic sobre el JSON canónico"""
+    body = json.dumps({'order_id': 'ORD-1', 'amount': 128.4}, sort_keys=True, separators=(',', ':'))
+    expected = hmac.new(SECRET.encode('utf-8'), body.encode('utf-8'), hashlib.sha256).hexdigest()
+    assert sign(SECRET, body) == expected
+    assert sign(SECRET, body.encode('utf-8')) == expected
+
+
+def test_verify_signature():
+    body = '{"order_id":"ORD-1"}'
+    assert verify_signature(SECRET, body, sign(SECRET, body))
+    assert not verify_signature(SECRET, body + ' ', sign(SECRET, body))
+    assert not verify_signature(SECRET, body, '0' * 64)
+    assert not verify_signature(SECRET, body, '')
+
+
+def test_verify_without_secret():
+    """Sin secret configurado no se valida (solo desarrollo), pero la firma es obligatoria"""
+    assert verify_signature('', '{}', 'cualquiera')
+    assert not verify_signature('', '{}', '')
+
+
+def test_incremental_signer_matches_sign():
+    """La firma por bloques (ingesta NDJSON) coincide con la firma del cuerpo completo"""
+    body = b''.join(b'{"order_id":"ORD-%d"}\n' % index for index in range(100))
+    incremental = signer(SECRET)
+    for offset in range(0, len(body), 64):
+        incremental.update(body[offset:offset + 64])
+    assert incremental.hexdigest() == sign(SECRET, body)
+    assert compare_signature(SECRET, incremental.hexdigest(), sign(SECRET, body))
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from core.totals import TaxSpec, check_payment_amount, compute_order_totals, float_round
+
+
+def _corpus_taxes(corpus):
+    return {rate: TaxSpec(rate, False) for rate in corpus['taxes']}
+
+
+def test_corpus(totals_corpus):
+    """Mismos totales que account.move (verificados en test_odoo_services)"""
+    taxes = _corpus_taxes(totals_corpus)
+    for case in totals_corpus['cases']:
+        totals = compute_order_totals(case['items'], taxes)
+        for field, expected in case['expected'].items():
+            assert totals[field] == pytest.approx(expected, abs=1e-9), (case['name'], field)
+
+
+@pytest.mark.parametrize('value, expected', [
+    (0.035, 0.04),
+    (2.675, 2.68),
+    (1.005, 1.01),
+    (-0.035, -0.04),
+    (49.995, 50.0),
+    (0.0, 0.0),
+])
+def test_float_round_half_up(value, expected):
+    assert float_round(value, 0.01) == expected
+
+
+def test_round_globally_differs_from_per_line(totals_corpus):
+    case = next(case for case in totals_corpus['cases'] if case['name'] == 'medio_centavo_por_linea')
+    taxes = _corpus_taxes(totals_corpus)
+    assert compute_order_totals(case['items'], taxes)['amount_tax'] == 0.12
+    assert compute_order_totals(case['items'], taxes, rounding_method='round_globally')['amount_tax'] == 0.11
+
+
+def test_price_included_tax():
+    items = [{'sku': 'MEMB-ANUAL', 'qty': 1, 'price': 107.0, 'tax_rate': 7.0}]
+    totals = compute_order_totals(items, {7.0: TaxSpec(7.0, True)})
+    assert (totals['amount_untaxed'], totals['amount_tax'], totals['amount_total']) == (100.0, 7.0, 107.0)
+
+
+def test_check_payment_amount():
+    totals = compute_order_totals([{'qty': 1, 'price': 120.0, 'tax_rate': 7.0}], {7.0: TaxSpec(7.0, False)})
+    assert check_payment_amount(totals, 128.40) is None
+    assert check_payment_amount(totals, 128.41) is None
+    assert check_payment_amount(totals, 120.0)['code'] == 'AMOUNT_MISMATCH'
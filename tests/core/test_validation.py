@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from core.validation import MAX_REFUND_BATCH, validate_refund_payload, validate_sale_payload
+
+
+def test_valid_payload(sale_payload, today):
+    assert validate_sale_payload(sale_payload, today=today) is None
+
+
+@pytest.mark.parametrize('field', ['meta', 'order_id', 'member', 'items', 'payment'])
+def test_missing_required_field(sale_payload, today, field):
+    del sale_payload[field]
+    error = validate_sale_payload(sale_payload, today=today)
+    assert error['code'] == 'INVALID_PAYLOAD'
+    assert field in error['message']
+
+
+@pytest.mark.parametrize('mutate, code', [
+    (lambda p: p['meta'].pop('environment'), 'INVALID_PAYLOAD'),
+    (lambda p: p.update(order_id=''), 'INVALID_PAYLOAD'),
+    (lambda p: p['member'].update(email='sin-arroba'), 'INVALID_EMAIL'),
+    (lambda p: p['member'].update(name=''), 'INVALID_PAYLOAD'),
+    (lambda p: p.update(items=[]), 'EMPTY_ITEMS'),
+    (lambda p: p['items'][0].pop('sku'), 'INVALID_PAYLOAD'),
+    (lambda p: p['items'][0].update(qty=0), 'INVALID_QUANTITY'),
+    (lambda p: p['items'][0].update(price=-1), 'INVALID_PRICE'),
+    (lambda p: p['payment'].pop('reference'), 'INVALID_PAYLOAD'),
+    (lambda p: p['payment'].update(amount='128.40'), 'INVALID_PAYLOAD'),
+    (lambda p: p['payment'].update(date='20/01/2026'), 'INVALID_DATE'),
+    (lambda p: p['payment'].update(date=None), 'INVALID_DATE'),
+    (lambda p: p['payment'].update(date='2026-02-01'), 'INVALID_DATE'),
+    (lambda p: p['member'].update(vat='8'), 'INVALID_VAT'),
+])
+def test_invalid_payload(sale_payload, today, mutate, code):
+    mutate(sale_payload)
+    assert validate_sale_payload(sale_payload, today=today)['code'] == code
+
+
+def test_amount_not_checked_without_taxes(sale_payload, today):
+    """El total con impuestos lo valida core.totals, no la estructura"""
+    sale_payload['payment']['amount'] = 1.0
+    assert validate_sale_payload(sale_payload, today=today) is None
+
+
+def test_refund_payload():
+    assert validate_refund_payload({'order_ids': ['ORD-1', 'ORD-2'], 'reason': 'Baja'}) is None
+    assert validate_refund_payload({'order_ids': []})['code'] == 'INVALID_PAYLOAD'
+    assert validate_refund_payload({'order_ids': ['ORD-1', '']})['code'] == 'INVALID_PAYLOAD'
+    assert validate_refund_payload({'order_ids': ['ORD-1'], 'reason': 3})['code'] == 'INVALID_PAYLOAD'
+
+    too_many = {'order_ids': [f'ORD-{index}' for index in range(MAX_REFUND_BATCH + 1)]}
+    assert str(MAX_REFUND_BATCH) in validate_refund_payload(too_many)['message']
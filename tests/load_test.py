@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prueba de carga concurrente del webhook /api/relatic/v1/sale
+
+Dispara requests firmados en paralelo contra una instancia local de Odoo
+con una mezcla de órdenes nuevas, duplicadas (reentregas del mismo payload),
+fallas parciales (SKU inexistente: pasa validación y falla al facturar) y
+órdenes con varios items. Reporta en JSON throughput, latencias p50/p95/p99,
+tasas de error por código y deadlocks.
+
+Reutiliza create_payload y generate_hmac_signature de test_integration.py;
+el cuerpo se envía con los mismos bytes canónicos que se firman.
+
+Ejecutar desde la raíz del módulo:
+    python3 tests/load_test.py --url http://localhost:8069 --requests 2000 --concurrency 16
+    python3 tests/load_test.py --mix new=50,duplicate=30,failure=10,multi=10 \\
+        --pg-dsn "dbname=relatic user=odoo" --output load_report.json
+
+Los deadlocks se leen de pg_stat_database (requiere --pg-dsn y psycopg2);
+sin DSN solo se cuentan las respuestas cuyo mensaje menciona "deadlock".
+"""
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import test_integration
+from test_integration import TestRelaticIntegration
+
+
+DEFAULT_MIX = {'new': 60, 'duplicate': 20, 'failure': 10, 'multi': 10}
+
+MULTI_ITEMS = [
+    {"sku": "MEMB-ANUAL", "name": "Membresía Anual", "qty": 1, "price": 120.00, "tax_rate": 7.0},
+    {"sku": "MEMB-MENSUAL", "name": "Membresía Mensual", "qty": 2, "price": 15.00, "tax_rate": 7.0},
+]
+
+FAILURE_ITEMS = [
+    {"sku": "LOADTEST-SKU-INEXISTENTE", "name": "Producto inexistente", "qty": 1, "price": 10.00, "tax_rate": 7.0},
+]
+
+
+class LoadTest:
+    """Generador de carga sobre el webhook de ventas"""
+
+    def __init__(self, url, total, concurrency, mix, timeout=60):
+        self.endpoint = f"{url.rstrip('/')}/api/relatic/v1/sale"
+        self.total = total
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.kinds = list(mix)
+        self.weights = [mix[kind] for kind in self.kinds]
+        self.helper = TestRelaticIntegration()
+
+        # Sufijos únicos por ejecución para no chocar con corridas anteriores
+        self.base_suffix = int(time.time()) % 100000 * 100000
+        self.counter = 0
+        self.sent = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def _session(self):
+        """Una sesión HTTP (keep-alive) por thread"""
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def _next_suffix(self):
+        with self.lock:
+            self.counter += 1
+            return self.base_suffix + self.counter
+
+    def build_request(self, kind):
+        """
+        Payload para un tipo de request
+
+        :param kind: 'new', 'duplicate', 'failure' o 'multi'
+        :return: Tupla (tipo efectivo, payload)
+        """
+        if kind == 'duplicate':
+            with self.lock:
+                if self.sent:
+                    return kind, random.choice(self.sent)
+            kind = 'new'
+
+        items = {'multi': MULTI_ITEMS, 'failure': FAILURE_ITEMS}.get(kind)
+        payload = self.helper.create_payload(order_id_suffix=self._next_suffix(), items_override=items)
+        if kind in ('new', 'multi'):
+            with self.lock:
+                self.sent.append(payload)
+        return kind, payload
+
+    def send(self, kind, payload):
+        """
+        Enviar un request firmado con los bytes canónicos del payload
+
+        :return: Dict con tipo, latencia, status HTTP y código de error
+        """
+        body = json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        headers = {
+            'Authorization': f'Bearer {test_integration.API_KEY}',
+            'Content-Type': 'application/json',
+            'X-Relatic-Signature': self.helper.generate_hmac_signature(payload),
+        }
+        result = {
+            'kind': kind, 'http_status': None, 'status': None,
+            'error_code': None, 'warning': None, 'message': None,
+        }
+        start = time.perf_counter()
+        try:
+            response = self._session().post(self.endpoint, data=body, headers=headers, timeout=self.timeout)
+            result['http_status'] = response.status_code
+            data = response.json()
+            # type='json': la respuesta del controlador viene en "result" (JSON-RPC)
+            data = data.get('result', data) if isinstance(data, dict) else {}
+            result['status'] = data.get('status')
+            error = data.get('error') or {}
+            if isinstance(error, dict):
+                result['error_code'] = error.get('code')
+                result['message'] = error.get('message')
+            result['warning'] = data.get('warning')
+        except (requests.exceptions.RequestException, ValueError) as e:
+            result['status'] = 'error'
+            result['error_code'] = 'TRANSPORT_ERROR'
+            result['message'] = str(e)
+        result['latency'] = time.perf_counter() - start
+        return result
+
+    def _run_one(self, dummy):
+        kind = random.choices(self.kinds, weights=self.weights)[0]
+        return self.send(*self.build_request(kind))
+
+    def run(self):
+        """
+        Ejecutar la carga
+
+        :return: Tupla (resultados, segundos transcurridos)
+        """
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            results = list(executor.map(self._run_one, range(self.total)))
+        return results, time.perf_counter() - start
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def _latency_summary(results):
+    latencies = [result['latency'] * 1000 for result in results]
+    if not latencies:
+        return {}
+    return {
+        'count': len(latencies),
+        'mean_ms': round(statistics.mean(latencies), 1),
+        'p50_ms': round(_percentile(latencies, 0.50), 1),
+        'p95_ms': round(_percentile(latencies, 0.95), 1),
+        'p99_ms': round(_percentile(latencies, 0.99), 1),
+        'max_ms': round(max(latencies), 1),
+    }
+
+
+def _pg_deadlocks(dsn):
+    """Contador acumulado de deadlocks de la base (pg_stat_database)"""
+    if not dsn:
+        return None
+    import psycopg2
+    with psycopg2.connect(dsn) as conn, conn.cursor() as cr:
+        cr.execute("SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()")
+        return cr.fetchone()[0]
+
+
+def build_report(results, elapsed, concurrency, deadlocks_before=None, deadlocks_after=None):
+    """
+    Reporte JSON de la carga
+
+    :return: Dict con throughput, latencias, tasas de error y deadlocks
+    """
+    errors = [result for result in results if result['status'] != 'success']
+    error_codes = {}
+    for result in errors:
+        code = result['error_code'] or f"HTTP_{result['http_status']}"
+        error_codes[code] = error_codes.get(code, 0) + 1
+
+    by_kind = {}
+    for kind in sorted({result['kind'] for result in results}):
+        kind_results = [result for result in results if result['kind'] == kind]
+        summary = _latency_summary(kind_results)
+        summary['error_rate'] = round(
+            sum(1 for result in kind_results if result['status'] != 'success') / len(kind_results), 4
+        )
+        by_kind[kind] = summary
+
+    warnings = {}
+    for result in results:
+        if result['warning']:
+            warnings[result['warning']] = warnings.get(result['warning'], 0) + 1
+
+    deadlock_responses = sum(
+        1 for result in results if 'deadlock' in (result['message'] or '').lower()
+    )
+    return {
+        'requests': len(results),
+        'concurrency': concurrency,
+        'elapsed_s': round(elapsed, 2),
+        'throughput_rps': round(len(results) / elapsed, 2) if elapsed else None,
+        'latency': _latency_summary(results),
+        'error_rate': round(len(errors) / len(results), 4) if results else 0,
+        'error_codes': error_codes,
+        'warnings': warnings,
+        'by_kind': by_kind,
+        'deadlocks': {
+            'pg_stat_database': (
+                deadlocks_after - deadlocks_before if deadlocks_before is not None else None
+            ),
+            'responses': deadlock_responses,
+        },
+    }
+
+
+def _parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        kind, weight = part.split('=')
+        if kind not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Tipo desconocido: {kind}")
+        mix[kind] = int(weight)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Prueba de carga del webhook Relatic')
+    parser.add_argument('--url', default='http://localhost:8069', help='URL base de Odoo')
+    parser.add_argument('--api-key', default=test_integration.API_KEY)
+    parser.add_argument('--hmac-secret', default=test_integration.HMAC_SECRET)
+    parser.add_argument('--requests', type=int, default=1000, help='Total de requests')
+    parser.add_argument('--concurrency', type=int, default=8, help='Requests en paralelo')
+    parser.add_argument('--mix', type=_parse_mix, default=DEFAULT_MIX,
+                        help='Pesos por tipo, ej: new=60,duplicate=20,failure=10,multi=10')
+    parser.add_argument('--timeout', type=int, default=60, help='Timeout por request (segundos)')
+    parser.add_argument('--pg-dsn', help='DSN de PostgreSQL para contar deadlocks (opcional)')
+    parser.add_argument('--seed', type=int, help='Semilla para reproducir la mezcla')
+    parser.add_argument('--output', help='Archivo del reporte JSON (default: stdout)')
+    args = parser.parse_args(argv)
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    # Los helpers de test_integration leen la configuración del módulo
+    test_integration.API_KEY = args.api_key
+    test_integration.HMAC_SECRET = args.hmac_secret
+
+    load_test = LoadTest(args.url, args.requests, args.concurrency, args.mix, timeout=args.timeout)
+    deadlocks_before = _pg_deadlocks(args.pg_dsn)
+    results, elapsed = load_test.run()
+    deadlocks_after = _pg_deadlocks(args.pg_dsn)
+
+    report = build_report(results, elapsed, args.concurrency, deadlocks_before, deadlocks_after)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as report_file:
+            report_file.write(output + '\n')
+    print(output)
+    return report
+
+
+if __name__ == '__main__':
+    report = main()
+    sys.exit(0 if report['requests'] else 1)
@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""
+Pruebas HTTP de los webhooks /sale (con presupuesto de consultas) y /refunds,
+la ingesta NDJSON y la exportación de órdenes
+
+Ejecutar:
+    odoo-bin -d relatic_test -i relatic_integration --test-tags /relatic_integration --stop-after-init
+"""
+
+import hashlib
+import hmac
+import gzip
+import json
+from datetime import date
+from unittest.mock import patch
+
+from psycopg2 import errors as pg_errors
+
+from odoo import fields
+from odoo.tests import HttpCase, tagged
+
+from ..controllers import api_controller
+from .common import RelaticTestCommon
+
+
+API_KEY = 'test-api-key'
+HMAC_SECRET = 'test-hmac-secret'
+
+
+@tagged('post_install', '-at_install')
+class TestApiController(RelaticTestCommon, HttpCase):
+    """Camino completo del controlador"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        params = cls.env['ir.config_parameter'].sudo()
+        params.set_param('relatic_integration.api_key', API_KEY)
+        params.set_param('relatic_integration.hmac_secret', HMAC_SECRET)
+
+    def _payload(self, suffix, items=None):
+        items = items or self._items(1, tax_rate=0)
+        return {
+            'meta': {'version': '1.0', 'source': 'membresia-relatic', 'environment': 'dev'},
+            'order_id': f'ORD-TEST-HTTP-{suffix}',
+            'member': self._member_data(f'http{suffix}'),
+            'items': items,
+            'payment': {
+                'method': 'YAPPY',
+                'amount': self.env['relatic.sale.service']._preflight_totals(items)['amount_total'],
+                'reference': f'YAPPY-HTTP-{suffix}',
+                'date': date.today().strftime('%Y-%m-%d'),
+                'currency': 'PAB',
+            },
+        }
+
+    def _post(self, payload, signature=None, headers=None, url='/api/relatic/v1/sale'):
+        """POST firmado con los mismos bytes canónicos que se envían"""
+        body = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+        if signature is None:
+            signature = hmac.new(HMAC_SECRET.encode('utf-8'), body.encode('utf-8'), hashlib.sha256).hexdigest()
+        response = self.url_open(
+            url,
+            data=body,
+            headers={
+                'Authorization': f'Bearer {API_KEY}',
+                'Content-Type': 'application/json',
+                'X-Relatic-Signature': signature,
+                **(headers or {}),
+            },
+        )
+        return response.json().get('result', {})
+
+    def test_sale_webhook(self):
+        """Payload válido: crea factura, pago y log exitoso"""
+        # Calentar cachés de rutas, parámetros y secuencias
+        self._post(self._payload('warmup'))
+
+        with self.assertQueryBudget('sale_webhook'):
+            result = self._post(self._payload('001'))
+
+        self.assertEqual(result.get('status'), 'success', result)
+        invoice = self.env['account.move'].browse(result['data']['invoice_id'])
+        self.assertEqual(invoice.x_relatic_order_id, 'ORD-TEST-HTTP-001')
+        self.assertEqual(invoice.payment_state, 'paid')
+        log = self.env['relatic.sync.log'].browse(result['data']['sync_log_id'])
+        self.assertEqual(log.status, 'success')
+
+    def test_sale_webhook_idempotency(self):
+        """Reentrega de la misma orden retorna la factura existente"""
+        payload = self._payload('002')
+        first = self._post(payload)
+        second = self._post(payload)
+
+        self.assertEqual(second.get('warning'), 'INVOICE_EXISTS')
+        self.assertEqual(second['data']['invoice_id'], first['data']['invoice_id'])
+
+    def test_sale_webhook_invalid_signature(self):
+        """Firma HMAC inválida"""
+        result = self._post(self._payload('003'), signature='0' * 64)
+        self.assertEqual(result['error']['code'], 'INVALID_SIGNATURE')
+
+    def test_sale_webhook_retries_deadlock(self):
+        """Un deadlock transitorio se reintenta y queda registrado en tx_attempts"""
+        SaleService = type(self.env['relatic.sale.service'])
+        process_order = SaleService.process_order
+        calls = []
+
+        def flaky_process_order(service, payload):
+            calls.append(payload['order_id'])
+            if len(calls) == 1:
+                raise pg_errors.DeadlockDetected()
+            return process_order(service, payload)
+
+        with patch.object(SaleService, 'process_order', flaky_process_order):
+            result = self._post(self._payload('004'))
+
+        self.assertEqual(result.get('status'), 'success', result)
+        self.assertEqual(len(calls), 2)
+        log = self.env['relatic.sync.log'].browse(result['data']['sync_log_id'])
+        self.assertEqual(log.tx_attempts, 2)
+        self.assertEqual(
+            self.env['relatic.sync.log'].search_count([('order_id', '=', 'ORD-TEST-HTTP-004')]), 1,
+            "El log del intento revertido no debe persistir",
+        )
+
+    def test_sale_webhook_inflight(self):
+        """Orden en proceso en otro request: 409 reintentable; la marca se libera al terminar"""
+        self.env['ir.config_parameter'].sudo().set_param('relatic_integration.inflight_wait_ms', '200')
+        Inflight = self.env['relatic.inflight.order'].sudo()
+        marker = Inflight.create({
+            'order_id': 'ORD-TEST-HTTP-005',
+            'token': 'otro-request',
+            'started_at': fields.Datetime.now(),
+        })
+        self.env.flush_all()
+        result = self._post(self._payload('005'))
+        self.assertEqual(result['error']['code'], 'ORDER_IN_FLIGHT')
+        self.assertTrue(result['retry'])
+
+        marker.unlink()
+        self.env.flush_all()
+        result = self._post(self._payload('005'))
+        self.assertEqual(result.get('status'), 'success', result)
+        self.assertFalse(Inflight.search([('order_id', '=', 'ORD-TEST-HTTP-005')]))
+
+    def test_sale_webhook_dry_run(self):
+        """Dry-run: vista previa con impuesto, pendiente y pre-flight, sin factura, contacto ni log"""
+        payload = self._payload('006', items=self._items(1))
+        # Pago sin impuesto: el dry-run muestra la diferencia en vez de rechazar
+        payload['payment']['amount'] = 120.00
+        result = self._post(payload, headers={'X-Relatic-Dry-Run': '1'})
+
+        self.assertEqual(result.get('status'), 'success', result)
+        preview = result['data']
+        self.assertTrue(preview['dry_run'])
+        self.assertFalse(preview['already_exists'])
+        self.assertFalse(preview['partner']['exists'])
+        self.assertAlmostEqual(preview['invoice']['amount_tax'], 8.40)
+        self.assertAlmostEqual(preview['invoice']['amount_residual'], 128.40)
+        self.assertEqual(preview['invoice']['number'], None)
+        self.assertEqual(preview['payment']['journal'], self.journal_yappy.code)
+        self.assertFalse(preview['payment']['matches_residual'])
+        self.assertAlmostEqual(preview['payment']['difference'], -8.40)
+        self.assertEqual(preview['preflight']['code'], 'AMOUNT_MISMATCH')
+
+        self.assertFalse(self.env['account.move'].search_by_relatic_order_id('ORD-TEST-HTTP-006'))
+        self.assertFalse(self.env['res.partner'].search([('email', '=', payload['member']['email'])]))
+        self.assertFalse(self.env['relatic.sync.log'].search([('order_id', '=', 'ORD-TEST-HTTP-006')]))
+
+    def test_sale_webhook_amount_mismatch_preflight(self):
+        """Pago sin impuesto: AMOUNT_MISMATCH antes de escribir contacto, factura o log"""
+        payload = self._payload('007', items=self._items(1))
+        payload['payment']['amount'] = 120.00
+        result = self._post(payload)
+
+        self.assertEqual(result['error']['code'], 'AMOUNT_MISMATCH')
+        self.assertFalse(self.env['res.partner'].search([('email', '=', payload['member']['email'])]))
+        self.assertFalse(self.env['relatic.sync.log'].search([('order_id', '=', 'ORD-TEST-HTTP-007')]))
+
+    def test_refunds_webhook_mixed_batch(self):
+        """Lote con factura pagada, abierta, ya reembolsada e inexistente: un resultado por orden"""
+        payment_service = self.env['relatic.payment.service']
+        paid = self._create_invoice('rfpaid')
+        payment_service.register_payment(paid, paid.partner_id, self._payment_data(paid, 'rfpaid'))
+        unpaid = self._create_invoice('rfopen')
+        refunded = self._create_invoice('rfdone')
+        existing_refund = payment_service.create_refund(refunded, 'ORD-TEST-rfdone')
+        self.env.flush_all()
+
+        result = self._post({
+            'meta': {'version': '1.0', 'source': 'membresia-relatic'},
+            'order_ids': ['ORD-TEST-rfpaid', 'ORD-TEST-rfopen', 'ORD-TEST-rfdone', 'ORD-TEST-rfmissing'],
+            'reason': 'Cancelación de evento',
+            'reconcile': True,
+        }, url='/api/relatic/v1/refunds')
+
+        self.assertEqual(result.get('status'), 'success', result)
+        self.env.invalidate_all()
+        self.assertEqual((result['data']['created'], result['data']['errors']), (2, 1))
+        by_order = {row['order_id']: row for row in result['data']['refunds']}
+        self.assertEqual(by_order['ORD-TEST-rfmissing']['error']['code'], 'INVOICE_NOT_FOUND')
+        # Pagada: nota abierta (saldo a favor), no reportada como conciliada
+        self.assertEqual((by_order['ORD-TEST-rfpaid']['already_exists'], by_order['ORD-TEST-rfpaid']['reconciled']),
+                         (False, False))
+        self.assertEqual((by_order['ORD-TEST-rfopen']['already_exists'], by_order['ORD-TEST-rfopen']['reconciled']),
+                         (False, True))
+        self.assertTrue(by_order['ORD-TEST-rfdone']['already_exists'])
+        self.assertEqual(by_order['ORD-TEST-rfdone']['refund_id'], existing_refund.id)
+        self.assertEqual(unpaid.payment_state, 'reversed')
+        self.assertEqual(
+            self.env['account.move'].browse(by_order['ORD-TEST-rfpaid']['refund_id']).payment_state, 'not_paid'
+        )
+
+    def test_refunds_webhook_race(self):
+        """Nota creada en paralelo por otro request: 409 reintentable sin reembolsos a medias"""
+        invoice = self._create_invoice('rfrace')
+        self.env.flush_all()
+        PaymentService = type(self.env['relatic.payment.service'])
+
+        def racing_create_refunds(service, invoices_by_order, reason='', reconcile=False):
+            raise pg_errors.UniqueViolation()
+
+        with patch.object(PaymentService, '_create_refunds', racing_create_refunds):
+            result = self._post({
+                'meta': {'version': '1.0', 'source': 'membresia-relatic'},
+                'order_ids': ['ORD-TEST-rfrace'],
+            }, url='/api/relatic/v1/refunds')
+
+        self.assertEqual(result['error']['code'], 'REFUND_IN_FLIGHT')
+        self.assertTrue(result['retry'])
+        self.env.invalidate_all()
+        self.assertFalse(self.env['account.move'].search_by_relatic_order_ids(
+            ['ORD-TEST-rfrace-REFUND'], move_type='out_refund'
+        ))
+        self.assertEqual(invoice.payment_state, 'not_paid')
+
+    def test_ingest_ndjson_gzip(self):
+        """Ingesta NDJSON comprimida: un resultado por línea, bloques de 2 órdenes y resumen final"""
+        self.env['ir.config_parameter'].sudo().set_param('relatic_integration.ingest_chunk_size', '2')
+        mismatch = self._payload('010')
+        mismatch['payment']['amount'] = 1.0
+        lines = [self._payload('008'), self._payload('009'), mismatch, self._payload('008')]
+        body = ''.join(json.dumps(line, sort_keys=True, separators=(',', ':')) + '\n' for line in lines)
+        body = (body + '{no es json\n').encode('utf-8')
+        signature = hmac.new(HMAC_SECRET.encode('utf-8'), body, hashlib.sha256).hexdigest()
+        self.env.flush_all()
+
+        response = self.url_open(
+            '/api/relatic/v1/ingest',
+            data=gzip.compress(body),
+            headers={
+                'Authorization': f'Bearer {API_KEY}',
+                'Content-Type': 'application/x-ndjson',
+                'Content-Encoding': 'gzip',
+                'X-Relatic-Signature': signature,
+            },
+        )
+
+        self.assertEqual(response.status_code, 200, response.text)
+        results = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual(results[-1]['summary'], {'lines': 5, 'created': 2, 'existing': 1, 'errors': 2})
+        # Procesadas en orden de lock del miembro, emitidas en orden de línea
+        self.assertEqual([result['line'] for result in results[:-1]], [1, 2, 3, 4, 5])
+        by_line = {result['line']: result for result in results[:-1]}
+        self.assertEqual(by_line[1]['status'], 'success')
+        self.assertEqual(by_line[3]['error']['code'], 'AMOUNT_MISMATCH')
+        self.assertTrue(by_line[4]['already_exists'])
+        self.assertEqual(by_line[4]['invoice_id'], by_line[1]['invoice_id'])
+        self.assertEqual(by_line[5]['error']['code'], 'INVALID_PAYLOAD')
+        self.assertTrue(self.env['account.move'].search_by_relatic_order_id('ORD-TEST-HTTP-009'))
+
+    def test_ingest_invalid_signature(self):
+        """Firma inválida: 401 sin procesar ninguna línea"""
+        body = json.dumps(self._payload('011'), sort_keys=True, separators=(',', ':')) + '\n'
+        response = self.url_open(
+            '/api/relatic/v1/ingest',
+            data=body,
+            headers={
+                'Authorization': f'Bearer {API_KEY}',
+                'Content-Type': 'application/x-ndjson',
+                'X-Relatic-Signature': '0' * 64,
+            },
+        )
+
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['error']['code'], 'INVALID_SIGNATURE')
+        self.assertFalse(self.env['account.move'].search_by_relatic_order_id('ORD-TEST-HTTP-011'))
+
+    def test_member_summary_endpoint(self):
+        """Resumen del miembro tras una venta; 404 para un miembro sin facturas"""
+        payload = self._payload('012')
+        self._post(payload)
+        headers = {'Authorization': f'Bearer {API_KEY}'}
+
+        response = self.url_open(f"/api/relatic/v1/member/{payload['member']['email'].upper()}/summary", headers=headers)
+        self.assertEqual(response.status_code, 200, response.text)
+        summary = response.json()['data']
+        self.assertEqual((summary['invoice_count'], summary['open_invoice_count']), (1, 0))
+        self.assertAlmostEqual(summary['total_paid'], payload['payment']['amount'])
+        self.assertAlmostEqual(summary['balance'], 0.0)
+        self.assertEqual(summary['last_payment']['reference'], 'YAPPY-HTTP-012')
+
+        response = self.url_open('/api/relatic/v1/member/nadie@relatic.test/summary', headers=headers)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['error']['code'], 'MEMBER_NOT_FOUND')
+
+    def test_export_orders_keyset_pages(self):
+        """Exportación NDJSON en varias páginas keyset: sin filas repetidas ni saltadas, reanudable y gzip"""
+        SyncLog = self.env['relatic.sync.log']
+        logs = SyncLog
+        for index in range(5):
+            payload = self._payload(f'02{index}')
+            logs |= SyncLog.create_log(order_id=payload['order_id'], payload=payload)
+        # Empates de received_at en los bordes de página: el id desempata
+        SyncLog.flush_model()
+        for log, received_at in zip(logs, ('10:00:00', '10:00:01', '10:00:01', '10:00:02', '10:00:02')):
+            self.env.cr.execute(
+                "UPDATE relatic_sync_log SET received_at = %s WHERE id = %s",
+                (f'2025-03-01 {received_at}', log.id)
+            )
+        SyncLog.invalidate_model(['received_at'])
+        self.env.flush_all()
+        expected = logs.mapped('order_id')
+        url = '/api/relatic/v1/export/orders?date_from=2025-03-01&date_to=2025-03-01'
+        headers = {'Authorization': f'Bearer {API_KEY}', 'Accept-Encoding': 'identity'}
+
+        with patch.object(api_controller, 'EXPORT_PAGE_SIZE', 2), \
+                patch.object(api_controller, 'EXPORT_FETCH_SIZE', 1):
+            response = self.url_open(url, headers=headers)
+            self.assertEqual(response.status_code, 200, response.text)
+            self.assertNotIn('Content-Encoding', response.headers)
+            rows = [json.loads(line) for line in response.text.splitlines()]
+            self.assertEqual([row['order_id'] for row in rows], expected)
+            self.assertEqual([row['sync_log_id'] for row in rows], logs.ids)
+
+            # Reanudar tras la segunda línea, empatada con la tercera
+            cursor = rows[1]
+            response = self.url_open(
+                f"{url}&after_received_at={cursor['received_at']}&after_id={cursor['sync_log_id']}",
+                headers=headers,
+            )
+            self.assertEqual([json.loads(line)['order_id'] for line in response.text.splitlines()], expected[2:])
+
+            response = self.url_open(f'{url}&gzip=1', headers=headers)
+            self.assertEqual(response.headers.get('Content-Encoding'), 'gzip')
+            self.assertEqual([json.loads(line)['order_id'] for line in response.text.splitlines()], expected)
+
+        response = self.url_open(f'{url}&after_id=3', headers=headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error']['code'], 'INVALID_CURSOR')
@@ -16,12 +16,14 @@ import hmac
 import hashlib
 import requests
 from datetime import datetime, date
+from decimal import Decimal, ROUND_HALF_UP
 import sys
 
 
 # Configuración
 ODOO_URL = "https://odoo.relatic.org"  # Cambiar según ambiente
 API_ENDPOINT = f"{ODOO_URL}/api/relatic/v1/sale"
+REFUNDS_ENDPOINT = f"{ODOO_URL}/api/relatic/v1/refunds"
 API_KEY = "CHANGE_THIS_API_KEY_IN_PRODUCTION"  # Cambiar en producción
 HMAC_SECRET = "CHANGE_THIS_SECRET_IN_PRODUCTION"  # Cambiar en producción
 
@@ -77,6 +79,11 @@ class TestRelaticIntegration:
         ).hexdigest()
         return signature
     
+    @staticmethod
+    def round_amount(value):
+        """Redondeo HALF-UP a centavos (igual que Odoo)"""
+        return float(Decimal(repr(value)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
+    
     def create_payload(self, order_id_suffix="", amount=None, items_override=None):
         """Crear payload de prueba estándar"""
         order_id = f"ORD-2026-TEST{order_id_suffix:03d}"
@@ -91,8 +98,12 @@ class TestRelaticIntegration:
             }
         ]
         
-        # Calcular total
-        total = sum(item['qty'] * item['price'] for item in items)
+        # Calcular total con impuestos (redondeo por línea, como la factura)
+        total = sum(
+            self.round_amount(item['qty'] * item['price'])
+            + self.round_amount(item['qty'] * item['price'] * item.get('tax_rate', 7.0) / 100)
+            for item in items
+        )
         if amount is None:
             amount = total
         
@@ -124,7 +135,7 @@ class TestRelaticIntegration:
         }
         return payload
     
-    def send_request(self, payload, headers_override=None):
+    def send_request(self, payload, headers_override=None, endpoint=API_ENDPOINT):
         """Enviar request al endpoint"""
         headers = {
             'Authorization': f'Bearer {API_KEY}',
@@ -137,7 +148,7 @@ class TestRelaticIntegration:
         
         try:
             response = requests.post(
-                API_ENDPOINT,
+                endpoint,
                 json=payload,
                 headers=headers,
                 timeout=30
@@ -339,6 +350,39 @@ class TestRelaticIntegration:
             self.log(f"  Falló con múltiples items. Status: {status}", RED)
             return False
     
+    def test_13_bulk_refunds(self):
+        """Test 13: Reembolsos masivos - Crea notas de crédito y es idempotente"""
+        payload = {
+            "meta": {
+                "version": "1.0",
+                "source": "membresia-relatic",
+                "environment": "test",
+            },
+            "order_ids": ["ORD-2026-TEST001", "ORD-2026-TEST012", "ORD-2026-TEST999"],
+            "reason": "Cancelación de evento",
+            "reconcile": True,
+        }
+        
+        status1, response1 = self.send_request(payload, endpoint=REFUNDS_ENDPOINT)
+        if status1 != 200 or response1.get('status') != 'success':
+            self.log(f"  Reembolsos fallaron. Status: {status1}", RED)
+            return False
+        
+        results = {r['order_id']: r for r in response1['data']['refunds']}
+        if results['ORD-2026-TEST999'].get('error', {}).get('code') != 'INVOICE_NOT_FOUND':
+            self.log("  Orden inexistente no reportada como INVOICE_NOT_FOUND", RED)
+            return False
+        
+        # Segunda vez (debe retornar los mismos reembolsos)
+        status2, response2 = self.send_request(payload, endpoint=REFUNDS_ENDPOINT)
+        refunds2 = [r for r in response2.get('data', {}).get('refunds', []) if r['status'] == 'success']
+        if status2 == 200 and refunds2 and all(r['already_exists'] for r in refunds2):
+            self.log(f"  Reembolsos creados: {[r['refund_number'] for r in refunds2]}", GREEN)
+            return True
+        else:
+            self.log(f"  Idempotencia de reembolsos falló. Status: {status2}", RED)
+            return False
+    
     def run_all_tests(self):
         """Ejecutar todos los tests"""
         self.log("\n" + "="*60, BLUE)
@@ -349,6 +393,7 @@ class TestRelaticIntegration:
         self.test("1. Payload válido", self.test_1_valid_payload)
         self.test("2. Idempotencia", self.test_2_idempotency)
         self.test("12. Múltiples items", self.test_12_multiple_items)
+        self.test("13. Reembolsos masivos", self.test_13_bulk_refunds)
         
         # Tests de validación
         self.test("3. API Key inválida", self.test_3_invalid_api_key)
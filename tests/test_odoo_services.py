@@ -1,250 +1,609 @@
-#!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-Pruebas unitarias de servicios Odoo
+Pruebas de servicios Odoo con presupuesto de consultas SQL
 
-Ejecutar desde Odoo shell:
-    odoo-bin shell -d relatic -c /etc/odoo/odoo.conf
-    >>> exec(open('tests/test_odoo_services.py').read())
+Ejecutar:
+    odoo-bin -d relatic_test -i relatic_integration --test-tags /relatic_integration --stop-after-init
+
+Los presupuestos de consultas (tests/data/query_budgets.json) son techos:
+superarlos hace fallar la prueba. Para registrar los conteos medidos:
+    RELATIC_UPDATE_QUERY_BUDGETS=1 odoo-bin ... --test-tags /relatic_integration
 """
 
-from odoo import api
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest.mock import patch
+
+from psycopg2 import errors as pg_errors
+
+from odoo import SUPERUSER_ID, api, fields, sql_db
 from odoo.exceptions import ValidationError
+from odoo.tests import tagged
+from odoo.tools import config
+
+from ..core.normalization import member_shard
+from .common import RelaticTestCommon
 
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), 'data', 'totals_corpus.json')
 
-class TestOdooServices:
+
+@tagged('post_install', '-at_install')
+class TestOdooServices(RelaticTestCommon):
     """Pruebas de servicios Odoo"""
-    
-    def __init__(self, env):
-        self.env = env
-        self.passed = 0
-        self.failed = 0
-    
-    def log(self, message, status='INFO'):
-        """Log de prueba"""
-        prefix = '✓' if status == 'PASS' else '✗' if status == 'FAIL' else '→'
-        print(f"{prefix} {message}")
-    
-    def test(self, name, func):
-        """Ejecutar test"""
-        print(f"\n{'='*60}")
-        print(f"TEST: {name}")
-        print('='*60)
-        try:
-            result = func()
-            if result:
-                self.passed += 1
-                self.log(f"PASSED: {name}", 'PASS')
-                return True
-            else:
-                self.failed += 1
-                self.log(f"FAILED: {name}", 'FAIL')
-                return False
-        except Exception as e:
-            self.failed += 1
-            self.log(f"ERROR: {name} - {str(e)}", 'FAIL')
-            import traceback
-            traceback.print_exc()
-            return False
-    
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Calentar cachés (categoría RELATIC_MIEMBRO, país, impuestos, secuencias)
+        cls.warmup_invoice = cls.env['relatic.invoice.service'].create_invoice(
+            partner=cls.env['relatic.partner.service'].create_or_update_partner(cls._member_data('warmup')),
+            order_id='ORD-TEST-WARMUP',
+            items=cls._items(5),
+            payment_data={'reference': 'TEST-WARMUP', 'date': '2026-01-20'},
+        )
+
     def test_partner_service_create(self):
-        """Test: Crear contacto nuevo"""
-        partner_service = self.env['relatic.partner.service']
-        member_data = {
-            'email': 'test_create@relatic.test',
-            'name': 'Test Create',
-            'phone': '+507-6123-4567',
-            'vat': '8-123-456',
-            'country_code': 'PA'
-        }
-        
-        partner = partner_service.create_or_update_partner(member_data)
-        
-        if partner and partner.email == 'test_create@relatic.test':
-            self.log(f"Contacto creado: {partner.name} (ID: {partner.id})")
-            return True
-        return False
-    
+        """Crear contacto nuevo"""
+        member_data = self._member_data('create')
+        with self.assertQueryBudget('partner_new'):
+            partner = self.env['relatic.partner.service'].create_or_update_partner(member_data)
+
+        self.assertEqual(partner.email, 'testcreate@relatic.test')
+        self.assertEqual(partner.country_id.code, 'PA')
+        self.assertIn('RELATIC_MIEMBRO', partner.category_id.mapped('name'))
+
     def test_partner_service_update(self):
-        """Test: Actualizar contacto existente"""
-        partner_service = self.env['relatic.partner.service']
-        
-        # Crear primero
-        member_data1 = {
-            'email': 'test_update@relatic.test',
-            'name': 'Test Update Original',
-            'phone': '+507-6123-4567',
-        }
-        partner = partner_service.create_or_update_partner(member_data1)
-        
-        # Actualizar
-        member_data2 = {
-            'email': 'test_update@relatic.test',
-            'name': 'Test Update Modified',
-            'phone': '+507-9999-9999',
-        }
-        partner_updated = partner_service.create_or_update_partner(member_data2)
-        
-        if partner_updated.id == partner.id and partner_updated.name == 'Test Update Modified':
-            self.log(f"Contacto actualizado: {partner_updated.name}")
-            return True
-        return False
-    
-    def test_invoice_service_create(self):
-        """Test: Crear factura"""
-        # Crear contacto primero
+        """Actualizar contacto existente (búsqueda por email sin distinguir mayúsculas)"""
         partner_service = self.env['relatic.partner.service']
-        partner = partner_service.create_or_update_partner({
-            'email': 'test_invoice@relatic.test',
-            'name': 'Test Invoice',
-        })
-        
-        # Crear producto si no existe
-        product = self.env['product.product'].search([('default_code', '=', 'MEMB-ANUAL')], limit=1)
-        if not product:
-            product = self.env['product.product'].create({
-                'name': 'Membresía Anual',
-                'default_code': 'MEMB-ANUAL',
-                'type': 'service',
-                'sale_ok': True,
-            })
-        
-        invoice_service = self.env['relatic.invoice.service']
-        items = [{
-            'sku': 'MEMB-ANUAL',
-            'name': 'Membresía Anual',
-            'qty': 1,
-            'price': 120.00,
-            'tax_rate': 7.0
-        }]
-        payment_data = {
-            'reference': 'TEST-INV-001',
-            'date': '2026-01-20',
-        }
-        
-        invoice = invoice_service.create_invoice(
-            partner=partner,
-            order_id='ORD-TEST-INV-001',
-            items=items,
-            payment_data=payment_data
-        )
-        
-        if invoice and invoice.move_type == 'out_invoice':
-            self.log(f"Factura creada: {invoice.name}")
-            return True
-        return False
-    
+        partner = partner_service.create_or_update_partner(self._member_data('update'))
+
+        member_data = dict(self._member_data('update'), email='TestUpdate@Relatic.test', name='Test Update Modified')
+        with self.assertQueryBudget('partner_existing'):
+            partner_updated = partner_service.create_or_update_partner(member_data)
+
+        self.assertEqual(partner_updated, partner)
+        self.assertEqual(partner_updated.name, 'Test Update Modified')
+
+    def test_partner_service_invalid_email(self):
+        """Email inválido"""
+        with self.assertRaises(ValidationError):
+            self.env['relatic.partner.service'].create_or_update_partner(
+                dict(self._member_data('invalid'), email='no-es-un-email')
+            )
+
+    def test_invoice_service_create_one_item(self):
+        """Crear factura con un item"""
+        partner = self.env['relatic.partner.service'].create_or_update_partner(self._member_data('inv1'))
+        with self.assertQueryBudget('invoice_1_item'):
+            invoice = self.env['relatic.invoice.service'].create_invoice(
+                partner=partner,
+                order_id='ORD-TEST-INV-001',
+                items=self._items(1),
+                payment_data={'reference': 'TEST-INV-001', 'date': '2026-01-20'},
+            )
+
+        self.assertEqual(invoice.move_type, 'out_invoice')
+        self.assertEqual(invoice.state, 'posted')
+        self.assertEqual(invoice.x_relatic_order_id, 'ORD-TEST-INV-001')
+        self.assertAlmostEqual(invoice.amount_total, 128.40)
+
+    def test_invoice_service_create_many_items(self):
+        """Crear factura con 5 items"""
+        partner = self.env['relatic.partner.service'].create_or_update_partner(self._member_data('inv5'))
+        with self.assertQueryBudget('invoice_5_items'):
+            invoice = self.env['relatic.invoice.service'].create_invoice(
+                partner=partner,
+                order_id='ORD-TEST-INV-005',
+                items=self._items(5),
+                payment_data={'reference': 'TEST-INV-005', 'date': '2026-01-20'},
+            )
+
+        self.assertEqual(len(invoice.invoice_line_ids), 5)
+
+    def test_invoice_service_idempotent(self):
+        """La misma orden retorna la factura existente"""
+        invoice = self._create_invoice('idem')
+        self.assertEqual(self._create_invoice('idem'), invoice)
+
     def test_payment_service_register(self):
-        """Test: Registrar pago"""
-        # Crear factura primero
-        partner_service = self.env['relatic.partner.service']
-        partner = partner_service.create_or_update_partner({
-            'email': 'test_payment@relatic.test',
-            'name': 'Test Payment',
-        })
-        
-        product = self.env['product.product'].search([('default_code', '=', 'MEMB-ANUAL')], limit=1)
-        if not product:
-            product = self.env['product.product'].create({
-                'name': 'Membresía Anual',
-                'default_code': 'MEMB-ANUAL',
-                'type': 'service',
-                'sale_ok': True,
-            })
-        
-        invoice_service = self.env['relatic.invoice.service']
-        invoice = invoice_service.create_invoice(
+        """Registrar pago y conciliar en línea"""
+        invoice = self._create_invoice('pay')
+        with self.assertQueryBudget('register_payment'):
+            payment_move = self.env['relatic.payment.service'].register_payment(
+                invoice=invoice,
+                partner=invoice.partner_id,
+                payment_data=self._payment_data(invoice, 'pay'),
+            )
+
+        self.assertEqual(payment_move.move_type, 'entry')
+        self.assertEqual(payment_move.journal_id, self.journal_yappy)
+        self.assertTrue(invoice.currency_id.is_zero(invoice.amount_residual))
+
+    def test_payment_service_amount_mismatch(self):
+        """Monto distinto al pendiente de la factura"""
+        invoice = self._create_invoice('mismatch')
+        payment_data = dict(self._payment_data(invoice, 'mismatch'), amount=1.0)
+        with self.assertRaises(ValidationError):
+            self.env['relatic.payment.service'].register_payment(invoice, invoice.partner_id, payment_data)
+
+    def test_payment_service_create_refund(self):
+        """Crear nota de crédito (idempotente por -REFUND)"""
+        invoice = self._create_invoice('refund')
+        payment_service = self.env['relatic.payment.service']
+        with self.assertQueryBudget('create_refund'):
+            refund = payment_service.create_refund(invoice, 'ORD-TEST-refund', reason='Prueba')
+
+        self.assertEqual(refund.move_type, 'out_refund')
+        self.assertEqual(refund.state, 'posted')
+        self.assertEqual(refund.x_relatic_order_id, 'ORD-TEST-refund-REFUND')
+        self.assertEqual(payment_service.create_refund(invoice, 'ORD-TEST-refund'), refund)
+
+    def test_payment_service_refund_paid_invoice(self):
+        """Con reconcile=True una factura ya pagada recibe su nota abierta, no conciliada"""
+        invoice = self._create_invoice('refundpaid')
+        payment_service = self.env['relatic.payment.service']
+        payment_service.register_payment(invoice, invoice.partner_id, self._payment_data(invoice, 'refundpaid'))
+
+        outcomes = payment_service._create_refunds({'ORD-TEST-refundpaid': invoice}, reconcile=True)
+
+        outcome = outcomes['ORD-TEST-refundpaid']
+        self.assertEqual((outcome['already_exists'], outcome['reconciled']), (False, False))
+        self.assertEqual(outcome['refund'].state, 'posted')
+        self.assertEqual(outcome['refund'].payment_state, 'not_paid')
+        again = payment_service._create_refunds({'ORD-TEST-refundpaid': invoice}, reconcile=True)
+        self.assertTrue(again['ORD-TEST-refundpaid']['already_exists'])
+
+    def test_member_summary_incremental(self):
+        """Factura, pago y reembolso actualizan el resumen igual que el recálculo desde la contabilidad"""
+        paid_invoice = self._create_invoice('summary')
+        partner = paid_invoice.partner_id
+        payment_service = self.env['relatic.payment.service']
+        payment_service.register_payment(paid_invoice, partner, self._payment_data(paid_invoice, 'summary'))
+        open_invoice = self.env['relatic.invoice.service'].create_invoice(
             partner=partner,
-            order_id='ORD-TEST-PAY-001',
-            items=[{
-                'sku': 'MEMB-ANUAL',
-                'name': 'Membresía Anual',
-                'qty': 1,
-                'price': 120.00,
-            }],
-            payment_data={'reference': 'TEST-PAY-001', 'date': '2026-01-20'}
+            order_id='ORD-TEST-summary-2',
+            items=self._items(),
+            payment_data={'reference': 'TEST-summary-2', 'date': '2026-01-21'},
         )
-        
-        # Buscar diario YAPPY
-        journal = self.env['account.journal'].search([
-            ('name', '=', 'YAPPY'),
-            ('type', '=', 'bank')
-        ], limit=1)
-        
-        if not journal:
-            self.log("Diario YAPPY no encontrado. Crear diario para pruebas.")
-            return False
-        
+        Summary = self.env['relatic.member.summary']
+        self.assertEqual(Summary._get_summary('TestSummary@relatic.test')['open_invoice_count'], 1)
+
+        payment_service.create_refunds({'ORD-TEST-summary-2': open_invoice}, reconcile=True)
+
+        summary = Summary._get_summary('testsummary@relatic.test')
+        self.assertEqual(summary['partner_id'], partner.id)
+        self.assertEqual((summary['invoice_count'], summary['open_invoice_count']), (2, 0))
+        self.assertAlmostEqual(summary['total_billed'], 256.80)
+        self.assertAlmostEqual(summary['total_paid'], 128.40)
+        self.assertAlmostEqual(summary['total_refunded'], 128.40)
+        self.assertAlmostEqual(summary['balance'], 0.0)
+        self.assertEqual(summary['last_payment'], {
+            'date': '2026-01-20', 'amount': 128.40, 'reference': 'YAPPY-TEST-summary',
+        })
+
+        # Fila sin movimientos contabilizados: el recálculo la elimina
+        Summary.create({'email': 'ghost-summary@relatic.test'})
+
+        stats = Summary._cron_rebuild(batch_size=1)
+        self.assertEqual(stats['skipped'], 0)
+        self.assertIsNone(Summary._get_summary('ghost-summary@relatic.test'))
+        rebuilt = Summary._get_summary('testsummary@relatic.test')
+        summary.pop('updated_at')
+        rebuilt.pop('updated_at')
+        self.assertEqual(rebuilt, summary)
+
+    def test_payment_aggregate_daily_settlement(self):
+        """Modo agregado: pagos pendientes, un asiento por diario/día, facturas conciliadas y grupos aislados"""
+        self.env['ir.config_parameter'].sudo().set_param('relatic_integration.payment_aggregation', 'True')
         payment_service = self.env['relatic.payment.service']
-        payment_data = {
-            'method': 'YAPPY',
-            'amount': 120.00,
-            'reference': 'YAPPY-TEST-001',
-            'date': '2026-01-20',
-        }
-        
-        payment_move = payment_service.register_payment(
-            invoice=invoice,
-            partner=partner,
-            payment_data=payment_data
+        Aggregate = self.env['relatic.payment.aggregate']
+        invoices = self.env['account.move']
+        for suffix, payment_date in (('agg1', '2026-01-20'), ('agg2', '2026-01-20'), ('agg3', '2026-01-21')):
+            invoice = self._create_invoice(suffix)
+            payment_data = dict(self._payment_data(invoice, suffix), date=payment_date)
+            self.assertFalse(payment_service.register_payment(invoice, invoice.partner_id, payment_data))
+            invoices |= invoice
+
+        aggregates = Aggregate.search([('invoice_id', 'in', invoices.ids)], order='id')
+        self.assertEqual(aggregates.mapped('state'), ['pending'] * 3)
+        self.assertEqual(set(invoices.mapped('payment_state')), {'not_paid'})
+
+        # El grupo del 21 falla (p. ej. diario sin cuenta): el del 20 se contabiliza igual
+        post_settlement = type(Aggregate)._post_settlement
+
+        def failing_post_settlement(records, journal, date):
+            if date == fields.Date.to_date('2026-01-21'):
+                raise ValidationError('Diario sin cuenta de banco')
+            return post_settlement(records, journal, date)
+
+        with patch.object(type(Aggregate), '_post_settlement', failing_post_settlement):
+            moves = Aggregate._cron_post_daily_settlements()
+
+        self.assertEqual(len(moves), 1)
+        bank_lines = moves.line_ids.filtered(lambda line: line.account_id == self.journal_yappy.default_account_id)
+        self.assertEqual(len(bank_lines), 1)
+        self.assertAlmostEqual(bank_lines.debit, sum(invoices[:2].mapped('amount_total')))
+        self.assertEqual(aggregates.mapped('state'), ['posted', 'posted', 'pending'])
+        self.assertTrue(all(invoice.currency_id.is_zero(invoice.amount_residual) for invoice in invoices[:2]))
+        self.assertEqual(invoices[2].payment_state, 'not_paid')
+
+        report = Aggregate.get_ledger_reduction_report()
+        self.assertEqual(report['payments'], 2)
+        self.assertEqual(report['moves_with_aggregation'], 1)
+        self.assertEqual(report['lines_with_aggregation'], 3)
+        self.assertEqual(report['rows_saved'], 2)
+
+        # Siguiente ejecución: el grupo pendiente se liquida
+        self.assertEqual(len(Aggregate._cron_post_daily_settlements()), 1)
+        self.assertEqual(aggregates[2].state, 'posted')
+
+    def test_settlement_import_matching(self):
+        """CSV de liquidación: pago individual y agregado conciliados, duplicado, sin match y monto distinto"""
+        payment_service = self.env['relatic.payment.service']
+        single = self._create_invoice('stl1')
+        payment_service.register_payment(single, single.partner_id, self._payment_data(single, 'stl1'))
+        mismatch = self._create_invoice('stl3')
+        payment_service.register_payment(mismatch, mismatch.partner_id, self._payment_data(mismatch, 'stl3'))
+        self.env['ir.config_parameter'].sudo().set_param('relatic_integration.payment_aggregation', 'True')
+        aggregated = self._create_invoice('stl2')
+        payment_service.register_payment(aggregated, aggregated.partner_id, self._payment_data(aggregated, 'stl2'))
+
+        csv_body = (
+            "reference,amount,date\n"
+            "YAPPY-TEST-stl1,128.40,2026-01-21\n"
+            "YAPPY-TEST-stl2,128.40,2026-01-20\n"
+            "YAPPY-TEST-stl1,128.40,2026-01-21\n"
+            "YAPPY-TEST-missing,50.00,2026-01-20\n"
+            "YAPPY-TEST-stl3,100.00,2026-01-20\n"
+        )
+        settlement = self.env['relatic.settlement.import'].create({
+            'name': 'YAPPY 2026-01-21',
+            'journal_id': self.journal_yappy.id,
+            'date': '2026-01-21',
+        })
+        stats = settlement.import_stream(io.BytesIO(csv_body.encode('utf-8')))
+
+        self.assertEqual((stats['rows'], stats['matched'], stats['unmatched']), (5, 2, 3))
+        self.assertEqual(settlement.state, 'done')
+        # Fila 4: la referencia ya se consumió en la fila 2 (duplicado)
+        self.assertEqual(
+            {line.row_number: line.reason for line in settlement.line_ids},
+            {4: 'not_found', 5: 'not_found', 6: 'amount_mismatch'},
         )
-        
-        if payment_move and payment_move.move_type == 'entry':
-            self.log(f"Pago registrado: {payment_move.name}")
-            # Verificar que la factura esté pagada
-            if invoice.amount_residual == 0:
-                self.log("Factura conciliada correctamente")
-                return True
-        return False
-    
+        payments = self.env['account.move'].search([('x_relatic_invoice_id', 'in', (single | mismatch).ids)])
+        settled = payments.filtered(lambda move: move.x_relatic_invoice_id == single)
+        self.assertEqual(settled.x_relatic_settlement_id, settlement)
+        self.assertFalse((payments - settled).x_relatic_settlement_id)
+        aggregate = self.env['relatic.payment.aggregate'].search([('invoice_id', '=', aggregated.id)])
+        self.assertEqual(aggregate.settlement_id, settlement)
+
+    def test_member_lock_order_serializes_chunks(self):
+        """Dos bloques con los mismos miembros en orden inverso, en conexiones reales: sin deadlock y en serie"""
+        dbname = self.env.cr.dbname
+        emails = [self._member_data(f'lock{index}')['email'] for index in range(3)]
+        partner_service = self.env['relatic.partner.service']
+        self.assertEqual(len({partner_service._member_lock_key(email) for email in emails}), 3)
+        self.assertEqual(partner_service._member_lock_key(''), -1)
+
+        def run_chunks(sort):
+            """Cada bloque toma los locks de sus órdenes y los retiene hasta el final de su transacción"""
+            barrier = threading.Barrier(2)
+            errors, spans = [], []
+
+            def worker(chunk):
+                cr = sql_db.db_connect(dbname).cursor()
+                try:
+                    service = api.Environment(cr, SUPERUSER_ID, {})['relatic.partner.service']
+                    if sort:
+                        chunk = sorted(chunk, key=service._member_lock_key)
+                    barrier.wait(timeout=10)
+                    acquired = None
+                    for email in chunk:
+                        service._lock_member(email)
+                        acquired = acquired or time.monotonic()
+                        time.sleep(0.2)
+                    spans.append((acquired, time.monotonic()))
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    cr.rollback()
+                    cr.close()
+
+            threads = [threading.Thread(target=worker, args=(chunk,)) for chunk in (emails, emails[::-1])]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout=30)
+            return errors, sorted(spans)
+
+        # En el orden del archivo los bloques se esperan en ciclo
+        errors, spans = run_chunks(sort=False)
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0], pg_errors.DeadlockDetected)
+
+        # Ordenados por _member_lock_key: el segundo bloque espera al primero
+        errors, spans = run_chunks(sort=True)
+        self.assertFalse(errors)
+        self.assertEqual(len(spans), 2)
+        self.assertGreaterEqual(spans[1][0], spans[0][1])
+
+    def test_reconcile_service_batch(self):
+        """Conciliación diferida por lotes"""
+        self.env['ir.config_parameter'].sudo().set_param('relatic_integration.reconcile_mode', 'deferred')
+        invoices = self.env['account.move']
+        for index in range(1, 3):
+            invoice = self._create_invoice(f'rec{index}', items=self._items(1, tax_rate=0))
+            self.env['relatic.payment.service'].register_payment(
+                invoice=invoice,
+                partner=invoice.partner_id,
+                payment_data=self._payment_data(invoice, f'rec{index}'),
+            )
+            invoices |= invoice
+
+        self.assertTrue(all(invoice.amount_residual for invoice in invoices),
+                        "Modo diferido no debe conciliar en el webhook")
+        self.env['relatic.reconcile.service']._cron_reconcile_pending()
+        self.assertTrue(all(invoice.currency_id.is_zero(invoice.amount_residual) for invoice in invoices))
+
+    def test_reconcile_service_isolates_failing_pair(self):
+        """Un par que falla se aísla y queda con error; los demás se concilian y salen de la cola"""
+        self.env['ir.config_parameter'].sudo().set_param('relatic_integration.reconcile_mode', 'deferred')
+        invoices = self.env['account.move']
+        for index in range(1, 4):
+            invoice = self._create_invoice(f'recfail{index}', items=self._items(1, tax_rate=0))
+            self.env['relatic.payment.service'].register_payment(
+                invoice=invoice,
+                partner=invoice.partner_id,
+                payment_data=self._payment_data(invoice, f'recfail{index}'),
+            )
+            invoices |= invoice
+        poisoned = invoices[1]
+        payments = self.env['account.move'].search([('x_relatic_invoice_id', 'in', invoices.ids)])
+
+        AccountMoveLine = type(self.env['account.move.line'])
+        reconcile_plan = AccountMoveLine._reconcile_plan
+
+        def failing_reconcile_plan(lines_model, plan):
+            if any(poisoned in lines.move_id for lines in plan):
+                raise ValidationError('Cuenta por cobrar bloqueada')
+            return reconcile_plan(lines_model, plan)
+
+        with patch.object(AccountMoveLine, '_reconcile_plan', failing_reconcile_plan):
+            results = self.env['relatic.reconcile.service']._cron_reconcile_pending()
+
+        self.assertEqual((results[0]['reconciled'], results[0]['failed']), (2, 1))
+        self.assertFalse(any(payments.mapped('x_relatic_reconcile_pending')))
+        failed_payment = payments.filtered(lambda move: move.x_relatic_invoice_id == poisoned)
+        self.assertIn('Cuenta por cobrar bloqueada', failed_payment.x_relatic_reconcile_error)
+        self.assertTrue(poisoned.amount_residual)
+        self.assertTrue(all(invoice.currency_id.is_zero(invoice.amount_residual) for invoice in invoices - poisoned))
+
     def test_sync_log_create(self):
-        """Test: Crear log de sincronización"""
+        """Crear log de sincronización y marcar éxito (modo two_phase)"""
+        payload = {'order_id': 'ORD-TEST-LOG-001', 'meta': {'version': '1.0', 'source': 'test'}}
+        SyncLog = self.env['relatic.sync.log']
+        with self.assertQueryBudget('sync_log_two_phase'):
+            log = SyncLog.create_log(order_id='ORD-TEST-LOG-001', payload=payload, status='pending')
+            log.mark_success(processing_time=1.5)
+
+        self.assertEqual(log.status, 'success')
+        self.assertEqual(log.get_payload(), payload)
+
+        # Reentrega idéntica de la misma entrega: el log existente, sin error
+        # de unicidad y sin retroceder el resultado a pending
+        redelivery = SyncLog.create_log(order_id='ORD-TEST-LOG-001', payload=payload, status='pending')
+        self.assertEqual(redelivery, log)
+        self.assertEqual(redelivery.status, 'success')
+        self.assertEqual(redelivery.processing_time, 1.5)
+
+        # Reintento del origen (X-Relatic-Delivery-Attempt: 2): nueva entrega
+        retry = SyncLog.create_log(order_id='ORD-TEST-LOG-001', payload=payload, attempt=2)
+        self.assertNotEqual(retry, log)
+        self.assertEqual(retry.attempt, 2)
+
+    def test_sync_log_archive_old_logs(self):
+        """La retención archiva en el .jsonl.gz mensual, elimina los logs y conserva payloads compartidos"""
+        SyncLog = self.env['relatic.sync.log']
+        Payload = self.env['relatic.sync.payload']
+        shared = {'order_id': 'ORD-TEST-ARCH-1', 'meta': {'version': '1.0', 'source': 'test'}}
+        own = {'order_id': 'ORD-TEST-ARCH-2', 'meta': {'version': '1.0', 'source': 'test'}}
+        old_shared = SyncLog.create_log(order_id='ORD-TEST-ARCH-1', payload=shared, status='success')
+        recent_shared = SyncLog.create_log(order_id='ORD-TEST-ARCH-1', payload=shared, attempt=2)
+        old_own = SyncLog.create_log(order_id='ORD-TEST-ARCH-2', payload=own, status='error')
+        old_logs = old_shared | old_own
+        own_hash = old_own.payload_hash
+
+        # Envejecer dos logs fuera de la retención
+        SyncLog.flush_model()
+        self.env.cr.execute(
+            "UPDATE relatic_sync_log SET received_at = %s WHERE id = ANY(%s)",
+            ('2024-01-15 10:00:00', old_logs.ids)
+        )
+        SyncLog.invalidate_model(['received_at'])
+
+        with tempfile.TemporaryDirectory() as filestore, \
+                patch.object(config, 'filestore', lambda dbname: filestore):
+            archived = SyncLog._cron_archive_old_logs(retention_days=365)
+            path = os.path.join(filestore, 'relatic_sync_log_archive', 'relatic_sync_log_2024-01.jsonl.gz')
+            with gzip.open(path, 'rt', encoding='utf-8') as archive:
+                rows = {row['id']: row for row in map(json.loads, archive)}
+
+        self.assertEqual(archived, 2)
+        self.assertEqual(set(rows), set(old_logs.ids))
+        self.assertEqual(rows[old_own.id]['order_id'], 'ORD-TEST-ARCH-2')
+        self.assertEqual(rows[old_own.id]['status'], 'error')
+        self.assertEqual(rows[old_own.id]['payload'], own)
+        self.assertEqual(rows[old_shared.id]['payload'], shared)
+
+        # Logs archivados eliminados; el reciente sobrevive con su payload
+        self.assertFalse(old_logs.exists())
+        self.assertTrue(recent_shared.exists())
+        self.assertEqual(recent_shared.get_payload(), shared)
+        self.assertFalse(Payload.search([('payload_hash', '=', own_hash)]))
+
+    def test_replay_worker_shard(self):
+        """Un worker toma con SKIP LOCKED solo su shard, confirma el intento y deja los otros shards"""
+        SyncLog = self.env['relatic.sync.log']
+        # Dos miembros en shards distintos con 2 workers
+        suffixes = {}
+        for index in range(20):
+            suffixes.setdefault(member_shard(self._member_data(f'replay{index}')['email']) % 2, f'replay{index}')
+        logs = SyncLog
+        for shard in (0, 1):
+            items = self._items(1)
+            payload = {
+                'meta': {'version': '1.0', 'source': 'membresia-relatic', 'environment': 'dev'},
+                'order_id': f'ORD-TEST-REPLAY-{shard}',
+                'member': self._member_data(suffixes[shard]),
+                'items': items,
+                'payment': {
+                    'method': 'YAPPY',
+                    'amount': self.env['relatic.sale.service']._preflight_totals(items)['amount_total'],
+                    'reference': f'YAPPY-TEST-REPLAY-{shard}',
+                    'date': '2026-01-20',
+                    'currency': 'PAB',
+                },
+            }
+            log = SyncLog.create_log(order_id=payload['order_id'], payload=payload)
+            log.mark_error('ODOO_ERROR', 'Error interno: could not serialize access', retry=True)
+            logs |= log
+        logs.write({'next_retry_at': fields.Datetime.now() - timedelta(minutes=1)})
+        self.assertEqual([shard % 2 for shard in logs.mapped('member_shard')], [0, 1])
+
+        # Worker 1 de 2, con su propio cursor y un commit por intento
+        self.env.flush_all()
+        claim = {'log_ids': logs.ids, 'statuses': ['retry'], 'ignore_schedule': False, 'shard': (1, 2)}
+        stats = self.env['relatic.replay.service']._replay_worker(
+            self.env.cr.dbname, self.env.context, claim, [10], threading.Lock(),
+        )
+        self.env.invalidate_all()
+
+        self.assertEqual(stats, {'success': 1, 'retry': 0, 'error': 0})
+        self.assertEqual(logs[1].status, 'success')
+        self.assertEqual(logs[1].invoice_id.x_relatic_order_id, 'ORD-TEST-REPLAY-1')
+        self.assertEqual(logs[0].status, 'retry')
+        self.assertFalse(logs[0].invoice_id)
+        # Nada más que tomar en ese shard; el otro shard sigue disponible
+        self.assertFalse(self.env['relatic.replay.service']._claim_next(**claim))
+        self.assertEqual(self.env['relatic.replay.service']._claim_next(**dict(claim, shard=(0, 2))), logs[0])
+
+    def test_error_cluster_incremental_refresh(self):
+        """Mensajes que solo difieren en ids y montos comparten grupo; el refresco incremental solo toca lo nuevo"""
+        Cluster = self.env['relatic.sync.error.cluster']
+        SyncLog = self.env['relatic.sync.log']
+        message = 'Monto {} no coincide con la factura INV/2026/{} de la orden ORD-TEST-CL-{} (partner {})'
+        first = message.format('128.40', '00012', 1, 42)
+        second = message.format('15.00', '00345', 22, 7)
+        self.assertEqual(Cluster._normalize_message(first), Cluster._normalize_message(second))
+        self.assertEqual(
+            Cluster._template_hash('AMOUNT_MISMATCH', first),
+            Cluster._template_hash('AMOUNT_MISMATCH', second),
+        )
+        self.assertNotEqual(
+            Cluster._template_hash('AMOUNT_MISMATCH', first),
+            Cluster._template_hash('VALIDATION_ERROR', first),
+        )
+
+        def payload(index):
+            return {'order_id': f'ORD-TEST-CL-{index}', 'member': self._member_data(f'cl{index}')}
+
+        mismatch = SyncLog.record_error(payload(1), 'AMOUNT_MISMATCH', first)
+        SyncLog.record_error(payload(2), 'AMOUNT_MISMATCH', second)
+        missing = SyncLog.record_error(payload(3), 'INVOICE_NOT_FOUND', 'Factura de la orden ORD-TEST-CL-3 no encontrada')
+        self.assertEqual(Cluster._cron_refresh(), 2)
+        mismatch_cluster = Cluster.search([('template_hash', '=', mismatch.error_template_hash)])
+        missing_cluster = Cluster.search([('template_hash', '=', missing.error_template_hash)])
+        self.assertEqual((mismatch_cluster.log_count, mismatch_cluster.open_count), (2, 2))
+        self.assertEqual(mismatch_cluster.template, Cluster._normalize_message(first))
+        self.assertEqual(missing_cluster.log_count, 1)
+
+        # Simular que esos logs se confirmaron antes de la última ejecución:
+        # todo el test corre en una transacción, con un solo change_txid
+        SyncLog.flush_model()
+        self.env.cr.execute("ALTER TABLE relatic_sync_log DISABLE TRIGGER relatic_sync_log_change_txid")
+        self.env.cr.execute("UPDATE relatic_sync_log SET change_txid = 0 WHERE error_template_hash IS NOT NULL")
+        self.env.cr.execute("ALTER TABLE relatic_sync_log ENABLE TRIGGER relatic_sync_log_change_txid")
+        self.assertEqual(Cluster._cron_refresh(), 0)
+
+        # Un error nuevo: solo se reagrega su grupo
+        SyncLog.record_error(payload(4), 'AMOUNT_MISMATCH', message.format('99.99', '00999', 4, 3))
+        self.assertEqual(Cluster._cron_refresh(), 1)
+        self.assertEqual((mismatch_cluster.log_count, mismatch_cluster.open_count), (3, 3))
+        self.assertEqual(missing_cluster.log_count, 1)
+
+    def test_sync_stats_weighted_average(self):
+        """El promedio agrupado se deriva de total / count, no del promedio de promedios"""
+        Stats = self.env['relatic.sync.stats.daily']
+        Stats.search([]).unlink()
+        Stats.create([
+            {'date': '2026-01-01', 'status': 'success', 'log_count': 100,
+             'processing_time_total': 100.0, 'processing_time_count': 100, 'processing_time_avg': 1.0},
+            {'date': '2026-01-02', 'status': 'success', 'log_count': 1,
+             'processing_time_total': 9.0, 'processing_time_count': 1, 'processing_time_avg': 9.0},
+        ])
+        groups = Stats.read_group([], ['processing_time_avg:avg'], ['status'])
+        self.assertAlmostEqual(groups[0]['processing_time_avg'], 109.0 / 101)
+
+    def test_callback_outbox_dispatch(self):
+        """El log marcado encola su callback y el dispatcher lo entrega firmado"""
+        params = self.env['ir.config_parameter'].sudo()
+        params.set_param('relatic_integration.callback_url', 'http://localhost:8099/callbacks')
+        payload = {'order_id': 'ORD-TEST-CB-001', 'meta': {'version': '1.0', 'source': 'test'}}
+        log = self.env['relatic.sync.log'].create_log(order_id='ORD-TEST-CB-001', payload=payload)
+        log.mark_error('ODOO_ERROR', 'Error interno', retry=True)
+
+        outbox = self.env['relatic.callback.outbox'].search([('sync_log_id', '=', log.id)])
+        self.assertEqual(outbox.event, 'retry')
+        self.assertEqual(json.loads(outbox.body)['error_code'], 'ODOO_ERROR')
+
+        class FakeResponse:
+            status_code = 200
+            text = ''
+
+        with patch('requests.Session.post', return_value=FakeResponse()) as post:
+            stats = self.env['relatic.callback.outbox']._cron_dispatch()
+
+        self.assertEqual(stats['sent'], 1)
+        self.assertEqual(outbox.state, 'sent')
+        self.assertIn('X-Relatic-Signature', post.call_args.kwargs['headers'])
+
+    def test_totals_engine_corpus(self):
+        """El motor de totales coincide con account.move en todo el corpus"""
+        with open(CORPUS_PATH, encoding='utf-8') as corpus_file:
+            corpus = json.load(corpus_file)
+        for rate in corpus['taxes']:
+            if not self.env['relatic.invoice.service']._get_tax(rate):
+                self.env['account.tax'].create({
+                    'name': f'Venta {rate}%',
+                    'amount': rate,
+                    'amount_type': 'percent',
+                    'type_tax_use': 'sale',
+                })
+
+        sale_service = self.env['relatic.sale.service']
+        for case in corpus['cases']:
+            with self.subTest(case=case['name']):
+                totals = sale_service._preflight_totals(case['items'])
+                invoice = self._create_invoice(f"corpus-{case['name']}", items=case['items'])
+                for field, expected in case['expected'].items():
+                    self.assertAlmostEqual(totals[field], expected, places=2, msg=f'motor: {field}')
+                    self.assertAlmostEqual(invoice[field], expected, places=2, msg=f'factura: {field}')
+
+    def test_sale_service_preflight_rejects_before_write(self):
+        """process_order rechaza el pago sin impuesto antes de crear contacto o factura"""
         payload = {
-            'order_id': 'ORD-TEST-LOG-001',
-            'meta': {'version': '1.0', 'source': 'test'}
+            'order_id': 'ORD-TEST-PREFLIGHT',
+            'member': self._member_data('preflight'),
+            'items': self._items(1),
+            'payment': {'method': 'YAPPY', 'amount': 120.00, 'reference': 'TEST-PREFLIGHT', 'date': '2026-01-20'},
         }
-        
-        log = self.env['relatic.sync.log'].create_log(
-            order_id='ORD-TEST-LOG-001',
-            payload=payload,
-            status='pending'
-        )
-        
-        if log and log.order_id == 'ORD-TEST-LOG-001':
-            self.log(f"Log creado: {log.order_id}")
-            
-            # Marcar como exitoso
-            log.mark_success(processing_time=1.5)
-            if log.status == 'success':
-                self.log("Log marcado como exitoso")
-                return True
-        return False
-    
-    def run_all_tests(self):
-        """Ejecutar todos los tests"""
-        print("\n" + "="*60)
-        print("PRUEBAS DE SERVICIOS ODOO")
-        print("="*60)
-        
-        self.test("Partner Service - Crear", self.test_partner_service_create)
-        self.test("Partner Service - Actualizar", self.test_partner_service_update)
-        self.test("Invoice Service - Crear", self.test_invoice_service_create)
-        self.test("Payment Service - Registrar", self.test_payment_service_register)
-        self.test("Sync Log - Crear y marcar éxito", self.test_sync_log_create)
-        
-        print("\n" + "="*60)
-        print("RESUMEN")
-        print("="*60)
-        print(f"Pasados: {self.passed}")
-        print(f"Fallidos: {self.failed}")
-        print("="*60)
-        
-        return self.failed == 0
-
-
-# Ejecutar si se llama directamente desde shell de Odoo
-if __name__ == '__main__':
-    # Esto solo funciona dentro de Odoo shell
-    print("Este script debe ejecutarse desde Odoo shell:")
-    print("odoo-bin shell -d relatic -c /etc/odoo/odoo.conf")
-    print(">>> exec(open('tests/test_odoo_services.py').read())")
+        with self.assertRaises(ValidationError):
+            self.env['relatic.sale.service'].process_order(payload)
+        self.assertFalse(self.env['res.partner'].search([('email', '=', 'testpreflight@relatic.test')]))
+        self.assertFalse(self.env['account.move'].search_by_relatic_order_id('ORD-TEST-PREFLIGHT'))